@@ -0,0 +1,62 @@
+"""黑名单/免检匹配基准测试：逐个子串查找 vs 编译匹配器
+
+用法: python benchmarks/bench_filters.py [--urls 50000] [--extra-patterns 0,100,1000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from url_filter import PatternMatcher  # noqa: E402
+
+
+def generate_urls(patterns, count, seed=0):
+    """生成测试URL，约一成包含黑名单模式（主机或路径中）"""
+    rng = random.Random(seed)
+    urls = []
+    for i in range(count):
+        roll = rng.random()
+        if roll < 0.05:
+            host = rng.choice(patterns)
+            urls.append(f"http://{host}/live/{i}.m3u8")
+        elif roll < 0.1:
+            urls.append(f"http://proxy.example.net/{rng.choice(patterns)}/{i}.m3u8")
+        elif roll < 0.5:
+            urls.append(f"http://[2409:8087:{i % 97:x}::{i % 13:x}]:80/PLTV/88888888/224/{i}/index.m3u8")
+        else:
+            urls.append(f"http://10.{i % 250}.{(i // 250) % 250}.1:8080/hls/{i}/index.m3u8")
+    return urls
+
+
+def timed(func, urls):
+    start = time.perf_counter()
+    result = [func(url) for url in urls]
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--urls", type=int, default=50000)
+    parser.add_argument("--extra-patterns", default="0,100,1000",
+                        help="在 config.url_blacklist 基础上追加的随机模式数量")
+    args = parser.parse_args()
+
+    base = list(config.url_blacklist) + list(config.skip_check_patterns)
+    print(f"{'模式数':>8} {'URL数':>8} {'any(s)':>10} {'编译(s)':>10} {'加速比':>8} {'结果一致':>8}")
+    for extra in (int(n) for n in args.extra_patterns.split(",")):
+        patterns = base + [f"203.0.{i // 250}.{i % 250}:{8000 + i}" for i in range(extra)]
+        urls = generate_urls(patterns, args.urls)
+        matcher = PatternMatcher(patterns)
+        naive, naive_time = timed(lambda url: any(pattern in url for pattern in patterns), urls)
+        compiled, compiled_time = timed(matcher.matches, urls)
+        same = "是" if naive == compiled else "否"
+        print(f"{len(patterns):>8} {len(urls):>8} {naive_time:>10.3f} {compiled_time:>10.3f} "
+              f"{naive_time / max(compiled_time, 1e-9):>7.1f}x {same:>8}")
+
+
+if __name__ == "__main__":
+    main()
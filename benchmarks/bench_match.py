@@ -0,0 +1,152 @@
+"""频道匹配基准测试：原逐对匹配 vs 名称索引匹配（及启用模糊规范化的索引匹配）
+
+用法: python benchmarks/bench_match.py [--sizes 1000,5000,20000,100000] [--legacy-limit 20000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matcher import ChannelIndex, ChannelNormalizer, match_template  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DECORATIONS = ["", "★", "☆ ", "[1]", "【2】", "(高清)", "[备用]", "（测试）", "【HD】"]
+# 模糊规范化的预期结果：(在线名称, 匹配键)
+NORMALIZE_CASES = [
+    ("CCTV-1 综合 高清", "CCTV1"),
+    ("CCTV-1 4K", "CCTV1"),
+    ("CCTV5+ HD", "CCTV5+"),
+    ("CCTV4K", "CCTV4K"),
+    ("CCTV-4K", "CCTV4K"),
+    ("CCTV 4K", "CCTV4K"),
+    ("CCTV-8K", "CCTV8K"),
+    ("CCTV-4K 超高清", "CCTV4K"),
+    ("凤凰卫视 4K", "凤凰卫视"),
+]
+
+
+def load_template(path):
+    """与 IPTVProcessor.parse_template 相同的模板解析"""
+    template_channels = OrderedDict()
+    current_category = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if "#genre#" in line:
+                current_category = line.split(",")[0].strip()
+                template_channels[current_category] = []
+            elif current_category:
+                channel_name = line.split(",")[0].strip()
+                if channel_name:
+                    template_channels[current_category].append(channel_name)
+    return template_channels
+
+
+def generate_channels(template_channels, size, seed=0):
+    """生成指定数量的在线频道，约一半能匹配模板"""
+    rng = random.Random(seed)
+    names = [name for channel_list in template_channels.values() for name in channel_list]
+    all_channels = OrderedDict()
+    for i in range(size):
+        category = f"分类{i % 20}"
+        if rng.random() < 0.5:
+            name = rng.choice(DECORATIONS) + rng.choice(names) + rng.choice(DECORATIONS)
+        else:
+            name = f"频道{rng.randrange(size)}"
+        url = f"http://10.{i % 250}.{(i // 250) % 250}.1/PLTV/{i}/index.m3u8"
+        all_channels.setdefault(category, []).append((name, url))
+    return all_channels
+
+
+def legacy_clean(name):
+    patterns = [
+        r'★\s*', r'☆\s*', r'●\s*', r'○\s*', r'◆\s*', r'◇\s*',
+        r'\[\d+\]', r'【\d+】', r'\(.*?\)', r'\[.*?\]', r'（.*?）', r'【.*?】'
+    ]
+    cleaned = name
+    for pattern in patterns:
+        cleaned = re.sub(pattern, '', cleaned)
+    return cleaned.strip()
+
+
+def legacy_match(template_channels, all_channels):
+    """基线版本（逐对比较模板频道和在线频道）的匹配"""
+    matched_channels = OrderedDict()
+    for category, channel_list in template_channels.items():
+        matched_channels[category] = OrderedDict()
+        for channel_name in channel_list:
+            found = False
+            for online_channel_list in all_channels.values():
+                for online_channel_name, online_channel_url in online_channel_list:
+                    if (channel_name == online_channel_name
+                            or legacy_clean(channel_name) == legacy_clean(online_channel_name)):
+                        matched_channels[category].setdefault(channel_name, []).append(online_channel_url)
+                        found = True
+            if not found:
+                matched_channels[category][channel_name] = []
+    return matched_channels
+
+
+def indexed_match(template_channels, all_channels, normalizer=None):
+    index = ChannelIndex.from_channels(all_channels, normalizer=normalizer)
+    return match_template(template_channels, index)[0]
+
+
+def normalize_mismatches(normalizer):
+    """与 NORMALIZE_CASES 不一致的 [(名称, 预期, 实际)]"""
+    return [(name, expected, normalizer.key(name)) for name, expected in NORMALIZE_CASES
+            if normalizer.key(name) != expected]
+
+
+def url_count(matched_channels):
+    return sum(len(urls) for channel_dict in matched_channels.values() for urls in channel_dict.values())
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--template", default=os.path.join(ROOT, "demo.txt"))
+    parser.add_argument("--sizes", default="1000,5000,20000,100000")
+    parser.add_argument("--legacy-limit", type=int, default=20000,
+                        help="超过该规模时跳过原逐对匹配（耗时过长）")
+    args = parser.parse_args()
+
+    template_channels = load_template(args.template)
+    template_size = sum(len(channel_list) for channel_list in template_channels.values())
+    print(f"模板频道数: {template_size}")
+    normalizer = ChannelNormalizer.from_config({"fuzzy": True, "alias_file": os.path.join(ROOT, "aliases.txt")})
+    mismatches = normalize_mismatches(normalizer)
+    print(f"模糊规范化结果一致: {len(NORMALIZE_CASES) - len(mismatches)}/{len(NORMALIZE_CASES)}")
+    for name, expected, actual in mismatches:
+        print(f"  {name}: 预期 {expected}，实际 {actual}")
+    print(f"{'在线频道数':>10} {'原匹配(s)':>12} {'索引匹配(s)':>12} {'加速比':>8} {'结果一致':>8} "
+          f"{'模糊索引(s)':>12} {'匹配URL数':>10} {'模糊匹配URL数':>12}")
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        all_channels = generate_channels(template_channels, size)
+        indexed, indexed_time = timed(indexed_match, template_channels, all_channels)
+        fuzzy, fuzzy_time = timed(indexed_match, template_channels, all_channels, normalizer=normalizer)
+        fuzzy_columns = f"{fuzzy_time:>12.4f} {url_count(indexed):>10} {url_count(fuzzy):>12}"
+        if size <= args.legacy_limit:
+            legacy, legacy_time = timed(legacy_match, template_channels, all_channels)
+            same = "是" if legacy == indexed else "否"
+            print(f"{size:>10} {legacy_time:>12.3f} {indexed_time:>12.4f} "
+                  f"{legacy_time / max(indexed_time, 1e-9):>8.0f}x {same:>8} {fuzzy_columns}")
+        else:
+            print(f"{size:>10} {'-':>12} {indexed_time:>12.4f} {'-':>8} {'-':>8} {fuzzy_columns}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""端到端基准测试：合成源 + 本地假源站 + 完整的 IPTVProcessor 流程
+
+每个场景在独立子进程中运行（峰值内存互不影响），报告耗时、吞吐量、峰值RSS和各阶段耗时。
+--save-baseline 把结果保存为基线，之后的运行自动与基线对比。
+
+用法: python benchmarks/bench_pipeline.py [--scenarios probe-full,probe-race] [--scale 1.0] [--save-baseline]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_match import load_template  # noqa: E402
+from benchmarks.fake_origin import FakeOrigin, parse_ports  # noqa: E402
+from benchmarks.synthetic import generate_source  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+# 场景：源列表为 (格式, 条目数)，其余为对配置的覆盖
+SCENARIOS = OrderedDict([
+    ("parse-only", {
+        "description": "两个大源的下载、解析和匹配（保持源顺序，不探测）",
+        "sources": [("m3u", 100000), ("txt", 100000)],
+        "preserve_source_order": True,
+    }),
+    ("probe-full", {
+        "description": "完整探测并按响应时间排序",
+        "sources": [("m3u", 2000), ("txt", 2000)],
+        "preserve_source_order": False,
+        "ranking_mode": "full",
+    }),
+    ("probe-race", {
+        "description": "竞速模式探测",
+        "sources": [("m3u", 2000), ("txt", 2000)],
+        "preserve_source_order": False,
+        "ranking_mode": "race",
+    }),
+    ("deep-probe", {
+        "description": "HLS 深度探测（播放列表 + 首个分片吞吐量）",
+        "sources": [("m3u-group", 800)],
+        "preserve_source_order": False,
+        "deep_probe": True,
+    }),
+])
+
+
+def peak_rss_mb():
+    """本进程的峰值常驻内存（MB），不支持的平台返回 None"""
+    # Linux 的 ru_maxrss 会跨 exec 保留父进程的峰值，优先读取 exec 后重新计数的 VmHWM
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_child(spec):
+    """子进程：在临时目录中按场景配置运行 main.main()，输出一行 JSON 结果"""
+    os.chdir(spec["workdir"])
+    import config
+
+    config.source_urls = spec["source_urls"]
+    config.output_format = dict(config.output_format,
+                                preserve_source_order=spec["preserve_source_order"])
+    config.performance_config = dict(config.performance_config,
+                                     link_check_timeout=spec["link_check_timeout"],
+                                     ranking_mode=spec.get("ranking_mode", "full"))
+    config.deep_probe_config = dict(config.deep_probe_config, enabled=spec.get("deep_probe", False),
+                                    time_budget=2)
+    # 缓存和增量状态会让重复运行不可比，基准中全部关闭
+    config.source_cache_config = {"enabled": False}
+    config.probe_cache_config = {"enabled": False}
+    config.incremental_config = {"enabled": False}
+    # EPG 和 Logo 检查会访问外网，基准中关闭
+    config.epg_config = {"enabled": False}
+    config.logo_config = {"enabled": False}
+    config.run_stats_config = {"enabled": True, "json_path": os.path.join("output", "run_stats.json")}
+
+    import main
+
+    start = time.perf_counter()
+    asyncio.run(main.main())
+    wall = time.perf_counter() - start
+    with open(os.path.join("output", "run_stats.json"), "r", encoding="utf-8") as f:
+        stats = json.load(f)
+    print(json.dumps({"wall": wall, "peak_rss_mb": peak_rss_mb(), "stats": stats}))
+
+
+def summarize(name, raw, origin_requests):
+    """从子进程结果中提取场景指标"""
+    stats = raw["stats"]
+    stages = stats["stages"]
+    counters = stats["counters"]
+    fetch_time = stages.get("fetch_channels", 0)
+    probe_time = stages.get("process_channel_links", 0)
+    return OrderedDict([
+        ("scenario", name),
+        ("wall", round(raw["wall"], 3)),
+        ("peak_rss_mb", round(raw["peak_rss_mb"], 1) if raw["peak_rss_mb"] is not None else None),
+        ("stages", stages),
+        ("source_entries", counters.get("source_channels", 0)),
+        ("source_bytes", counters.get("source_bytes", 0)),
+        ("entries_per_sec", round(counters.get("source_channels", 0) / fetch_time) if fetch_time else None),
+        ("probes", counters.get("probes", 0)),
+        ("probes_per_sec", round(counters.get("probes", 0) / probe_time, 1) if probe_time else None),
+        ("probe_timeouts", counters.get("probe_timeouts", 0)),
+        ("probe_failures", counters.get("probe_failures", 0)),
+        ("origin_requests", origin_requests),
+    ])
+
+
+async def run_scenario(name, scenario, args, template_channels):
+    """启动假源站，在子进程中运行一个场景"""
+    origin = FakeOrigin(args.host, parse_ports(args.ports), seed=args.seed)
+    source_urls = []
+    for i, (fmt, entries) in enumerate(scenario["sources"]):
+        entries = max(1, int(entries * args.scale))
+        source_name = f"source{i}.{'txt' if fmt == 'txt' else 'm3u'}"
+        origin.add_source(source_name, generate_source(template_channels, entries, fmt,
+                                                       origin.base_urls, seed=args.seed + i))
+        source_urls.append(origin.source_url(source_name))
+
+    workdir = tempfile.mkdtemp(prefix=f"iptv-bench-{name}-")
+    shutil.copy(args.template, os.path.join(workdir, "demo.txt"))
+    spec = {
+        "workdir": workdir,
+        "source_urls": source_urls,
+        "preserve_source_order": scenario["preserve_source_order"],
+        "ranking_mode": scenario.get("ranking_mode", "full"),
+        "deep_probe": scenario.get("deep_probe", False),
+        "link_check_timeout": args.link_check_timeout,
+    }
+
+    await origin.start()
+    try:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), "--child", json.dumps(spec),
+            stdout=subprocess.PIPE, stderr=None if args.verbose else subprocess.DEVNULL,
+        )
+        stdout, _ = await process.communicate()
+    finally:
+        await origin.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if process.returncode != 0:
+        raise RuntimeError(f"场景 {name} 运行失败（退出码 {process.returncode}），可加 --verbose 查看日志")
+    raw = json.loads(stdout.decode("utf-8").strip().splitlines()[-1])
+    return summarize(name, raw, origin.requests)
+
+
+def change(current, baseline):
+    """相对基线的变化百分比文本"""
+    if current is None or not baseline:
+        return "-"
+    return f"{(current - baseline) / baseline:+.1%}"
+
+
+def print_results(results, baseline):
+    print(f"{'场景':<12} {'耗时(s)':>9} {'基线':>9} {'变化':>8} {'峰值内存(MB)':>13} {'基线':>8} {'变化':>8} "
+          f"{'条目/秒':>10} {'探测/秒':>9}")
+    for result in results:
+        base = baseline.get(result["scenario"], {})
+        print(f"{result['scenario']:<12} {result['wall']:>9.2f} {base.get('wall', '-'):>9} "
+              f"{change(result['wall'], base.get('wall')):>8} {str(result['peak_rss_mb']):>13} "
+              f"{str(base.get('peak_rss_mb', '-')):>8} {change(result['peak_rss_mb'], base.get('peak_rss_mb')):>8} "
+              f"{str(result['entries_per_sec']):>10} {str(result['probes_per_sec']):>9}")
+    print()
+    print("各阶段耗时(s)，括号内为相对基线的变化:")
+    for result in results:
+        base_stages = baseline.get(result["scenario"], {}).get("stages", {})
+        parts = []
+        for stage, seconds in result["stages"].items():
+            delta = change(seconds, base_stages.get(stage))
+            parts.append(f"{stage}={seconds:.3f}" + (f"({delta})" if delta != "-" else ""))
+        print(f"  {result['scenario']}: {', '.join(parts)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="逗号分隔的场景名")
+    parser.add_argument("--scale", type=float, default=1.0, help="源条目数的缩放比例")
+    parser.add_argument("--host", default="127.0.0.2",
+                        help="假源站监听地址（localhost/127.0.0.1 在 config.url_blacklist 中）")
+    parser.add_argument("--ports", default="18800-18807", help="假源站端口，每个端口模拟一个主机")
+    parser.add_argument("--link-check-timeout", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--template", default=os.path.join(ROOT, "demo.txt"))
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--verbose", action="store_true", help="显示子进程日志")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(json.loads(args.child))
+        return
+
+    names = [name for name in args.scenarios.split(",") if name]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}（可选: {', '.join(SCENARIOS)}）")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    template_channels = load_template(args.template)
+    results = []
+    for name in names:
+        print(f"运行场景 {name}: {SCENARIOS[name]['description']}", flush=True)
+        results.append(asyncio.run(run_scenario(name, SCENARIOS[name], args, template_channels)))
+    print()
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        # 只覆盖本次运行的场景，保留其他场景的基线
+        baseline.update({result["scenario"]: result for result in results})
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"scale": args.scale, "saved_at": int(time.time()), "results": baseline},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n基线已保存: {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""输出生成基准测试：原逐条 write 到多个文件句柄 vs 单次遍历的内存缓冲渲染
+
+用法: python benchmarks/bench_render.py [--channels 2000,20000] [--urls-per-channel 10]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from playlist_writer import PlaylistRenderer, PlaylistVariant, write_playlist_files  # noqa: E402
+
+LOGO_BASE = "https://gcore.jsdelivr.net/gh/yuanzl77/TVlogo@master/png/"
+EPG_URLS = ["https://live.fanmingming.com/e.xml"]
+ANNOUNCEMENTS = [{"channel": "公告", "entries": [
+    {"name": "2026-01-01", "url": "https://example.com/notice.mp4", "logo": "https://example.com/logo.png"}]}]
+
+
+def generate_channels(count, urls_per_channel, seed=0):
+    """生成模板和已排序的频道数据"""
+    rng = random.Random(seed)
+    template_channels = OrderedDict()
+    channels = OrderedDict()
+    for i in range(count):
+        category = f"分类{i % 25}"
+        name = f"频道{i}"
+        template_channels.setdefault(category, []).append(name)
+        channels.setdefault(category, OrderedDict())[name] = [
+            f"http://10.{rng.randrange(250)}.{rng.randrange(250)}.1:8080/hls/{i}/{j}/index.m3u8"
+            for j in range(urls_per_channel)
+        ]
+    return template_channels, channels
+
+
+def legacy_write(output_dir, channels, template_channels, max_urls, suffix_enabled):
+    """基线版本 update_channel_urls_m3u 的写法（去掉日志和 config 读取）"""
+    main_m3u_file = os.path.join(output_dir, "live.m3u")
+    main_txt_file = os.path.join(output_dir, "live.txt")
+    processed_m3u_file = os.path.join(output_dir, "live_processed.m3u")
+    processed_txt_file = os.path.join(output_dir, "live_processed.txt")
+    files_to_open = [(main_m3u_file, main_txt_file)]
+    if suffix_enabled:
+        files_to_open.append((processed_m3u_file, processed_txt_file))
+    file_handles = {}
+    for m3u_file, txt_file in files_to_open:
+        file_handles[m3u_file] = open(m3u_file, "w", encoding="utf-8")
+        file_handles[txt_file] = open(txt_file, "w", encoding="utf-8")
+    try:
+        m3u_header = f"""#EXTM3U x-tvg-url="{','.join(EPG_URLS)}"\n"""
+        for m3u_file in file_handles:
+            if m3u_file.endswith('.m3u'):
+                file_handles[m3u_file].write(m3u_header)
+        for group in ANNOUNCEMENTS:
+            group_title = group.get('channel', '公告')
+            for txt_file in file_handles:
+                if txt_file.endswith('.txt'):
+                    file_handles[txt_file].write(f"{group_title},#genre#\n")
+            for announcement in group.get('entries', []):
+                name = announcement.get('name', '')
+                logo = announcement.get('logo', '')
+                url = announcement.get('url', '')
+                announcement_line = f"""#EXTINF:-1 tvg-id="1" tvg-name="{name}" tvg-logo="{logo}" group-title="{group_title}",{name}\n"""
+                for m3u_file in file_handles:
+                    if m3u_file.endswith('.m3u'):
+                        file_handles[m3u_file].write(announcement_line)
+                        file_handles[m3u_file].write(f"{url}\n")
+                for txt_file in file_handles:
+                    if txt_file.endswith('.txt'):
+                        file_handles[txt_file].write(f"{name},{url}\n")
+        written_channels = set()
+        for category, channel_list in template_channels.items():
+            for txt_file in file_handles:
+                if txt_file.endswith('.txt'):
+                    file_handles[txt_file].write(f"{category},#genre#\n")
+            if category in channels:
+                for channel_name in channel_list:
+                    if channel_name in channels[category] and channel_name not in written_channels:
+                        urls = channels[category][channel_name]
+                        if urls:
+                            logo_url = LOGO_BASE + f"{channel_name}.png"
+                            for index, url in enumerate(urls[:max_urls]):
+                                file_handles[main_m3u_file].write(f'#EXTINF:-1 tvg-id="{index+1}" tvg-name="{channel_name}" tvg-logo="{logo_url}" group-title="{category}",{channel_name}\n')
+                                file_handles[main_m3u_file].write(url + "\n")
+                                file_handles[main_txt_file].write(f"{channel_name},{url}\n")
+                                if suffix_enabled:
+                                    new_url = f"{url}$LR•线路{index+1}"
+                                    file_handles[processed_m3u_file].write(f'#EXTINF:-1 tvg-id="{index+1}" tvg-name="{channel_name}" tvg-logo="{logo_url}" group-title="{category}",{channel_name}\n')
+                                    file_handles[processed_m3u_file].write(new_url + "\n")
+                                    file_handles[processed_txt_file].write(f"{channel_name},{new_url}\n")
+                            written_channels.add(channel_name)
+    finally:
+        for f in file_handles.values():
+            f.close()
+
+
+def buffered_write(output_dir, channels, template_channels, max_urls, suffix_enabled, gzip_siblings=False):
+    variants = [PlaylistVariant("live")]
+    if suffix_enabled:
+        variants.append(PlaylistVariant("live_processed", suffix=lambda index, url: f"$LR•线路{index+1}"))
+    renderer = PlaylistRenderer(variants, max_urls, LOGO_BASE, EPG_URLS, ANNOUNCEMENTS)
+    playlists = renderer.render(channels, template_channels, "2026-01-01")
+    write_playlist_files(output_dir, playlists, gzip_siblings=gzip_siblings)
+
+
+def read_all(directory, names):
+    result = {}
+    for name in names:
+        with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+            result[name] = f.read()
+    return result
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--channels", default="2000,20000")
+    parser.add_argument("--urls-per-channel", type=int, default=10)
+    parser.add_argument("--max-urls", type=int, default=10)
+    args = parser.parse_args()
+
+    names = ["live.m3u", "live.txt", "live_processed.m3u", "live_processed.txt"]
+    print(f"{'频道数':>8} {'原写法(s)':>10} {'缓冲(s)':>10} {'加速比':>8} {'缓冲+gz(s)':>11} {'结果一致':>8}")
+    for count in (int(n) for n in args.channels.split(",")):
+        template_channels, channels = generate_channels(count, args.urls_per_channel)
+        with tempfile.TemporaryDirectory() as legacy_dir, tempfile.TemporaryDirectory() as buffered_dir:
+            legacy_time = timed(legacy_write, legacy_dir, channels, template_channels, args.max_urls, True)
+            buffered_time = timed(buffered_write, buffered_dir, channels, template_channels, args.max_urls, True)
+            same = "是" if read_all(legacy_dir, names) == read_all(buffered_dir, names) else "否"
+            gzip_time = timed(buffered_write, buffered_dir, channels, template_channels, args.max_urls, True,
+                              gzip_siblings=True)
+        print(f"{count:>8} {legacy_time:>10.3f} {buffered_time:>10.3f} "
+              f"{legacy_time / max(buffered_time, 1e-9):>7.1f}x {gzip_time:>11.3f} {same:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""频道存储基准测试：原 {分类: [(频道名, URL), ...]} vs 紧凑的 ChannelStore，及进程池解析
+
+用法: python benchmarks/bench_store.py [--entries 100000,500000] [--format m3u-group] [--processes 2]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_match import load_template  # noqa: E402
+from benchmarks.synthetic import generate_source  # noqa: E402
+from channel_store import ChannelStore, parse_source_bytes  # noqa: E402
+from matcher import ChannelIndex, match_template  # noqa: E402
+from source_parser import SourceParser  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASE_URLS = ["http://10.1.0.1:8080", "http://10.2.0.1:8080", "http://[2409:8087::1]:8080"]
+
+
+class LegacySink:
+    """原来的全量结构：{分类: [(频道名, URL), ...]}"""
+
+    def __init__(self):
+        self.channels = OrderedDict()
+
+    def add_category(self, category):
+        self.channels.setdefault(category, [])
+
+    def add(self, category, channel_name, channel_url):
+        self.channels[category].append((channel_name, channel_url))
+
+    def discard(self):
+        self.channels = OrderedDict()
+
+
+def parse_into(sink, text):
+    parser = SourceParser(sink)
+    for line in text.split("\n"):
+        parser.feed(line)
+    parser.close()
+    return sink
+
+
+def measure(build):
+    """返回 (结果, 耗时, 峰值内存, 保留内存)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak, retained
+
+
+def legacy_snapshot_size(channels):
+    """原 jsonl 快照的字节数"""
+    size = 0
+    for category_id, (category, channel_list) in enumerate(channels.items()):
+        size += len(json.dumps(["c", category], ensure_ascii=False).encode("utf-8")) + 1
+        for channel_name, channel_url in channel_list:
+            size += len(json.dumps([category_id, channel_name, channel_url], ensure_ascii=False).encode("utf-8")) + 1
+    return size
+
+
+async def loop_blocking(work):
+    """运行 work() 期间事件循环的最长停顿（10ms 心跳的最大延迟）"""
+    max_lag = 0.0
+    done = asyncio.Event()
+
+    async def heartbeat():
+        nonlocal max_lag
+        loop = asyncio.get_running_loop()
+        while not done.is_set():
+            expected = loop.time() + 0.01
+            await asyncio.sleep(0.01)
+            max_lag = max(max_lag, loop.time() - expected)
+
+    ticker = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - start
+    done.set()
+    await ticker
+    return elapsed, max_lag
+
+
+def mb(value):
+    return value / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", default="100000,500000")
+    parser.add_argument("--format", choices=["m3u", "m3u-group", "txt"], default="m3u-group")
+    parser.add_argument("--template", default=os.path.join(ROOT, "demo.txt"))
+    parser.add_argument("--processes", type=int, default=2)
+    args = parser.parse_args()
+
+    template_channels = load_template(args.template)
+    wanted = {ChannelIndex().normalize(name) for names in template_channels.values() for name in names}
+    pool = ProcessPoolExecutor(max_workers=args.processes, mp_context=multiprocessing.get_context("spawn"))
+    # 预热子进程，不把进程启动时间算进解析耗时
+    pool.submit(parse_source_bytes, b"").result()
+
+    print(f"{'条目数':>8} {'源(MB)':>7} {'原结构峰值':>10} {'原结构保留':>10} {'存储峰值':>8} {'存储保留':>8} "
+          f"{'原解析(s)':>9} {'存储解析(s)':>11} {'jsonl(MB)':>9} {'快照(MB)':>8} {'结果一致':>8}")
+    pool_rows = []
+    for count in (int(n) for n in args.entries.split(",")):
+        text = generate_source(template_channels, count, args.format, BASE_URLS)
+        data = text.encode("utf-8")
+        legacy, legacy_time, legacy_peak, legacy_retained = measure(lambda: parse_into(LegacySink(), text).channels)
+        store, store_time, store_peak, store_retained = measure(lambda: parse_into(ChannelStore(), text))
+        payload = store.to_bytes()
+
+        # 逐条加入索引 vs add_store 批量加入，匹配结果须相同
+        legacy_index = ChannelIndex.from_channels(legacy, wanted)
+        store_index = ChannelIndex(wanted)
+        ChannelStore.from_bytes(payload)[0].replay(store_index.source_sink(0))
+        regrouped = LegacySink()
+        store.replay(regrouped)
+        same = (regrouped.channels == legacy and
+                match_template(template_channels, legacy_index)[0] == match_template(template_channels, store_index)[0])
+        print(f"{count:>8} {mb(len(data)):>7.1f} {mb(legacy_peak):>10.1f} {mb(legacy_retained):>10.1f} "
+              f"{mb(store_peak):>8.1f} {mb(store_retained):>8.1f} {legacy_time:>9.3f} {store_time:>11.3f} "
+              f"{mb(legacy_snapshot_size(legacy)):>9.1f} {mb(len(payload)):>8.1f} {'是' if same else '否':>8}")
+        del legacy, store, legacy_index, store_index, regrouped
+
+        async def inline():
+            index = ChannelIndex(wanted)
+            parse_into(index.source_sink(0), data.decode("utf-8"))
+
+        async def pooled():
+            index = ChannelIndex(wanted)
+            result = await asyncio.get_running_loop().run_in_executor(pool, parse_source_bytes, data)
+            ChannelStore.from_bytes(result)[0].replay(index.source_sink(0))
+
+        inline_time, inline_lag = asyncio.run(loop_blocking(inline))
+        pooled_time, pooled_lag = asyncio.run(loop_blocking(pooled))
+        pool_rows.append((count, inline_time, inline_lag, pooled_time, pooled_lag))
+    pool.shutdown()
+
+    print()
+    print(f"{'条目数':>8} {'事件循环内解析(s)':>16} {'最长阻塞(s)':>11} {'进程池解析(s)':>13} {'最长阻塞(s)':>11}")
+    for count, inline_time, inline_lag, pooled_time, pooled_lag in pool_rows:
+        print(f"{count:>8} {inline_time:>16.3f} {inline_lag:>11.3f} {pooled_time:>13.3f} {pooled_lag:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
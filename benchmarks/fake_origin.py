@@ -0,0 +1,194 @@
+"""本地假 IPTV 源站：提供合成源文件和行为可配置的直播流
+
+每个端口模拟一个独立主机（HostGuard 按 主机:端口 区分）。直播地址中的 stream_id
+通过种子哈希确定行为：正常、慢速、超时（挂起不响应）或 404，同一 stream_id 每次行为相同。
+正常的流返回 HLS 媒体列表，分片按配置的吞吐量限速发送，可用于深度探测。
+
+用法: python benchmarks/fake_origin.py --ports 18800-18807 [--source demo.m3u=/tmp/source.m3u]
+"""
+import argparse
+import asyncio
+import hashlib
+import sys
+
+from aiohttp import web
+
+# 默认行为组合
+DEFAULT_PROFILE = {
+    "ok": 0.7,                     # 正常流的比例
+    "slow": 0.1,                   # 慢速流的比例
+    "timeout": 0.1,                # 挂起不响应的比例
+    "not_found": 0.1,              # 返回 404 的比例
+    "latency": (0.01, 0.15),       # 正常流首字节延迟范围（秒）
+    "slow_latency": (0.3, 0.8),    # 慢速流首字节延迟范围（秒）
+    "throughput": (2e5, 4e6),      # 分片吞吐量范围（字节/秒）
+    "hang": 30,                    # 超时流挂起时长（秒）
+    "segment_bytes": 262144,       # 分片大小
+}
+
+
+class StreamBehavior:
+    """单个 stream_id 的确定性行为"""
+
+    __slots__ = ("kind", "latency", "throughput")
+
+    def __init__(self, kind, latency, throughput):
+        self.kind = kind
+        self.latency = latency
+        self.throughput = throughput
+
+
+def behavior_for(stream_id, profile, seed=0):
+    """根据 stream_id 和种子确定行为"""
+    digest = hashlib.sha1(f"{seed}:{stream_id}".encode("utf-8")).digest()
+    roll = int.from_bytes(digest[:4], "big") / 2 ** 32
+    pick = int.from_bytes(digest[4:8], "big") / 2 ** 32
+    rate = int.from_bytes(digest[8:12], "big") / 2 ** 32
+    low, high = profile["throughput"]
+    throughput = low + (high - low) * rate
+
+    for kind in ("ok", "slow", "timeout"):
+        if roll < profile[kind]:
+            break
+        roll -= profile[kind]
+    else:
+        kind = "not_found"
+    if kind == "slow":
+        low, high = profile["slow_latency"]
+    else:
+        low, high = profile["latency"]
+    return StreamBehavior(kind, low + (high - low) * pick, throughput)
+
+
+class FakeOrigin:
+    """在多个本地端口上运行的假源站"""
+
+    def __init__(self, host="127.0.0.2", ports=(18800,), profile=None, seed=0):
+        self.host = host
+        self.ports = list(ports)
+        self.profile = dict(DEFAULT_PROFILE, **(profile or {}))
+        self.seed = seed
+        self.sources = {}
+        self.requests = 0
+        self.runner = None
+
+    @property
+    def base_urls(self):
+        """每个端口对应的源站地址"""
+        return [f"http://{self.host}:{port}" for port in self.ports]
+
+    def source_url(self, name):
+        """源文件地址（固定在第一个端口）"""
+        return f"{self.base_urls[0]}/sources/{name}"
+
+    def add_source(self, name, text):
+        """登记一个源文件"""
+        body = text.encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        self.sources[name] = (body, etag)
+
+    async def handle_source(self, request):
+        entry = self.sources.get(request.match_info["name"])
+        if entry is None:
+            raise web.HTTPNotFound()
+        body, etag = entry
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(body=body, headers={"ETag": etag},
+                            content_type="application/vnd.apple.mpegurl")
+
+    async def handle_playlist(self, request):
+        self.requests += 1
+        stream_id = request.match_info["stream_id"]
+        behavior = behavior_for(stream_id, self.profile, self.seed)
+        if behavior.kind == "timeout":
+            await asyncio.sleep(self.profile["hang"])
+        await asyncio.sleep(behavior.latency)
+        if behavior.kind == "not_found":
+            raise web.HTTPNotFound()
+        playlist = ("#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:2\n#EXT-X-MEDIA-SEQUENCE:1\n"
+                    f"#EXTINF:2.000,\n/segments/{stream_id}/1.ts\n")
+        return web.Response(text=playlist, content_type="application/vnd.apple.mpegurl")
+
+    async def handle_segment(self, request):
+        self.requests += 1
+        behavior = behavior_for(request.match_info["stream_id"], self.profile, self.seed)
+        response = web.StreamResponse(headers={"Content-Type": "video/mp2t"})
+        response.content_length = self.profile["segment_bytes"]
+        await response.prepare(request)
+        chunk = b"\x47" * 16384
+        remaining = self.profile["segment_bytes"]
+        interval = len(chunk) / behavior.throughput
+        while remaining > 0:
+            size = min(len(chunk), remaining)
+            await response.write(chunk[:size])
+            remaining -= size
+            await asyncio.sleep(interval)
+        await response.write_eof()
+        return response
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get("/sources/{name}", self.handle_source)
+        app.router.add_get("/live/{stream_id}/index.m3u8", self.handle_playlist)
+        app.router.add_get("/segments/{stream_id}/{segment}", self.handle_segment)
+        return app
+
+    async def start(self):
+        """在所有端口上开始监听"""
+        self.runner = web.AppRunner(self.make_app(), access_log=None, shutdown_timeout=0.1)
+        await self.runner.setup()
+        for port in self.ports:
+            await web.TCPSite(self.runner, self.host, port).start()
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+def parse_ports(text):
+    """解析 18800-18807 或 18800,18801 形式的端口列表"""
+    ports = []
+    for part in text.split(","):
+        if "-" in part:
+            start, end = part.split("-")
+            ports.extend(range(int(start), int(end) + 1))
+        elif part:
+            ports.append(int(part))
+    return ports
+
+
+async def serve_forever(origin):
+    await origin.start()
+    print(f"假源站已启动: {', '.join(origin.base_urls)}")
+    for name in origin.sources:
+        print(f"  源文件: {origin.source_url(name)}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await origin.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.2",
+                        help="监听地址（localhost/127.0.0.1 在 config.url_blacklist 中）")
+    parser.add_argument("--ports", default="18800-18807")
+    parser.add_argument("--source", action="append", default=[], help="名称=文件路径，可重复指定")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    origin = FakeOrigin(args.host, parse_ports(args.ports), seed=args.seed)
+    for item in args.source:
+        name, path = item.split("=", 1)
+        with open(path, "r", encoding="utf-8") as f:
+            origin.add_source(name, f.read())
+    try:
+        asyncio.run(serve_forever(origin))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
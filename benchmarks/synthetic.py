@@ -0,0 +1,101 @@
+"""合成直播源生成器：按 FJTELE.m3u / FJCMCC.m3u 的形状生成指定规模的 M3U/TXT 源
+
+用法: python benchmarks/synthetic.py --entries 20000 --format m3u --base-url http://127.0.0.2:18800 -o /tmp/source.m3u
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_match import load_template  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 真实源中常见的名称装饰（清理后仍能匹配模板）
+DECORATIONS = ["", "", "", "-高清", " HD", "[1]", "【备用】"]
+# 模板中不存在的频道名（不会进入探测）
+OTHER_NAMES = ["购物频道", "测试频道", "轮播电影", "地方新闻", "少儿动画", "体育赛事", "戏曲精选"]
+
+
+def stream_url(base_url, stream_id):
+    """伪造的 HLS 直播地址，stream_id 决定假源站上的行为
+
+    不使用 PLTV/88888888 路径：它在 config.skip_check_patterns 中，会跳过探测。
+    """
+    return f"{base_url}/live/{stream_id}/index.m3u8"
+
+
+def generate_entries(template_channels, entries, base_urls, match_ratio=0.7, seed=0):
+    """生成 (分类, 频道名, URL) 列表
+
+    约 match_ratio 的条目使用模板频道名（含常见装饰），其余为模板外的频道；
+    URL 轮流分布在 base_urls 各源站上，stream_id 全局唯一。
+    """
+    rng = random.Random(seed)
+    names = [(category, name) for category, channel_list in template_channels.items() for name in channel_list]
+    result = []
+    for i in range(entries):
+        if rng.random() < match_ratio:
+            category, name = rng.choice(names)
+            name += rng.choice(DECORATIONS)
+        else:
+            category = "其他"
+            name = f"{rng.choice(OTHER_NAMES)}{rng.randrange(100)}"
+        stream_id = 3221225000 + seed * 10000000 + i
+        result.append((category, name, stream_url(base_urls[i % len(base_urls)], stream_id)))
+    return result
+
+
+def render_m3u(entries, group_titles=False):
+    """渲染为 M3U；不带 group-title 时与 FJTELE.m3u 格式相同"""
+    lines = ["#EXTM3U"]
+    for category, name, url in entries:
+        if group_titles:
+            lines.append(f'#EXTINF:-1 group-title="{category}",{name}')
+        else:
+            lines.append(f"#EXTINF:-1 ,{name}")
+        lines.append(url)
+    return "\n".join(lines) + "\n"
+
+
+def render_txt(entries):
+    """渲染为 TXT（分类,#genre# + 频道名,URL），同一分类的条目连续输出"""
+    by_category = {}
+    for category, name, url in entries:
+        by_category.setdefault(category, []).append(f"{name},{url}")
+    lines = []
+    for category, channel_lines in by_category.items():
+        lines.append(f"{category},#genre#")
+        lines.extend(channel_lines)
+    return "\n".join(lines) + "\n"
+
+
+def generate_source(template_channels, entries, fmt, base_urls, seed=0, match_ratio=0.7):
+    """生成一个完整的源文本，fmt 为 m3u、m3u-group 或 txt"""
+    items = generate_entries(template_channels, entries, base_urls, match_ratio, seed)
+    if fmt == "txt":
+        return render_txt(items)
+    return render_m3u(items, group_titles=(fmt == "m3u-group"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--format", choices=["m3u", "m3u-group", "txt"], default="m3u")
+    parser.add_argument("--base-url", action="append", help="源站地址，可重复指定；默认 http://127.0.0.2:18800")
+    parser.add_argument("--template", default=os.path.join(ROOT, "demo.txt"))
+    parser.add_argument("--match-ratio", type=float, default=0.7)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", required=True)
+    args = parser.parse_args()
+
+    text = generate_source(load_template(args.template), args.entries, args.format,
+                           args.base_url or ["http://127.0.0.2:18800"], args.seed, args.match_ratio)
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(text)
+    print(f"已生成 {args.output}: {args.entries} 条, {len(text.encode('utf-8'))} 字节")
+
+
+if __name__ == "__main__":
+    main()
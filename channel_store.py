@@ -0,0 +1,147 @@
+import json
+import struct
+from array import array
+
+from source_parser import SourceParser
+
+MAGIC = b"CHS1"
+# 序列化时各数组的顺序和类型
+ARRAY_FIELDS = (("mark_positions", "I"), ("mark_categories", "I"),
+                ("entry_categories", "I"), ("entry_names", "I"), ("url_ends", "Q"))
+
+
+class ChannelStore:
+    """紧凑的列式频道存储
+
+    分类名和频道名各自去重，条目只保存两个整数序号（array）；所有 URL 按 UTF-8
+    依次存放在同一个 bytearray 中，由 url_ends 记录每个 URL 的结束位置。
+    相比 {分类: [(频道名, URL), ...]}，每个条目不再有独立的 tuple 和 str 对象。
+
+    实现了解析器的 sink 接口（add_category / add / discard），可直接接收 SourceParser
+    的输出；分类首次出现的位置记录在 mark_* 中，replay() 能按原顺序重放给其他 sink。
+    """
+
+    def __init__(self):
+        self.categories = []
+        self.names = []
+        self._category_ids = {}
+        self._name_ids = {}
+        self.mark_positions = array("I")
+        self.mark_categories = array("I")
+        self.entry_categories = array("I")
+        self.entry_names = array("I")
+        self.url_ends = array("Q")
+        self.url_buffer = bytearray()
+
+    def _category_id(self, category):
+        category_id = self._category_ids.get(category)
+        if category_id is None:
+            category_id = len(self.categories)
+            self._category_ids[category] = category_id
+            self.categories.append(category)
+        return category_id
+
+    def add_category(self, category):
+        self.mark_positions.append(len(self.entry_names))
+        self.mark_categories.append(self._category_id(category))
+
+    def add(self, category, channel_name, channel_url):
+        name_id = self._name_ids.get(channel_name)
+        if name_id is None:
+            name_id = len(self.names)
+            self._name_ids[channel_name] = name_id
+            self.names.append(channel_name)
+        self.entry_categories.append(self._category_id(category))
+        self.entry_names.append(name_id)
+        self.url_buffer += channel_url.encode("utf-8")
+        self.url_ends.append(len(self.url_buffer))
+
+    def discard(self):
+        self.__init__()
+
+    def __len__(self):
+        return len(self.entry_names)
+
+    def url(self, index):
+        start = self.url_ends[index - 1] if index else 0
+        return self.url_buffer[start:self.url_ends[index]].decode("utf-8")
+
+    def __iter__(self):
+        """按顺序产出 (分类, 频道名, URL)"""
+        categories, names = self.categories, self.names
+        buffer = self.url_buffer
+        start = 0
+        for category_id, name_id, end in zip(self.entry_categories, self.entry_names, self.url_ends):
+            yield categories[category_id], names[name_id], buffer[start:end].decode("utf-8")
+            start = end
+
+    def replay(self, sink):
+        """按原顺序把分类和条目写入 sink；sink 提供 add_store 时交给它批量处理"""
+        if hasattr(sink, "add_store"):
+            sink.add_store(self)
+            return len(self)
+        marks = iter(zip(self.mark_positions, self.mark_categories))
+        mark = next(marks, None)
+        for position, (category, channel_name, channel_url) in enumerate(self):
+            while mark is not None and mark[0] <= position:
+                sink.add_category(self.categories[mark[1]])
+                mark = next(marks, None)
+            sink.add(category, channel_name, channel_url)
+        while mark is not None:
+            sink.add_category(self.categories[mark[1]])
+            mark = next(marks, None)
+        return len(self)
+
+    def nbytes(self):
+        """主要数据占用的字节数（不含去重后的名称字符串）"""
+        return (len(self.url_buffer) + sum(getattr(self, field).itemsize * len(getattr(self, field))
+                                           for field, _ in ARRAY_FIELDS))
+
+    def to_bytes(self, **meta):
+        """序列化：MAGIC + 头部长度 + JSON 头部（名称表、数组长度、附加信息）+ 各数组 + URL 缓冲区"""
+        header = json.dumps({
+            "categories": self.categories,
+            "names": self.names,
+            "lengths": [len(getattr(self, field)) for field, _ in ARRAY_FIELDS],
+            "meta": meta,
+        }, ensure_ascii=False).encode("utf-8")
+        parts = [MAGIC, struct.pack("<I", len(header)), header]
+        parts.extend(getattr(self, field).tobytes() for field, _ in ARRAY_FIELDS)
+        parts.append(bytes(self.url_buffer))
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """反序列化，返回 (store, 附加信息)；数据损坏时抛出 ValueError"""
+        if data[:4] != MAGIC:
+            raise ValueError("频道存储格式不正确")
+        (header_size,) = struct.unpack_from("<I", data, 4)
+        offset = 8 + header_size
+        header = json.loads(data[8:offset].decode("utf-8"))
+        store = cls()
+        store.categories = header["categories"]
+        store.names = header["names"]
+        store._category_ids = {category: i for i, category in enumerate(store.categories)}
+        store._name_ids = {name: i for i, name in enumerate(store.names)}
+        for (field, typecode), length in zip(ARRAY_FIELDS, header["lengths"]):
+            values = array(typecode)
+            size = values.itemsize * length
+            values.frombytes(data[offset:offset + size])
+            if len(values) != length:
+                raise ValueError("频道存储数据不完整")
+            setattr(store, field, values)
+            offset += size
+        store.url_buffer = bytearray(data[offset:])
+        if store.url_ends and store.url_ends[-1] != len(store.url_buffer):
+            raise ValueError("频道存储数据不完整")
+        return store, header["meta"]
+
+
+def parse_source_bytes(data, encoding="utf-8"):
+    """进程池入口：解析完整的源文件，返回序列化的 ChannelStore（附带格式和分类数）"""
+    store = ChannelStore()
+    parser = SourceParser(store)
+    for line in data.decode(encoding, errors="replace").split("\n"):
+        parser.feed(line)
+    parser.close()
+    return store.to_bytes(source_type=parser.source_type, categories=len(parser.categories))
@@ -0,0 +1,128 @@
+import gzip
+import json
+import logging
+import os
+import time
+
+from channel_store import ChannelStore
+
+logger = logging.getLogger("IPTV_Processor")
+
+# 流水线阶段，按执行顺序
+STAGES = ("fetch", "match", "probe", "render")
+CHECKPOINT_VERSION = 1
+SOURCES_FILE = "fetch.json"
+
+
+class RecordingSink:
+    """把条目转发给 sink 的同时记录到 ChannelStore（fetch 检查点保存未经模板过滤的完整源）"""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.store = ChannelStore()
+
+    def add_category(self, category):
+        self.store.add_category(category)
+        self.sink.add_category(category)
+
+    def add(self, category, channel_name, channel_url):
+        self.store.add(category, channel_name, channel_url)
+        self.sink.add(category, channel_name, channel_url)
+
+    def add_store(self, store):
+        # 缓存回放或进程池解析得到的整块数据，直接记录同一个对象
+        self.store = store
+        store.replay(self.sink)
+
+    def discard(self):
+        self.store = ChannelStore()
+        self.sink.discard()
+
+
+class CheckpointStore:
+    """流水线各阶段的检查点
+
+    - fetch：fetch.json 记录源列表和各源的获取统计，每个源解析出的完整频道保存为 fetch-<序号>.chs；
+    - match：模板和匹配结果 {分类: {频道名: [URL, ...]}}；
+    - probe：模板和排序后的频道；
+    - render：本次写出的文件列表。
+
+    match / probe / render 保存为压缩的 JSON（<阶段>.json.gz）。每个检查点最后写入，
+    下一阶段只读取上一阶段的检查点，可以从任意阶段重新开始运行。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @classmethod
+    def from_config(cls, checkpoint_config, force=False):
+        """根据配置创建检查点存储，未启用时返回 None（force 为 True 时总是创建）"""
+        if not force and not checkpoint_config.get('enabled', False):
+            return None
+        return cls(checkpoint_config.get('dir', os.path.join('output', 'checkpoints')))
+
+    def _write(self, name, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return path
+
+    def source_path(self, source):
+        return os.path.join(self.directory, f"fetch-{source}.chs")
+
+    def save_source(self, source, store):
+        """保存一个源解析出的完整频道（源获取完成后立即写出，不在内存中保留所有源）"""
+        self._write(os.path.basename(self.source_path(source)), store.to_bytes())
+
+    def save_sources(self, source_urls, results):
+        """fetch 阶段完成：写出源列表，results[i] 为第 i 个源的获取统计（失败时为 None）"""
+        return self._write(SOURCES_FILE, json.dumps({
+            "version": CHECKPOINT_VERSION,
+            "created_at": int(time.time()),
+            "sources": [{"url": url, "result": result} for url, result in zip(source_urls, results)],
+        }, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    def load_sources(self):
+        """读取 fetch 检查点，返回 (源列表, 产出 (序号, ChannelStore) 的迭代器)，跳过获取失败的源
+
+        各源的频道在迭代时才逐个读入。
+        """
+        sources = self._load_json(SOURCES_FILE, "fetch")["sources"]
+
+        def stores():
+            for source, entry in enumerate(sources):
+                if entry["result"] is None:
+                    continue
+                with open(self.source_path(source), "rb") as f:
+                    yield source, ChannelStore.from_bytes(f.read())[0]
+
+        return [entry["url"] for entry in sources], stores()
+
+    def save(self, stage, payload):
+        """写出 match / probe / render 阶段的检查点"""
+        data = dict(payload, version=CHECKPOINT_VERSION, stage=stage, created_at=int(time.time()))
+        raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return self._write(f"{stage}.json.gz", gzip.compress(raw, compresslevel=6, mtime=0))
+
+    def load(self, stage):
+        """读取某一阶段的检查点"""
+        return self._load_json(f"{stage}.json.gz", stage)
+
+    def _load_json(self, name, stage):
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"没有 {stage} 阶段的检查点: {path}，请先运行该阶段") from None
+        if name.endswith(".gz"):
+            raw = gzip.decompress(raw)
+        data = json.loads(raw.decode("utf-8"))
+        if data.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"检查点版本不匹配: {path}")
+        logger.info(f"使用 {stage} 阶段检查点: {path}（生成于 "
+                    f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(data.get('created_at', 0)))}）")
+        return data
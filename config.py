@@ -62,9 +62,42 @@ epg_urls = [
     "https://epg.pw/xmltv/epg_TW.xml"
 ]
 
+# EPG 配置（下载 epg_urls，只保留模板中的频道，合并写出一个 epg.xml.gz）
+epg_config = {
+    "enabled": False,    # 需与 public_url 同时设置才会生成 epg.xml.gz（见 README "EPG 节目单"）
+    "output_path": "output/epg.xml.gz",
+    "cache_dir": "output/epg_cache",
+    # epg.xml.gz 的公开地址（如仓库 raw 地址），M3U 头的 x-tvg-url 只引用它；
+    # 为 None 时不生成 epg.xml.gz，M3U 头仍引用上面的 epg_urls
+    "public_url": None,
+    "past_hours": 6,            # 已结束超过该小时数的节目不写出
+    "max_bytes": 268435456,     # 单个源解压后的大小上限
+}
+
+# 频道名称匹配配置
+matching_config = {
+    # 模糊匹配：全角/半角、大小写、分隔符、清晰度后缀（高清/HD/4K）、CCTV 频道描述（如 "CCTV-1 综合"）
+    "fuzzy": True,
+    "alias_file": "aliases.txt",               # 别名表，每行 "模板频道名,别名1,别名2"，文件不存在时忽略
+    "audit_path": "output/match_audit.json",   # 每个模板频道匹配到的在线名称和命中的规则，None 不写出
+}
+
 # 频道Logo基础URL
 logo_base_url = "https://gcore.jsdelivr.net/gh/yuanzl77/TVlogo@master/png/"
 
+# Logo 检查：与探测并发地批量确认 Logo 是否存在，结果写入本地索引，生成播放列表时只读索引
+logo_config = {
+    "enabled": True,
+    "index_path": "output/logo_index.json",
+    "fallback_base_urls": ["https://live.fanmingming.com/tv/"],   # 主地址找不到时依次尝试
+    "ttl": 604800,           # 找到的 Logo 7 天内不再检查
+    "missing_ttl": 86400,    # 确认不存在的 Logo 1 天后重新检查
+    "concurrency": 16,
+    "timeout": 5,
+    "missing": "omit",       # 不存在时："omit" 不写 tvg-logo，"placeholder" 使用下面的地址
+    "placeholder": None,
+}
+
 # 输出文件配置
 output_config = {
     "output_dir": "output",
@@ -74,6 +107,117 @@ output_config = {
 performance_config = {
     "link_check_timeout": 3,
     "max_concurrent_checks": 50,
+    # 排序模式: full 等待所有链接探测完成后排序；
+    # race 凑够 max_urls_per_channel 个可用链接后取消无法胜出的探测（规则见 README）
+    "ranking_mode": "full",
+}
+
+# 按主机的熔断与自适应并发配置
+host_guard_config = {
+    "enabled": True,
+    "failure_threshold": 5,      # 同一主机连续连接失败（拒绝、DNS、连接超时）次数达到后熔断，单个流的读取超时不计入
+    "connect_timeout_ratio": 0.7,  # 连接阶段超时占探测超时的比例，用于区分连接超时和读取超时
+    "initial_concurrency": 4,    # 每个主机的初始并发
+    "min_concurrency": 1,
+    "max_concurrency": 10,       # 每个主机的并发上限（同时作为连接池 limit_per_host）
+    "latency_target": 1.0,       # 响应时间超过该值（秒）时并发减半
+}
+
+# IPv6 线路探测配置（与IPv4分开的并发上限和超时）
+ipv6_config = {
+    "enabled": True,                     # False 时不探测IPv6线路，按源顺序排在可用线路之后
+    "max_concurrent_checks": 10,         # IPv6 探测的并发上限（占用总并发 max_concurrent_checks 的一部分）
+    "link_check_timeout": 2,             # IPv6 探测超时（秒）
+    "reachability_check": True,          # 探测前检查本机是否有IPv6路由，没有则跳过所有IPv6探测
+    "reachability_target": "2400:3200::1",
+}
+
+# HLS 深度探测配置（解析播放列表并下载首个分片测量吞吐量）
+deep_probe_config = {
+    "enabled": False,
+    "max_playlist_bytes": 262144,     # 播放列表最多读取字节数
+    "max_segment_bytes": 1048576,     # 分片最多下载字节数
+    "time_budget": 5,                 # 分片下载时间预算（秒）
+    "reference_bitrate": 4000000,     # 参考码率（bit/s），得分 = 响应时间 + 下载1秒该码率视频所需时间
+}
+
+# 源缓存配置（ETag/Last-Modified 条件请求，304 时复用已解析的频道快照）
+source_cache_config = {
+    "enabled": True,
+    "dir": "output/source_cache",
+    "offline": False,    # 离线运行：不访问网络，只使用已缓存的源
+}
+
+# 阶段检查点（fetch / match / probe / render），可用 python main.py stage <阶段> 从检查点继续运行
+checkpoint_config = {
+    "enabled": False,    # 完整运行时也写出检查点（含未过滤的源快照，体积较大）；stage 命令总是读写检查点
+    "dir": "output/checkpoints",
+}
+
+# 源解析配置：Content-Length 超过阈值的源整体下载后在进程池中解析，不阻塞事件循环
+parse_config = {
+    "process_pool_threshold": 8 * 1024 * 1024,    # 字节，0 表示始终流式解析
+    "processes": 2,
+}
+
+# 增量运行配置（只探测相对上次运行新增的URL）
+incremental_config = {
+    "enabled": False,
+    "state_path": "output/run_state.json",
+    "sample_ratio": 0.1,   # 每次运行滚动抽样复测的已有URL比例
+}
+
+# 探测结果缓存配置（跨运行复用链接检查结果）
+probe_cache_config = {
+    "enabled": True,
+    "path": "output/probe_cache.json",
+    "good_ttl": 86400,   # 可用链接结果有效期（秒）
+    "dead_ttl": 10800,   # 失效链接结果有效期（秒）
+}
+
+# 链接健康记录配置（跨运行的 EWMA 得分，排序使用历史得分而不是单次探测结果）
+health_config = {
+    "enabled": True,
+    "path": "output/health.json",
+    "alpha": 0.2,                # EWMA 权重，越大越看重最近的结果
+    "failure_penalty": 1.0,      # 得分 = 平均响应时间 + (1 - 成功率) * failure_penalty
+    "min_success_rate": 0.2,     # 成功率低于该值视为失效
+    "outlier_clip": 2.0,         # 单次响应时间最多按平均值的该倍数计入
+    "backoff_streak": 3,         # 连续失败达到该次数后降低探测频率
+    "backoff_base": 3600,        # 退避间隔（秒），之后每多失败一次翻倍
+    "backoff_max": 604800,       # 退避间隔上限（秒）
+}
+
+# 分片探测配置（按主机哈希把探测任务分到多个进程，每个进程一个事件循环）
+sharding_config = {
+    "processes": 1,            # 大于1时本地多进程探测，每个进程的并发为 max_concurrent_checks
+    "dir": "output/shards",    # 多机分片（shard-plan / shard-probe / shard-merge）的工作目录
+}
+
+# 运行报告配置（各阶段耗时、字节数、URL数、缓存命中、超时等）
+run_stats_config = {
+    "enabled": True,
+    "json_path": "output/run_stats.json",
+    "prometheus_path": None,   # 例如 "/var/lib/node_exporter/textfile/iptv.prom"
+}
+
+# 批量模式配置（python main.py batch）：多个模板共用一次源获取和链接探测，分别输出
+# output_format 中的项覆盖上面的 output_format（后缀、最大URL数、IP变体、gzip）
+batch_config = {
+    "templates": [
+        {"template": "demo.txt", "output_dir": "output"},
+        {"template": "直播/央视频道.txt", "output_dir": "output/央视频道"},
+        {"template": "直播/ipv6.txt", "output_dir": "output/ipv6",
+         "output_format": {"ip_variants": False}},
+    ],
+}
+
+# 常驻服务配置（python main.py serve）
+serve_config = {
+    "host": "0.0.0.0",
+    "port": 8080,
+    "refresh_interval": 21600,   # 后台刷新间隔（秒）
+    "write_files": True,         # 刷新后同时写出 output/ 下的文件
 }
 
 # 跳过检查的URL模式（已知稳定的源）
@@ -89,6 +233,8 @@ output_format = {
     "suffix_style": "simple",
     "max_urls_per_channel": 10,
     "preserve_source_order": True,
+    "ip_variants": True,         # 额外生成仅IPv4 / 仅IPv6 的 live_ipv4.* 和 live_ipv6.*（live.* 为合并版本）
+    "gzip": False,               # 同时写出 .gz 压缩副本
 }
 
 # 请求配置
@@ -0,0 +1,328 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+import zlib
+from datetime import datetime
+from xml.parsers import expat
+from xml.sax.saxutils import escape, quoteattr
+
+from matcher import clean_channel_name
+from source_cache import SourceCache
+
+logger = logging.getLogger("IPTV_Processor")
+
+INDEX_FILE = "index.json"
+CHUNK_SIZE = 65536
+
+
+def parse_xmltv_time(value):
+    """解析 XMLTV 时间（如 "20261018020000 +0800"），返回时间戳，无法解析时返回 None"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        if len(value) > 14:
+            return datetime.strptime(value[:14] + value[14:].strip(), "%Y%m%d%H%M%S%z").timestamp()
+        return datetime.strptime(value[:14], "%Y%m%d%H%M%S").timestamp()
+    except ValueError:
+        return None
+
+
+class XmltvFilter:
+    """增量解析 XMLTV，只保留模板中的频道的节目
+
+    基于 expat 的事件回调，feed() 接收任意大小的数据块，不构建元素树：
+    不需要的节目在开始标签处就被跳过，只有保留的节目会重新拼成文本，
+    内存只与单个节目的大小有关。频道按 display-name（或 id）的匹配键（key_func）与模板频道名匹配，
+    节目的 channel 属性改写为模板频道名，逐条交给 emit(频道名, 结束时间, XML文本)。
+    节目出现在其频道定义之前时无法匹配（XMLTV 通常先列出所有频道）。
+    """
+
+    def __init__(self, wanted, emit, key_func=clean_channel_name):
+        # wanted: {匹配键: 模板频道名}
+        self.wanted = wanted
+        self.emit = emit
+        self.key_func = key_func
+        self.parser = expat.ParserCreate()
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self._start
+        self.parser.EndElementHandler = self._end
+        self.parser.CharacterDataHandler = self._text
+        self.depth = 0
+        self.channel_map = {}
+        self.channels = set()
+        self.programmes = 0
+        # 当前频道: [id, [display-name...]]；当前保留的节目: (模板频道名, 结束时间, 文本片段)
+        self._channel = None
+        self._names = None
+        self._programme = None
+
+    def feed(self, data):
+        self.parser.Parse(data, False)
+
+    def close(self):
+        self.parser.Parse(b"", True)
+
+    def _start(self, name, attrs):
+        self.depth += 1
+        if self._programme is not None:
+            self._programme[2].append(f"<{name}{self._attrs(attrs)}>")
+        elif self.depth == 2 and name == "programme":
+            template_name = self.channel_map.get(attrs.get("channel"))
+            if template_name is not None:
+                attrs["channel"] = template_name
+                self._programme = (template_name, parse_xmltv_time(attrs.get("stop")),
+                                   [f"<programme{self._attrs(attrs)}>"])
+        elif self.depth == 2 and name == "channel":
+            self._channel = [attrs.get("id"), []]
+        elif self.depth == 3 and name == "display-name" and self._channel is not None:
+            self._names = []
+
+    def _end(self, name):
+        self.depth -= 1
+        if self._programme is not None:
+            parts = self._programme[2]
+            parts.append(f"</{name}>")
+            if self.depth == 1:
+                template_name, stop, _ = self._programme
+                self._programme = None
+                self.programmes += 1
+                self.emit(template_name, stop, "".join(parts))
+        elif self._names is not None and self.depth == 2:
+            self._channel[1].append("".join(self._names))
+            self._names = None
+        elif self._channel is not None and self.depth == 1:
+            self._add_channel(*self._channel)
+            self._channel = None
+
+    def _text(self, data):
+        if self._programme is not None:
+            self._programme[2].append(escape(data))
+        elif self._names is not None:
+            self._names.append(data)
+
+    @staticmethod
+    def _attrs(attrs):
+        return "".join(f" {key}={quoteattr(value)}" for key, value in attrs.items())
+
+    def _add_channel(self, channel_id, names):
+        if not channel_id or channel_id in self.channel_map:
+            return
+        for name in names + [channel_id]:
+            template_name = self.wanted.get(self.key_func(name))
+            # 同一模板频道只取本源中第一个匹配的频道，避免节目重复
+            if template_name is not None and template_name not in self.channels:
+                self.channel_map[channel_id] = template_name
+                self.channels.add(template_name)
+                return
+
+
+class EpgCompiler:
+    """EPG 阶段：下载 epg_urls 中的 XMLTV，只保留模板中的频道，合并写出一个 epg.xml.gz
+
+    每个源流式下载、解压（gzip 传输编码或 .gz 文件）和解析，筛选后的节目逐行写入
+    缓存目录的片段文件 <hash>.jsonl；index.json 记录 ETag / Last-Modified 和模板摘要，
+    源未变化（304）且模板未变时直接复用片段。同一频道出现在多个源中时，
+    按 epg_urls 顺序取第一个提供该频道的源。
+    """
+
+    def __init__(self, output_path, cache_dir, public_url=None, past_hours=6, max_bytes=268435456):
+        self.output_path = output_path
+        self.cache_dir = cache_dir
+        self.public_url = public_url
+        self.past_hours = past_hours
+        self.max_bytes = max_bytes
+        self.index = {}
+        self._load_index()
+
+    @classmethod
+    def from_config(cls, epg_config):
+        """根据配置创建，未启用或未设置 public_url 时返回 None"""
+        if not epg_config.get('enabled', False):
+            return None
+        if not epg_config.get('public_url'):
+            # 没有公开地址时 M3U 头仍引用 epg_urls，生成的文件不会被使用
+            logger.info("EPG 未设置 public_url，跳过生成 epg.xml.gz")
+            return None
+        return cls(
+            epg_config.get('output_path', os.path.join('output', 'epg.xml.gz')),
+            epg_config.get('cache_dir', os.path.join('output', 'epg_cache')),
+            public_url=epg_config.get('public_url'),
+            past_hours=epg_config.get('past_hours', 6),
+            max_bytes=epg_config.get('max_bytes', 268435456),
+        )
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILE), "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+        except FileNotFoundError:
+            self.index = {}
+        except (ValueError, OSError) as e:
+            logger.warning(f"EPG 缓存索引读取失败，将重新下载: {e}")
+            self.index = {}
+
+    def _save_index(self):
+        path = os.path.join(self.cache_dir, INDEX_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+    def fragment_path(self, url):
+        digest = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{digest}.jsonl")
+
+    def header_urls(self, fallback_urls):
+        """M3U 头 x-tvg-url 引用的地址：已生成且配置了公开地址时只引用合并后的文件"""
+        if self.public_url and os.path.exists(self.output_path):
+            return [self.public_url]
+        return list(fallback_urls)
+
+    @staticmethod
+    def wanted_names(template_channels, key_func=clean_channel_name):
+        """{匹配键: 模板频道名}，按模板顺序"""
+        wanted = {}
+        for channel_list in template_channels.values():
+            for name in channel_list:
+                wanted.setdefault(key_func(name), name)
+        return wanted
+
+    async def build(self, session, urls, template_channels, timeout=10, stats=None, key_func=clean_channel_name):
+        """下载并筛选所有源，写出合并后的 epg.xml.gz，返回写入的节目数；没有可用数据时返回 None"""
+        wanted = self.wanted_names(template_channels, key_func)
+        # 匹配键随模板和规范化规则变化，摘要不同时不复用缓存的片段
+        template_digest = hashlib.sha1("\n".join(f"{key}\t{name}" for key, name in wanted.items())
+                                       .encode("utf-8")).hexdigest()[:16]
+        os.makedirs(self.cache_dir, exist_ok=True)
+        results = await asyncio.gather(*(
+            self.fetch(session, url, wanted, template_digest, timeout, stats, key_func) for url in urls
+        ), return_exceptions=True)
+
+        sources = []
+        for url, result in zip(urls, results):
+            if isinstance(result, Exception):
+                logger.error(f"EPG {url} 处理失败: {result}")
+            elif result is not None:
+                sources.append((url, result))
+        self._save_index()
+        if not sources:
+            logger.warning("没有可用的 EPG 数据，保留上一次生成的文件")
+            return None
+        return self.write_output(sources, wanted)
+
+    async def fetch(self, session, url, wanted, template_digest, timeout, stats=None, key_func=clean_channel_name):
+        """获取并筛选一个源，返回其中的模板频道名集合；失败且没有可用旧片段时返回 None"""
+        import aiohttp
+
+        meta = self.index.get(url)
+        if meta is not None and (meta.get("template") != template_digest
+                                 or not os.path.exists(self.fragment_path(url))):
+            meta = None
+        headers = SourceCache.conditional_headers(meta)
+        client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+        path = self.fragment_path(url)
+        tmp_path = f"{path}.tmp"
+        try:
+            async with session.get(url, timeout=client_timeout, headers=headers) as response:
+                if response.status == 304 and meta is not None:
+                    logger.info(f"EPG {url} 未变化，使用缓存（频道 {len(meta['channels'])} 个）")
+                    return set(meta["channels"])
+                response.raise_for_status()
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    def emit(name, stop, xml):
+                        f.write(json.dumps([name, stop, xml], ensure_ascii=False) + "\n")
+                    xmltv = XmltvFilter(wanted, emit, key_func)
+                    received = await self._parse_body(response, xmltv)
+                if stats is not None:
+                    stats.incr("epg_bytes", received)
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+        except (aiohttp.ClientError, asyncio.TimeoutError, expat.ExpatError, zlib.error, ValueError) as e:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            if meta is not None:
+                logger.warning(f"EPG {url} 获取失败，使用旧缓存: {e}")
+                return set(meta["channels"])
+            logger.error(f"EPG {url} 获取失败: {e}")
+            return None
+
+        os.replace(tmp_path, path)
+        self.index[url] = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "template": template_digest,
+            "channels": sorted(xmltv.channels),
+            "programmes": xmltv.programmes,
+            "fetched_at": int(time.time()),
+        }
+        logger.info(f"EPG {url} 解析完成，匹配频道 {len(xmltv.channels)} 个，节目 {xmltv.programmes} 条")
+        return xmltv.channels
+
+    async def _parse_body(self, response, xmltv):
+        """流式解压并解析响应体，返回接收的字节数"""
+        decompressor = None
+        received = 0
+        decoded = 0
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            if received == 0 and chunk[:2] == b"\x1f\x8b":
+                # .gz 文件（不是传输编码，aiohttp 不会自动解压）
+                decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            received += len(chunk)
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            decoded += len(chunk)
+            if decoded > self.max_bytes:
+                raise ValueError(f"EPG 超过大小上限 {self.max_bytes} 字节")
+            xmltv.feed(chunk)
+        if decompressor is not None:
+            xmltv.feed(decompressor.flush())
+        xmltv.close()
+        return received
+
+    def write_output(self, sources, wanted):
+        """按模板顺序写出频道，再按源顺序写出各频道的节目，原子替换 epg.xml.gz"""
+        owners = {}
+        for url, channels in sources:
+            for name in channels:
+                owners.setdefault(name, url)
+        cutoff = time.time() - self.past_hours * 3600
+        directory = os.path.dirname(self.output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.output_path}.tmp"
+        programmes = 0
+        with open(tmp_path, "wb") as raw, \
+                gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=9, mtime=0) as f:
+            f.write(b'<?xml version="1.0" encoding="UTF-8"?>\n<tv generator-info-name="IPTV_Processor">\n')
+            for name in wanted.values():
+                if name in owners:
+                    f.write(f"<channel id={quoteattr(name)}><display-name>{escape(name)}"
+                            f"</display-name></channel>\n".encode("utf-8"))
+            for url, _ in sources:
+                lines = []
+                with open(self.fragment_path(url), "r", encoding="utf-8") as fragment:
+                    for line in fragment:
+                        name, stop, xml = json.loads(line)
+                        # 已结束较久的节目不写出
+                        if owners.get(name) != url or (stop is not None and stop < cutoff):
+                            continue
+                        lines.append(xml)
+                        lines.append("\n")
+                        if len(lines) >= 2048:
+                            f.write("".join(lines).encode("utf-8"))
+                            lines = []
+                        programmes += 1
+                if lines:
+                    f.write("".join(lines).encode("utf-8"))
+            f.write(b"</tv>\n")
+        os.replace(tmp_path, self.output_path)
+        logger.info(f"EPG 已写入: {self.output_path}，频道 {len(owners)} 个，节目 {programmes} 条，"
+                    f"大小 {os.path.getsize(self.output_path)} 字节")
+        return programmes
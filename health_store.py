@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import time
+
+from host_guard import HostGuard
+from url_utils import normalize_url
+
+logger = logging.getLogger("IPTV_Processor")
+
+HEALTH_VERSION = 1
+
+# 记录字段：[平均得分, 成功率, 连续失败次数, 最近成功时间, 最近探测时间, 样本数]
+COST, RATE, STREAK, LAST_SEEN, LAST_PROBED, SAMPLES = range(6)
+
+
+class HealthStore:
+    """跨运行的链接健康记录
+
+    按规范化URL和主机分别保存指数加权平均(EWMA)的得分（普通探测即响应时间）、
+    成功率、连续失败次数和最近成功时间。排序使用历史得分而不是单次探测结果：
+
+        得分 = 平均得分 + (1 - 成功率) * failure_penalty
+
+    URL 样本较少时成功率向所在主机的成功率收缩；成功率低于 min_success_rate
+    或从未成功的URL得分为 inf。单次得分超过平均值 outlier_clip 倍的部分被截去，
+    偶尔一次慢响应不会改变排序。连续失败达到 backoff_streak 次后按指数间隔降低探测频率，
+    在再次探测成功之前得分为 inf。
+    """
+
+    def __init__(self, path, alpha=0.2, failure_penalty=1.0, min_success_rate=0.2, outlier_clip=2.0,
+                 backoff_streak=3, backoff_base=3600, backoff_max=604800,
+                 host_prior=2, retention=2592000):
+        self.path = path
+        self.alpha = alpha
+        self.failure_penalty = failure_penalty
+        self.min_success_rate = min_success_rate
+        self.outlier_clip = outlier_clip
+        self.backoff_streak = backoff_streak
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.host_prior = host_prior
+        self.retention = retention
+        self.urls = {}
+        self.hosts = {}
+        self.backed_off = 0
+
+    @classmethod
+    def from_config(cls, health_config):
+        """根据配置创建，未启用时返回 None"""
+        if not health_config.get('enabled', False):
+            return None
+        store = cls(
+            health_config.get('path', os.path.join('output', 'health.json')),
+            alpha=health_config.get('alpha', 0.2),
+            failure_penalty=health_config.get('failure_penalty', 1.0),
+            min_success_rate=health_config.get('min_success_rate', 0.2),
+            outlier_clip=health_config.get('outlier_clip', 2.0),
+            backoff_streak=health_config.get('backoff_streak', 3),
+            backoff_base=health_config.get('backoff_base', 3600),
+            backoff_max=health_config.get('backoff_max', 604800),
+            host_prior=health_config.get('host_prior', 2),
+            retention=health_config.get('retention', 2592000),
+        )
+        store.load()
+        return store
+
+    def load(self):
+        """读取健康记录，文件缺失或损坏时从空记录开始"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (ValueError, OSError) as e:
+            logger.warning(f"健康记录读取失败，将重新积累: {e}")
+            return
+        if data.get("version") != HEALTH_VERSION:
+            return
+        self.urls = data.get("urls", {})
+        self.hosts = data.get("hosts", {})
+        logger.info(f"健康记录已加载: {self.path}，URL {len(self.urls)} 个，主机 {len(self.hosts)} 个")
+
+    def _update(self, records, key, cost, now):
+        record = records.get(key)
+        success = cost != float('inf')
+        if success:
+            cost = round(cost, 4)
+        if record is None:
+            record = [cost if success else None, 1.0 if success else 0.0, 0, None, now, 0]
+            records[key] = record
+        else:
+            record[RATE] = self.alpha * success + (1 - self.alpha) * record[RATE]
+            if success and record[COST] is None:
+                record[COST] = cost
+            elif success:
+                cost = min(cost, record[COST] * self.outlier_clip)
+                record[COST] = round(self.alpha * cost + (1 - self.alpha) * record[COST], 4)
+        record[STREAK] = 0 if success else record[STREAK] + 1
+        if success:
+            record[LAST_SEEN] = now
+        record[LAST_PROBED] = now
+        record[SAMPLES] += 1
+
+    def record(self, url, cost, now=None):
+        """记录一次探测结果（cost 为本次排序得分，失败为 inf）"""
+        now = int(time.time()) if now is None else int(now)
+        self._update(self.urls, normalize_url(url), cost, now)
+        self._update(self.hosts, HostGuard.host_of(url), cost, now)
+
+    def score(self, url):
+        """按历史记录计算排序得分（越小越好），没有记录时返回 None"""
+        record = self.urls.get(normalize_url(url))
+        if record is None:
+            return None
+        if record[COST] is None or record[STREAK] >= self.backoff_streak:
+            # 从未成功，或连续失败进入退避期：按失效排序
+            return float('inf')
+        rate = record[RATE]
+        host = self.hosts.get(HostGuard.host_of(url))
+        if host is not None and self.host_prior > 0:
+            # 样本少时向主机成功率收缩，单次结果不会大幅改变排序
+            samples = record[SAMPLES]
+            rate = (rate * samples + host[RATE] * self.host_prior) / (samples + self.host_prior)
+        if rate < self.min_success_rate:
+            return float('inf')
+        return record[COST] + (1 - rate) * self.failure_penalty
+
+    def should_probe(self, url, now=None):
+        """连续失败较多的URL按指数间隔探测，间隔未到时返回 False"""
+        record = self.urls.get(normalize_url(url))
+        if record is None or record[STREAK] < self.backoff_streak:
+            return True
+        now = time.time() if now is None else now
+        interval = min(self.backoff_base * 2 ** (record[STREAK] - self.backoff_streak), self.backoff_max)
+        if now - record[LAST_PROBED] >= interval:
+            return True
+        self.backed_off += 1
+        return False
+
+    def save(self):
+        """清理长期未探测的记录后原子写回磁盘"""
+        now = time.time()
+        for records in (self.urls, self.hosts):
+            for key in [key for key, record in records.items() if now - record[LAST_PROBED] > self.retention]:
+                del records[key]
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": HEALTH_VERSION, "urls": self.urls, "hosts": self.hosts}, f,
+                      ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import time
+from urllib.parse import urljoin
+
+from probe_cache import STATUS_CONNECT_ERROR, STATUS_ERROR, STATUS_TIMEOUT
+
+logger = logging.getLogger("IPTV_Processor")
+
+# 最多跟随的播放列表层数（主列表 -> 变体列表 -> 媒体列表）
+MAX_PLAYLIST_DEPTH = 3
+
+
+def is_playlist(response, url):
+    """根据 Content-Type 或扩展名判断是否为 HLS 播放列表"""
+    content_type = response.headers.get("Content-Type", "").lower()
+    return "mpegurl" in content_type or url.split("?")[0].lower().endswith(".m3u8")
+
+
+def parse_extinf_duration(line):
+    """解析 #EXTINF:<时长>, 中的分片时长"""
+    try:
+        return float(line[len("#EXTINF:"):].split(",")[0].strip())
+    except ValueError:
+        return None
+
+
+async def read_playlist(response, max_bytes):
+    """逐行流式读取播放列表，找到第一个URI即停止
+
+    返回 (是否主列表, URI, 分片时长)，读取超过 max_bytes 或没有URI时 URI 为 None。
+    """
+    total = 0
+    is_master = False
+    duration = None
+    while True:
+        try:
+            line = await response.content.readline()
+        except ValueError:
+            # 单行过长，不是正常的播放列表
+            return is_master, None, duration
+        if not line:
+            break
+        total += len(line)
+        if total > max_bytes:
+            break
+        line = line.decode("utf-8", "ignore").strip()
+        if not line:
+            continue
+        if line.startswith("#EXT-X-STREAM-INF"):
+            is_master = True
+        elif line.startswith("#EXTINF:"):
+            duration = parse_extinf_duration(line)
+        elif not line.startswith("#"):
+            return is_master, line, duration
+    return is_master, None, duration
+
+
+async def measure_body(response, started, max_bytes, time_budget):
+    """在字节和时间预算内读取响应体，返回吞吐量（字节/秒）"""
+    received = 0
+    while received < max_bytes and time.monotonic() - started < time_budget:
+        chunk = await response.content.read(min(65536, max_bytes - received))
+        if not chunk:
+            break
+        received += len(chunk)
+    elapsed = max(time.monotonic() - started, 1e-6)
+    return received / elapsed
+
+
+def connect_errors():
+    """连接阶段的异常：拒绝连接、DNS 解析失败，以及 aiohttp 3.10 起单独区分的连接超时"""
+    import aiohttp
+
+    errors = (aiohttp.ClientConnectorError,)
+    if hasattr(aiohttp, "ConnectionTimeoutError"):
+        errors += (aiohttp.ConnectionTimeoutError,)
+    return errors
+
+
+async def deep_probe(session, url, timeout, options):
+    """深度探测：解析 HLS 播放列表并下载首个分片测量持续吞吐量
+
+    返回 {"latency": 首个响应耗时, "status": 状态, "throughput": 字节/秒,
+    "segment_duration": 分片时长}，失败时 latency 为 inf。
+    非 HLS 的直连流直接在响应体上测量吞吐量。
+    """
+    max_playlist_bytes = options.get("max_playlist_bytes", 262144)
+    max_segment_bytes = options.get("max_segment_bytes", 1048576)
+    time_budget = options.get("time_budget", 5)
+
+    result = {"latency": float("inf"), "status": STATUS_ERROR,
+              "throughput": None, "segment_duration": None}
+    from aiohttp import ClientTimeout
+
+    # 连接和单次读取受 timeout 约束，吞吐量测量额外占用 time_budget
+    request_timeout = ClientTimeout(total=timeout + time_budget, sock_connect=timeout, sock_read=timeout)
+    target = url
+    latency = None
+
+    try:
+        for _ in range(MAX_PLAYLIST_DEPTH):
+            started = time.monotonic()
+            async with session.get(target, timeout=request_timeout, allow_redirects=True) as response:
+                if latency is None:
+                    latency = time.monotonic() - started
+                result["status"] = response.status
+                if response.status != 200:
+                    return result
+
+                if not is_playlist(response, target):
+                    # 直连流（TS/FLV等）：直接测量响应体吞吐量
+                    result["throughput"] = await measure_body(response, started, max_segment_bytes, time_budget)
+                    result["latency"] = latency
+                    return result
+
+                is_master, uri, duration = await read_playlist(response, max_playlist_bytes)
+                if uri is None:
+                    logger.debug(f"播放列表中未找到分片: {target}")
+                    return result
+                if duration is not None:
+                    result["segment_duration"] = duration
+                target = urljoin(str(response.url), uri)
+                if not is_master:
+                    break
+        else:
+            logger.debug(f"播放列表嵌套过深: {url}")
+            return result
+
+        # 下载首个媒体分片
+        started = time.monotonic()
+        async with session.get(target, timeout=request_timeout, allow_redirects=True) as response:
+            if response.status != 200:
+                result["status"] = response.status
+                return result
+            result["throughput"] = await measure_body(response, started, max_segment_bytes, time_budget)
+            result["latency"] = latency
+            return result
+
+    except connect_errors() as e:
+        logger.debug(f"深度探测连接失败 {target}: {e}")
+        result["status"] = STATUS_CONNECT_ERROR
+        return result
+    except asyncio.TimeoutError:
+        logger.debug(f"深度探测超时: {target}")
+        result["status"] = STATUS_TIMEOUT
+        return result
+    except Exception as e:
+        logger.debug(f"深度探测失败 {target}: {e}")
+        result["status"] = STATUS_ERROR
+        return result
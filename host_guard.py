@@ -0,0 +1,117 @@
+import logging
+from urllib.parse import urlsplit
+
+logger = logging.getLogger("IPTV_Processor")
+
+
+class HostGuard:
+    """按主机的熔断器与自适应并发控制
+
+    - 熔断：同一主机连续 failure_threshold 次连接失败（拒绝连接、DNS 解析失败、连接超时）后熔断，
+      该主机剩余的URL不再发起请求，直接判定失效；连接成功后的读取超时或出错只说明单个流失效，
+      不计入熔断，也不影响并发上限；
+    - 自适应并发（AIMD）：每个主机的并发上限在成功且响应时间低于
+      latency_target 时缓慢增加（每轮 +1），连接失败或过慢时减半；
+    - 计数：记录被熔断跳过的探测数和被熔断的主机。
+    """
+
+    def __init__(self, failure_threshold=5, initial_concurrency=4, min_concurrency=1,
+                 max_concurrency=10, latency_target=1.0):
+        self.failure_threshold = failure_threshold
+        self.initial_concurrency = initial_concurrency
+        # 下限至少为 1：并发上限为 0 的主机不会再释放名额，挂起的任务永远无法继续
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.hosts = {}
+        self.short_circuited = 0
+        self.deferred = 0
+        self.tripped = []
+
+    @classmethod
+    def from_config(cls, guard_config):
+        """根据配置创建，未启用时返回 None"""
+        if not guard_config.get('enabled', False):
+            return None
+        return cls(
+            failure_threshold=guard_config.get('failure_threshold', 5),
+            initial_concurrency=guard_config.get('initial_concurrency', 4),
+            min_concurrency=guard_config.get('min_concurrency', 1),
+            max_concurrency=guard_config.get('max_concurrency', 10),
+            latency_target=guard_config.get('latency_target', 1.0),
+        )
+
+    @staticmethod
+    def host_of(url):
+        """提取主机标识（主机名:端口）"""
+        try:
+            parts = urlsplit(url)
+            return f"{parts.hostname}:{parts.port or ''}"
+        except ValueError:
+            return url
+
+    def _state(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            state = {"limit": float(self.initial_concurrency), "in_flight": 0,
+                     "failures": 0, "open": False}
+            self.hosts[host] = state
+        return state
+
+    def is_open(self, host):
+        """主机是否已熔断"""
+        state = self.hosts.get(host)
+        return state is not None and state["open"]
+
+    def short_circuit(self, host):
+        """记录一次被熔断跳过的探测"""
+        self.short_circuited += 1
+
+    def try_acquire(self, host):
+        """尝试占用主机的一个并发名额，已满时返回 False"""
+        state = self._state(host)
+        if state["in_flight"] >= max(self.min_concurrency, int(state["limit"])):
+            self.deferred += 1
+            return False
+        state["in_flight"] += 1
+        return True
+
+    def available(self, host):
+        """主机当前空闲的并发名额数"""
+        state = self._state(host)
+        return max(self.min_concurrency, int(state["limit"])) - state["in_flight"]
+
+    def release(self, host, latency=None, failed=None, connect_failed=False):
+        """释放名额并根据结果调整并发和熔断状态
+
+        failed 为 None 表示探测被取消，只释放名额不计入统计；
+        failed 为 True 但不是连接失败（connect_failed）时同样只释放名额。
+        """
+        state = self._state(host)
+        state["in_flight"] -= 1
+
+        if failed is not None:
+            if failed:
+                if not connect_failed:
+                    return
+                state["failures"] += 1
+                state["limit"] = max(float(self.min_concurrency), state["limit"] / 2)
+                if state["failures"] >= self.failure_threshold and not state["open"]:
+                    state["open"] = True
+                    self.tripped.append(host)
+                    logger.info(f"主机连续失败 {state['failures']} 次，已熔断: {host}")
+            else:
+                state["failures"] = 0
+                if latency is not None and latency > self.latency_target:
+                    state["limit"] = max(float(self.min_concurrency), state["limit"] / 2)
+                else:
+                    state["limit"] = min(float(self.max_concurrency), state["limit"] + 1 / state["limit"])
+
+    def summary(self):
+        """统计摘要"""
+        return {
+            "hosts": len(self.hosts),
+            "tripped_hosts": len(self.tripped),
+            "short_circuited": self.short_circuited,
+            "deferred": self.deferred,
+        }
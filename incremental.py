@@ -0,0 +1,126 @@
+import json
+import logging
+import math
+import os
+
+logger = logging.getLogger("IPTV_Processor")
+
+STATE_VERSION = 1
+
+
+class IncrementalState:
+    """增量运行状态
+
+    保存上一次运行的匹配结果 {分类: {频道: [URL, ...]}} 和每个URL的排序得分。
+    本次运行只探测新增的URL，以及按滚动游标抽取的一部分已有URL，
+    其余URL直接沿用上次的得分。匹配结果和抽样结果都没有变化时，
+    排序结果与上次完全一致。
+    """
+
+    def __init__(self, path, sample_ratio=0.1):
+        self.path = path
+        self.sample_ratio = sample_ratio
+        self.matched = {}
+        self.qualities = {}
+        self.cursor = 0
+        self.loaded = False
+        self.reusable = {}
+        self.skipped = 0
+        self.stats = {}
+
+    @classmethod
+    def from_config(cls, incremental_config):
+        """根据配置创建，未启用时返回 None"""
+        if not incremental_config.get('enabled', False):
+            return None
+        state = cls(
+            incremental_config.get('state_path', os.path.join('output', 'run_state.json')),
+            sample_ratio=incremental_config.get('sample_ratio', 0.1),
+        )
+        state.load()
+        return state
+
+    def load(self):
+        """读取上次运行状态，没有状态时本次按完整运行处理"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (ValueError, OSError) as e:
+            logger.warning(f"增量状态读取失败，本次完整探测: {e}")
+            return
+        if data.get("version") != STATE_VERSION:
+            return
+        self.matched = data.get("matched", {})
+        self.qualities = data.get("qualities", {})
+        self.cursor = data.get("cursor", 0)
+        self.loaded = True
+
+    def plan(self, channel_links):
+        """对比上次的匹配结果，确定本次可以沿用得分的URL"""
+        added = removed = 0
+        for category, channel_dict in channel_links.items():
+            previous_channels = self.matched.get(category, {})
+            for channel_name, urls in channel_dict.items():
+                previous = set(previous_channels.get(channel_name, []))
+                current = set(urls)
+                added += len(current - previous)
+                removed += len(previous - current)
+        for category, previous_channels in self.matched.items():
+            for channel_name, urls in previous_channels.items():
+                if channel_name not in channel_links.get(category, {}):
+                    removed += len(set(urls))
+
+        current_urls = {url for channel_dict in channel_links.values()
+                        for urls in channel_dict.values() for url in urls}
+        known = sorted(url for url in current_urls if url in self.qualities)
+
+        # 滚动抽样：每次从游标处取一段已有URL重新探测
+        sample = set()
+        if known and self.sample_ratio > 0:
+            size = min(len(known), math.ceil(len(known) * self.sample_ratio))
+            start = self.cursor % len(known)
+            sample = {known[(start + i) % len(known)] for i in range(size)}
+            self.cursor = (start + size) % len(known)
+
+        self.reusable = {}
+        self.skipped = 0
+        for url in known:
+            if url not in sample:
+                quality = self.qualities[url]
+                self.reusable[url] = float('inf') if quality is None else quality
+        self.stats = {"added": added, "removed": removed, "unchanged": len(known),
+                      "sampled": len(sample), "reused": len(self.reusable)}
+        logger.info(f"增量运行: 新增URL {added} 个，移除 {removed} 个，沿用 {len(self.reusable)} 个，"
+                    f"抽样复测 {len(sample)} 个")
+
+    def lookup(self, url):
+        """返回沿用的得分，需要探测时返回 None"""
+        quality = self.reusable.get(url)
+        if quality is not None:
+            self.skipped += 1
+        return quality
+
+    def save(self, channel_links, qualities):
+        """保存本次匹配结果和得分，供下次运行对比"""
+        self.stats["skipped_probes"] = self.skipped
+        data = {
+            "version": STATE_VERSION,
+            "cursor": self.cursor,
+            "matched": channel_links,
+            "qualities": {url: (None if quality == float('inf') else quality)
+                          for url, quality in qualities.items()},
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        # 常驻模式下下一轮直接与本轮对比
+        self.matched = data["matched"]
+        self.qualities = data["qualities"]
+        self.loaded = True
+        logger.info(f"增量运行: 跳过 {self.skipped} 次探测")
@@ -0,0 +1,32 @@
+import logging
+import re
+import socket
+
+logger = logging.getLogger("IPTV_Processor")
+
+IPV6_URL_PATTERN = re.compile(r'^https?://\[[0-9a-fA-F:]+\]')
+
+# 调度器中 IPv6 探测使用的并发通道名
+IPV6_LANE = "ipv6"
+
+
+def is_ipv6_url(url):
+    """URL 的主机是否为 IPv6 地址字面量"""
+    return IPV6_URL_PATTERN.match(url) is not None
+
+
+def ipv6_reachable(target="2400:3200::1", port=53):
+    """本机是否有到公网 IPv6 地址的路由
+
+    UDP connect 只查路由表、不发送数据，没有 IPv6 的主机会立即失败，
+    不需要等待任何超时。
+    """
+    if not socket.has_ipv6:
+        return False
+    try:
+        with socket.socket(socket.AF_INET6, socket.SOCK_DGRAM) as sock:
+            sock.connect((target, port))
+    except OSError as e:
+        logger.debug(f"IPv6 路由检查失败: {e}")
+        return False
+    return True
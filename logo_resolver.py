@@ -0,0 +1,191 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from matcher import SEPARATOR_PATTERN, clean_channel_name
+
+logger = logging.getLogger("IPTV_Processor")
+
+LOGO_VERSION = 1
+# 判定 Logo 不存在的状态码；其余失败（超时、5xx、429 等）视为未知，下次运行重试
+MISSING_STATUSES = (404, 410)
+
+
+class LogoResolver:
+    """频道 Logo 解析：批量检查后写入带有效期的本地索引
+
+    每个频道依次尝试各个 Logo 地址（logo_base_url 及 fallback_base_urls）下的名称变体
+    （原名、去掉分隔符、匹配键、大写），用 HEAD 请求确认文件存在，取第一个存在的地址。
+    所有频道一次并发解析，请求数受 concurrency 限制，相同的地址只请求一次。
+
+    索引记录 {频道名: [Logo地址|None, 检查时间]}：找到的地址 ttl 秒内、确认不存在的
+    missing_ttl 秒内不再检查，生成播放列表时只读索引，不访问网络。
+    确认不存在的 Logo 按 missing 处理："omit" 不写 tvg-logo，"placeholder" 使用 placeholder 地址；
+    从未成功检查过的频道沿用 logo_base_url + 频道名.png。
+    """
+
+    def __init__(self, path, base_urls, ttl=604800, missing_ttl=86400, concurrency=16, timeout=5,
+                 missing="omit", placeholder=None):
+        self.path = path
+        self.base_urls = list(base_urls)
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.missing = missing
+        self.placeholder = placeholder
+        self.logos = {}
+
+    @classmethod
+    def from_config(cls, logo_config, logo_base_url):
+        """根据配置创建，未启用时返回 None"""
+        if not logo_config.get('enabled', False):
+            return None
+        base_urls = [logo_base_url] + [url for url in logo_config.get('fallback_base_urls', [])
+                                       if url != logo_base_url]
+        resolver = cls(
+            logo_config.get('index_path', os.path.join('output', 'logo_index.json')),
+            base_urls,
+            ttl=logo_config.get('ttl', 604800),
+            missing_ttl=logo_config.get('missing_ttl', 86400),
+            concurrency=logo_config.get('concurrency', 16),
+            timeout=logo_config.get('timeout', 5),
+            missing=logo_config.get('missing', 'omit'),
+            placeholder=logo_config.get('placeholder'),
+        )
+        resolver.load()
+        return resolver
+
+    def load(self):
+        """读取索引；Logo 地址列表变化后旧索引作废"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (ValueError, OSError) as e:
+            logger.warning(f"Logo 索引读取失败，将重新检查: {e}")
+            return
+        if data.get("version") != LOGO_VERSION or data.get("base_urls") != self.base_urls:
+            return
+        self.logos = data.get("logos", {})
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": LOGO_VERSION, "base_urls": self.base_urls, "logos": self.logos},
+                      f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    def default_logo(self, channel_name):
+        """未经检查时使用的地址（原有的拼接方式）"""
+        return f"{self.base_urls[0]}{channel_name}.png"
+
+    @staticmethod
+    def name_variants(channel_name, key_func=clean_channel_name):
+        """Logo 文件名的候选：原名、去掉分隔符、匹配键、大写，按顺序去重"""
+        variants = []
+        compact = SEPARATOR_PATTERN.sub("", channel_name)
+        for name in (channel_name, compact, key_func(channel_name), compact.upper()):
+            if name and name not in variants:
+                variants.append(name)
+        return variants
+
+    def candidates(self, channel_name, key_func=clean_channel_name):
+        """按优先级排列的候选地址：先主地址下的各个变体，再依次尝试备用地址"""
+        variants = self.name_variants(channel_name, key_func)
+        return [f"{base_url}{name}.png" for base_url in self.base_urls for name in variants]
+
+    def is_fresh(self, channel_name, now):
+        entry = self.logos.get(channel_name)
+        if entry is None:
+            return False
+        ttl = self.ttl if entry[0] else self.missing_ttl
+        return now - entry[1] < ttl
+
+    async def resolve(self, session, channel_names, key_func=clean_channel_name, stats=None):
+        """检查索引中缺失或过期的频道，更新并保存索引，返回检查的频道数"""
+        now = time.time()
+        pending = [name for name in dict.fromkeys(channel_names) if not self.is_fresh(name, now)]
+        if not pending:
+            logger.info(f"Logo 索引有效，共 {len(self.logos)} 个频道，本次不检查")
+            return 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+        requests = {}
+
+        def exists(url):
+            # 不同频道的候选地址可能相同，同一地址只请求一次
+            task = requests.get(url)
+            if task is None:
+                task = asyncio.ensure_future(self._exists(session, url, semaphore))
+                requests[url] = task
+            return task
+
+        async def resolve_one(channel_name):
+            confirmed = True
+            for url in self.candidates(channel_name, key_func):
+                found = await exists(url)
+                if found:
+                    return channel_name, url
+                if found is None:
+                    confirmed = False
+            # 有候选地址检查失败时不能确认缺失，保留旧记录，下次运行再检查
+            return channel_name, None if confirmed else False
+
+        results = await asyncio.gather(*(resolve_one(name) for name in pending))
+        found = missing = unknown = 0
+        for channel_name, url in results:
+            if url is False:
+                unknown += 1
+                continue
+            self.logos[channel_name] = [url, int(now)]
+            if url:
+                found += 1
+            else:
+                missing += 1
+        logger.info(f"Logo 检查完成: {len(pending)} 个频道，请求 {len(requests)} 次，"
+                    f"找到 {found} 个，不存在 {missing} 个，未能确认 {unknown} 个")
+        if stats is not None:
+            stats.incr("logo_requests", len(requests))
+            stats.incr("logos_found", found)
+            stats.incr("logos_missing", missing)
+        self.save()
+        return len(pending)
+
+    async def _exists(self, session, url, semaphore):
+        """地址是否存在：True / False（404、410），无法确认时返回 None"""
+        import aiohttp
+
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with semaphore:
+            try:
+                async with session.head(url, timeout=timeout, allow_redirects=True) as response:
+                    status = response.status
+                if status == 405:
+                    # 不支持 HEAD 的服务器只取第一个字节
+                    async with session.get(url, timeout=timeout, headers={"Range": "bytes=0-0"}) as response:
+                        status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.debug(f"Logo 检查失败 {url}: {e}")
+                return None
+        if 200 <= status < 300:
+            return True
+        if status in MISSING_STATUSES:
+            return False
+        return None
+
+    def logo_for(self, channel_name):
+        """生成播放列表时使用的 Logo 地址，返回 None 表示不写 tvg-logo"""
+        entry = self.logos.get(channel_name)
+        if entry is None:
+            return self.default_logo(channel_name)
+        if entry[0]:
+            return entry[0]
+        if self.missing == "placeholder":
+            return self.placeholder
+        return None
@@ -1,30 +1,50 @@
-import re
-import requests
+import json
 import logging
 from collections import OrderedDict
 from datetime import datetime
 import config
 import time
-import concurrent.futures
-from concurrent.futures import ThreadPoolExecutor
-import aiohttp
 import asyncio
-from aiohttp import ClientTimeout, TCPConnector
 import os
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from urllib.parse import urlparse
-import backoff
-
-# 日志配置
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
-    handlers=[
-        logging.FileHandler("function.log", "w", encoding="utf-8"),
-        logging.StreamHandler()
-    ]
-)
+from matcher import ChannelIndex, ChannelNormalizer, match_template
+from probe_cache import ProbeCache, STATUS_CONNECT_ERROR, STATUS_ERROR, STATUS_TIMEOUT
+from scheduler import ProbeScheduler
+from host_guard import HostGuard
+from hls_probe import connect_errors, deep_probe
+from source_parser import SourceParser, iter_lines
+from source_cache import SourceCache
+from channel_store import ChannelStore, parse_source_bytes
+from checkpoint import STAGES, CheckpointStore, RecordingSink
+from incremental import IncrementalState
+from health_store import HealthStore
+from epg import EpgCompiler
+from logo_resolver import LogoResolver
+from url_filter import UrlFilter
+from url_utils import dedupe_urls, normalize_url
+from ip_family import IPV6_LANE, ipv6_reachable, is_ipv6_url
+from run_stats import RunStats, write_atomic
+from playlist_writer import PlaylistRenderer, PlaylistVariant, write_playlist_files
+import sharding
+
 logger = logging.getLogger("IPTV_Processor")
 
+def setup_logging():
+    """日志配置（在程序入口调用；分片子进程导入本模块时不会清空 function.log）"""
+    if logging.getLogger().handlers:
+        return
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+        handlers=[
+            logging.FileHandler("function.log", "w", encoding="utf-8"),
+            logging.StreamHandler()
+        ]
+    )
+
 class IPTVProcessor:
     def __init__(self, template_file="demo.txt"):
         self.template_file = template_file
@@ -33,8 +53,16 @@ class IPTVProcessor:
         self.max_workers = getattr(config, 'max_workers', 50)
         self.link_check_timeout = getattr(config, 'performance_config', {}).get('link_check_timeout', 3)
         self.max_concurrent_checks = getattr(config, 'performance_config', {}).get('max_concurrent_checks', 50)
+        self.ranking_mode = getattr(config, 'performance_config', {}).get('ranking_mode', 'full')
         self.skip_check_patterns = getattr(config, 'skip_check_patterns', [])
         
+        # 黑名单和免检模式在启动时编译一次
+        self.url_filter = UrlFilter(getattr(config, 'url_blacklist', []), self.skip_check_patterns)
+        
+        # 频道名称规范化（模糊规则和别名表）在启动时编译一次
+        self.matching_config = getattr(config, 'matching_config', {})
+        self.normalizer = ChannelNormalizer.from_config(self.matching_config)
+        
         # 输出格式配置
         self.output_config = getattr(config, 'output_format', {})
         self.include_original = self.output_config.get('include_original', True)
@@ -42,6 +70,63 @@ class IPTVProcessor:
         self.suffix_style = self.output_config.get('suffix_style', 'simple')
         self.max_urls_per_channel = self.output_config.get('max_urls_per_channel', 3)
         self.preserve_source_order = self.output_config.get('preserve_source_order', True)
+        self.ip_variants = self.output_config.get('ip_variants', False)
+        self.gzip_output = self.output_config.get('gzip', False)
+        
+        # 按主机的熔断与自适应并发配置
+        self.host_guard_config = getattr(config, 'host_guard_config', {})
+        
+        # IPv6 线路单独的并发和超时；本机没有IPv6路由时跳过探测
+        self.ipv6_config = getattr(config, 'ipv6_config', {})
+        self.ipv6_probe_enabled = None
+        
+        # HLS 深度探测配置
+        self.deep_probe_config = getattr(config, 'deep_probe_config', {})
+        self.deep_probe_enabled = self.deep_probe_config.get('enabled', False)
+        
+        # 超大源在进程池中解析（按 Content-Length 判断），进程池首次使用时创建
+        self.parse_config = getattr(config, 'parse_config', {})
+        self.parse_pool = None
+        
+        # 源缓存（条件请求 + 已解析快照）
+        self.source_cache = SourceCache.from_config(getattr(config, 'source_cache_config', {}))
+        
+        # 增量运行状态
+        self.incremental_state = IncrementalState.from_config(getattr(config, 'incremental_config', {}))
+        
+        # 探测结果缓存
+        self.probe_cache = ProbeCache.from_config(getattr(config, 'probe_cache_config', {}))
+        
+        # 跨运行的链接健康记录（EWMA），启用后按历史得分排序
+        self.health = HealthStore.from_config(getattr(config, 'health_config', {}))
+        
+        # 分片探测：按主机哈希拆分到多个进程（或多台机器）
+        self.sharding_config = getattr(config, 'sharding_config', {})
+        self.shard_processes = self.sharding_config.get('processes', 1)
+        self.shard_results = None
+        
+        # EPG：只保留模板频道的节目，合并为一个 epg.xml.gz
+        self.epg = EpgCompiler.from_config(getattr(config, 'epg_config', {}))
+        
+        # 频道 Logo：批量检查后写入本地索引，生成播放列表时只读索引
+        self.logo_base_url = getattr(config, 'logo_base_url', 'https://gcore.jsdelivr.net/gh/yuanzl77/TVlogo@master/png/')
+        self.logos = LogoResolver.from_config(getattr(config, 'logo_config', {}), self.logo_base_url)
+        
+        # 各阶段检查点，只在完整运行和分阶段运行时由调用方设置（批量、常驻、分片模式不写）
+        self.checkpoints = None
+        
+        # 运行统计（阶段耗时、计数器、探测延迟直方图）
+        self.run_stats_config = getattr(config, 'run_stats_config', {})
+        self.stats = RunStats()
+        
+    def begin_run(self):
+        """开始新一轮处理：重置本轮统计（常驻模式下每次刷新调用）"""
+        self.stats = RunStats()
+        if self.probe_cache is not None:
+            self.probe_cache.hits = self.probe_cache.misses = 0
+        if self.health is not None:
+            self.health.backed_off = 0
+        self.ipv6_probe_enabled = None
         
     async def __aenter__(self):
         await self.setup_session()
@@ -51,9 +136,12 @@ class IPTVProcessor:
         await self.close_session()
         
     async def setup_session(self):
-        """创建aiohttp会话"""
-        connector = TCPConnector(limit=self.max_workers, limit_per_host=10)
-        timeout = ClientTimeout(total=self.timeout)
+        """创建aiohttp会话（aiohttp 只在需要网络的阶段导入）"""
+        import aiohttp
+
+        limit_per_host = self.host_guard_config.get('max_concurrency', 10) if self.host_guard_config.get('enabled') else 10
+        connector = aiohttp.TCPConnector(limit=self.max_workers, limit_per_host=limit_per_host)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
         self.session = aiohttp.ClientSession(
             connector=connector,
             timeout=timeout,
@@ -64,6 +152,9 @@ class IPTVProcessor:
         """关闭会话"""
         if self.session:
             await self.session.close()
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown()
+            self.parse_pool = None
 
     def parse_template(self, template_file):
         """解析模板文件"""
@@ -93,195 +184,282 @@ class IPTVProcessor:
             logger.error(f"解析模板文件失败: {e}")
             raise
 
-    @backoff.on_exception(backoff.expo, (requests.RequestException,), max_tries=3)
-    def fetch_channels(self, url):
-        """获取频道数据，支持重试机制和无group-title的M3U格式"""
-        channels = OrderedDict()
-
+    async def fetch_channels(self, url, sink, max_tries=3):
+        """获取并解析单个源，记录该源的耗时和结果"""
+        start = time.perf_counter()
+        result = None
         try:
-            response = requests.get(url, timeout=self.timeout)
-            response.raise_for_status()
-            response.encoding = 'utf-8'
-            lines = response.text.split("\n")
-            
-            is_m3u = any("#EXTINF" in line for line in lines[:10])
-            source_type = "m3u" if is_m3u else "txt"
-            logger.info(f"URL: {url} 获取成功，格式: {source_type}")
+            result = await self._fetch_channels(url, sink, max_tries)
+            return result
+        finally:
+            detail = {"duration": round(time.perf_counter() - start, 4), "ok": result is not None}
+            if result is not None:
+                detail.update(result)
+                self.stats.incr("source_channels", result["channels"])
+                if result["from_cache"]:
+                    self.stats.incr("source_cache_hits")
+            self.stats.record_source(url, **detail)
 
-            current_category = "默认分类"  # 为无分类的频道设置默认分类
-            channel_name = None
+    async def _fetch_channels(self, url, sink, max_tries=3):
+        """流式获取并解析频道数据，支持重试机制和无group-title的M3U格式
 
-            if is_m3u:
-                for i, line in enumerate(lines):
-                    line = line.strip()
-                    if line.startswith("#EXTINF"):
-                        # 尝试多种格式的解析
-                        match = re.search(r'group-title="([^"]*)"\s*,\s*(.+)', line)
-                        if match:
-                            # 标准格式：有group-title
-                            current_category = match.group(1).strip() or "未分类"
-                            channel_name = match.group(2).strip()
-                        else:
-                            # 无group-title格式：直接提取频道名
-                            match_simple = re.search(r'#EXTINF:.*?,(.+)', line)
-                            if match_simple:
-                                channel_name = match_simple.group(1).strip()
-                                current_category = "默认分类"  # 使用默认分类
-                            else:
-                                # 备用解析方式
-                                current_category = "默认分类"
-                                channel_name = line.split(',')[-1].strip() if ',' in line else f"频道_{i}"
-                        
-                        if current_category not in channels:
-                            channels[current_category] = []
-                            
-                    elif line and not line.startswith("#") and channel_name:
-                        channel_url = line.strip()
-                        if channel_url.startswith(('http://', 'https://')):
-                            channels[current_category].append((channel_name, channel_url))
-                            channel_name = None  # 重置频道名
-            else:
-                # TXT格式处理
-                for line in lines:
-                    line = line.strip()
-                    if not line:
-                        continue
-                        
-                    if "#genre#" in line:
-                        current_category = line.split(",")[0].strip()
-                        # 确保分类在channels字典中
-                        if current_category not in channels:
-                            channels[current_category] = []
-                    elif current_category:  # 确保有当前分类
-                        if ',' in line:
-                            parts = line.split(',', 1)
-                            if len(parts) == 2:
-                                channel_name = parts[0].strip()
-                                channel_url = parts[1].strip()
-                                if channel_url.startswith(('http://', 'https://')):
-                                    # 确保分类存在
-                                    if current_category not in channels:
-                                        channels[current_category] = []
-                                    channels[current_category].append((channel_name, channel_url))
-
-            if channels:
-                total_channels = sum(len(channel_list) for channel_list in channels.values())
-                categories = list(channels.keys())
-                logger.info(f"URL: {url} 处理完成，分类数: {len(categories)}, 频道总数: {total_channels}")
-            else:
-                logger.warning(f"URL: {url} 未找到有效频道")
-                
-            return channels
+        解析出的频道逐条写入 sink（见 SourceParser），不在内存中保留整个响应或整个源；
+        获取失败时调用 sink.discard() 丢弃已写入的部分。
+        启用源缓存时发送条件请求，304 时直接回放已解析的快照。
+        返回统计信息 {"source_type", "categories", "channels", "from_cache"}，失败时返回 None。
+        """
+        import aiohttp
 
-        except requests.RequestException as e:
-            logger.error(f"URL: {url} 获取失败: {e}")
-            return OrderedDict()
+        cache = self.source_cache
+        meta = cache.get_meta(url) if cache is not None else None
+        
+        # 离线模式只使用缓存
+        if cache is not None and cache.offline:
+            if meta is None:
+                logger.warning(f"URL: {url} 离线模式下没有可用缓存")
+                return None
+            return self.replay_source(url, sink, meta, "离线模式")
 
-    def match_channels(self, template_channels, all_channels):
-        """匹配模板频道和在线频道"""
-        matched_channels = OrderedDict()
-        match_count = 0
+        if not self.session:
+            await self.setup_session()
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout)
+        headers = SourceCache.conditional_headers(meta)
 
-        for category, channel_list in template_channels.items():
-            matched_channels[category] = OrderedDict()
-            
-            for channel_name in channel_list:
-                found = False
-                for online_category, online_channel_list in all_channels.items():
-                    for online_channel_name, online_channel_url in online_channel_list:
-                        # 使用更宽松的匹配方式
-                        if self.is_channel_match(channel_name, online_channel_name):
-                            if channel_name not in matched_channels[category]:
-                                matched_channels[category][channel_name] = []
-                            matched_channels[category][channel_name].append(online_channel_url)
-                            found = True
-                            match_count += 1
-                
-                if not found:
-                    logger.debug(f"未找到匹配频道: {channel_name}")
-                    matched_channels[category][channel_name] = []
+        for attempt in range(1, max_tries + 1):
+            writer = None
+            parser = None
+            try:
+                async with self.session.get(url, timeout=timeout, headers=headers) as response:
+                    if response.status == 304 and meta is not None:
+                        return self.replay_source(url, sink, meta, "源未变化")
+                    response.raise_for_status()
+                    if self.use_process_pool(response):
+                        return await self.parse_in_pool(url, response, sink)
+                    if cache is not None:
+                        writer = cache.writer(url, response.headers, sink)
+                    parser = SourceParser(writer or sink)
+                    try:
+                        async for line in iter_lines(response):
+                            parser.feed(line)
+                        parser.close()
+                    finally:
+                        received = response.content.total_bytes
+                        self.stats.incr("source_bytes", received)
+                        self.stats.record_source(url, bytes=received)
+                if writer is not None:
+                    writer.commit(parser.source_type, parser.total_channels)
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if writer is not None:
+                    writer.abort()
+                # 丢弃本次已写入的部分条目，避免重试后重复
+                sink.discard()
+                if attempt == max_tries:
+                    logger.error(f"URL: {url} 获取失败: {e}")
+                    if meta is not None:
+                        return self.replay_source(url, sink, meta, "获取失败，使用旧缓存")
+                    return None
+                # 指数退避后重试
+                await asyncio.sleep(2 ** (attempt - 1))
 
-        logger.info(f"频道匹配完成，共匹配 {match_count} 个频道")
-        return matched_channels
+        logger.info(f"URL: {url} 获取成功，格式: {parser.source_type}")
+        if parser.total_channels:
+            logger.info(f"URL: {url} 处理完成，分类数: {len(parser.categories)}, 频道总数: {parser.total_channels}")
+        else:
+            logger.warning(f"URL: {url} 未找到有效频道")
+        return {"source_type": parser.source_type, "categories": len(parser.categories),
+                "channels": parser.total_channels, "from_cache": False}
 
-    def is_channel_match(self, template_name, online_name):
-        """判断频道是否匹配"""
-        # 精确匹配
-        if template_name == online_name:
-            return True
-            
-        # 清理名称后进行匹配
-        clean_template = self.clean_channel_name(template_name)
-        clean_online = self.clean_channel_name(online_name)
-        
-        return clean_template == clean_online
-
-    def clean_channel_name(self, name):
-        """清理频道名称"""
-        # 移除常见的修饰词
-        patterns = [
-            r'★\s*', r'☆\s*', r'●\s*', r'○\s*', r'◆\s*', r'◇\s*',
-            r'\[\d+\]', r'【\d+】', r'\(.*?\)', r'\[.*?\]', r'（.*?）', r'【.*?】'
-        ]
-        cleaned = name
-        for pattern in patterns:
-            cleaned = re.sub(pattern, '', cleaned)
-        return cleaned.strip()
-
-    def filter_source_urls(self):
-        """过滤源URL"""
-        template_channels = self.parse_template(self.template_file)
+    def use_process_pool(self, response):
+        """Content-Length 超过阈值的大源交给进程池解析"""
+        threshold = self.parse_config.get('process_pool_threshold')
+        if not threshold or self.parse_config.get('processes', 0) < 1:
+            return False
+        return (response.content_length or 0) > threshold
+
+    async def parse_in_pool(self, url, response, sink):
+        """读取完整响应后在进程池中解析，事件循环只负责回放结果
+
+        解析结果以序列化的 ChannelStore 返回，跨进程只传一块字节；
+        回放进 sink 时每个频道名只规范化一次，启用源缓存时同一份数据直接作为快照保存。
+        """
+        try:
+            data = await response.read()
+        finally:
+            received = response.content.total_bytes
+            self.stats.incr("source_bytes", received)
+            self.stats.record_source(url, bytes=received)
+        if self.parse_pool is None:
+            # spawn：不在子进程中继承父进程的事件循环和连接
+            self.parse_pool = ProcessPoolExecutor(max_workers=self.parse_config.get('processes', 2),
+                                                  mp_context=multiprocessing.get_context("spawn"))
+        loop = asyncio.get_running_loop()
+        payload = await loop.run_in_executor(self.parse_pool, parse_source_bytes, data)
+        del data
+        store, info = ChannelStore.from_bytes(payload)
+        store.replay(sink)
+        if self.source_cache is not None:
+            self.source_cache.save_store(url, response.headers, store, info["source_type"], len(store))
+        self.stats.incr("source_pool_parsed")
+        logger.info(f"URL: {url} 获取成功（进程池解析），格式: {info['source_type']}，"
+                    f"分类数: {info['categories']}, 频道总数: {len(store)}")
+        return {"source_type": info["source_type"], "categories": info["categories"],
+                "channels": len(store), "from_cache": False}
+
+    def replay_source(self, url, sink, meta, reason):
+        """从源缓存回放已解析的频道"""
+        total = self.source_cache.replay(url, sink)
+        if total is None:
+            return None
+        logger.info(f"URL: {url} {reason}，使用缓存快照，分类数: {meta.get('categories')}, 频道总数: {total}")
+        return {"source_type": meta.get("source_type"), "categories": meta.get("categories"),
+                "channels": total, "from_cache": True}
+
+    async def filter_source_urls(self, template_channels=None):
+        """过滤源URL（批量模式传入已合并的模板，不再读取 template_file）"""
+        if template_channels is None:
+            with self.stats.span("parse_template"):
+                template_channels = self.parse_template(self.template_file)
         source_urls = getattr(config, 'source_urls', [])
         
         if not source_urls:
             logger.error("未找到源URL配置")
             return OrderedDict(), template_channels
 
-        all_channels = OrderedDict()
-        
-        # 使用线程池并行获取
-        with ThreadPoolExecutor(max_workers=min(10, len(source_urls))) as executor:
-            futures = {executor.submit(self.fetch_channels, url): url for url in source_urls}
-            
-            for future in concurrent.futures.as_completed(futures):
-                url = futures[future]
-                try:
-                    fetched_channels = future.result()
-                    for category, channel_list in fetched_channels.items():
-                        if category in all_channels:
-                            all_channels[category].extend(channel_list)
-                        else:
-                            all_channels[category] = channel_list
-                except Exception as e:
-                    logger.error(f"处理URL {url} 时出错: {e}")
-
-        matched_channels = self.match_channels(template_channels, all_channels)
-        return matched_channels, template_channels
+        index = self.create_index(template_channels)
+        await self.fetch_sources(source_urls, index)
+        return self.match_index(template_channels, index, source_urls), template_channels
+
+    def create_index(self, template_channels):
+        """只保留模板中出现的频道的索引，源边下载边匹配"""
+        self.normalizer.check_template(template_channels)
+        wanted = {self.normalizer.key(name) for channel_list in template_channels.values() for name in channel_list}
+        return ChannelIndex(wanted, self.normalizer)
+
+    async def fetch_sources(self, source_urls, index):
+        """所有源在同一个会话上并发获取，结果按配置顺序合并到索引"""
+        with self.stats.span("fetch_channels"):
+            results = await asyncio.gather(*(
+                self.fetch_source(source, url, index) for source, url in enumerate(source_urls)
+            ), return_exceptions=True)
+        for url, result in zip(source_urls, results):
+            if isinstance(result, Exception):
+                logger.error(f"处理URL {url} 时出错: {result}")
+        logger.info(f"源解析完成，频道总数: {index.total_urls}")
+        self.stats.incr("matched_entries", index.total_urls)
+        if self.checkpoints is not None:
+            self.checkpoints.save_sources(
+                source_urls, [None if isinstance(result, Exception) else result for result in results])
+
+    async def fetch_source(self, source, url, index):
+        """获取一个源；启用检查点时同时保存该源解析出的完整频道"""
+        sink = index.source_sink(source)
+        if self.checkpoints is None:
+            return await self.fetch_channels(url, sink)
+        recorder = RecordingSink(sink)
+        result = await self.fetch_channels(url, recorder)
+        if result is not None:
+            self.checkpoints.save_source(source, recorder.store)
+        return result
+
+    def match_checkpoint(self, template_channels):
+        """match 阶段单独运行：从 fetch 检查点回放各源，按当前模板和匹配规则重新匹配"""
+        index = self.create_index(template_channels)
+        source_urls, stores = self.checkpoints.load_sources()
+        for source, store in stores:
+            store.replay(index.source_sink(source))
+        logger.info(f"源解析完成，频道总数: {index.total_urls}")
+        self.stats.incr("matched_entries", index.total_urls)
+        return self.match_index(template_channels, index, source_urls)
+
+    def match_index(self, template_channels, index, source_urls):
+        """按模板匹配索引中的频道，返回 {分类: {频道名: [URL, ...]}}"""
+        # 各源匹配条目的重复率
+        for source, (total, duplicates) in sorted(index.duplication_report(normalize_url).items()):
+            logger.info(f"源 {source_urls[source]}: 匹配条目 {total}，重复 {duplicates}，"
+                        f"重复率 {duplicates / total:.1%}")
+
+        with self.stats.span("match_channels"):
+            audit = OrderedDict()
+            matched_channels, match_count, missing = match_template(template_channels, index, audit)
+        for channel_name in missing:
+            logger.debug(f"未找到匹配频道: {channel_name}")
+        logger.info(f"频道匹配完成，共匹配 {match_count} 个频道")
+        self.stats.incr("matched_channels", match_count)
+        self.record_match_audit(audit)
+        return matched_channels
+
+    def record_match_audit(self, audit):
+        """按规则统计匹配条目数，并写出每个模板频道匹配到的在线名称和规则"""
+        rule_counts = OrderedDict()
+        for details in audit.values():
+            for _, rule, count in details:
+                rule_counts[rule] = rule_counts.get(rule, 0) + count
+        for rule, count in rule_counts.items():
+            self.stats.incr(f"match_rule_{rule}", count)
+        if rule_counts:
+            logger.info(f"匹配规则: {', '.join(f'{rule} {count}' for rule, count in rule_counts.items())}")
+        audit_path = self.matching_config.get('audit_path')
+        if not audit_path:
+            return
+        try:
+            write_atomic(audit_path, json.dumps({
+                channel_name: [{"name": online_name, "rule": rule, "urls": count}
+                               for online_name, rule, count in details]
+                for channel_name, details in audit.items()
+            }, ensure_ascii=False, indent=1))
+        except OSError as e:
+            logger.warning(f"匹配记录写入失败: {e}")
 
     def is_ipv6(self, url):
         """判断是否为IPv6地址"""
-        return re.match(r'^https?://\[[0-9a-fA-F:]+\]', url) is not None
+        return is_ipv6_url(url)
+
+    def check_ipv6(self):
+        """确定本轮是否探测IPv6线路（每轮只检查一次本机路由）"""
+        if self.ipv6_probe_enabled is None:
+            if not self.ipv6_config.get('enabled', True):
+                self.ipv6_probe_enabled = False
+            elif self.ipv6_config.get('reachability_check', True):
+                self.ipv6_probe_enabled = ipv6_reachable(self.ipv6_config.get('reachability_target', '2400:3200::1'))
+                if not self.ipv6_probe_enabled:
+                    logger.info("本机没有可用的IPv6路由，跳过IPv6线路探测")
+            else:
+                self.ipv6_probe_enabled = True
+        return self.ipv6_probe_enabled
+
+    def probe_timeout(self, url):
+        """单个链接的探测超时，IPv6 线路可单独配置"""
+        if self.is_ipv6(url):
+            return self.ipv6_config.get('link_check_timeout', self.link_check_timeout)
+        return self.link_check_timeout
+
+    def probe_lane(self, url):
+        """调度器并发通道：IPv6 线路使用独立的并发上限"""
+        return IPV6_LANE if self.is_ipv6(url) else None
+
+    def lane_limits(self):
+        return {IPV6_LANE: self.ipv6_config.get('max_concurrent_checks', self.max_concurrent_checks)}
 
     def is_url_blacklisted(self, url):
         """检查URL是否在黑名单中"""
-        blacklist = getattr(config, 'url_blacklist', [])
-        return any(blacklisted in url for blacklisted in blacklist)
+        return self.url_filter.is_blacklisted(url)
     
     def should_skip_check(self, url):
         """检查是否应该跳过链接检查"""
-        return any(pattern in url for pattern in self.skip_check_patterns)
+        return self.url_filter.should_skip(url)
 
-    async def check_link_quality(self, url):
-        """检查链接质量 - 优化版本"""
+    async def probe_link(self, url):
+        """探测链接，返回 (响应时间, 状态)"""
         if not self.session:
             await self.setup_session()
         
-        # 跳过已知稳定的源
-        if self.should_skip_check(url):
-            return 0.1  # 返回一个很小的响应时间，表示稳定
-        
-        # 减少超时时间
-        timeout = ClientTimeout(total=self.link_check_timeout)
+        from aiohttp import ClientTimeout
+
+        # 减少超时时间；连接阶段单独限时，连接超时与读取超时分开统计
+        probe_timeout = self.probe_timeout(url)
+        timeout = ClientTimeout(total=probe_timeout,
+                                sock_connect=probe_timeout * self.host_guard_config.get('connect_timeout_ratio', 0.7))
         
         try:
             start_time = time.time()
@@ -292,221 +470,437 @@ class IPTVProcessor:
                 response_time = time.time() - start_time
                 
                 if response.status == 200:
-                    return response_time
-                return float('inf')
+                    return response_time, response.status
+                return float('inf'), response.status
+        except connect_errors() as e:
+            logger.debug(f"链接连接失败 {url}: {e}")
+            return float('inf'), STATUS_CONNECT_ERROR
         except asyncio.TimeoutError:
             logger.debug(f"链接检查超时: {url}")
-            return float('inf')
+            return float('inf'), STATUS_TIMEOUT
         except Exception as e:
             logger.debug(f"链接检查失败 {url}: {e}")
+            return float('inf'), STATUS_ERROR
+
+    def lookup_link(self, url):
+        """无需网络即可确定的链接质量：免检源、未过期的缓存或处于退避期的失效链接，否则返回 None"""
+        # 跳过已知稳定的源
+        if self.should_skip_check(url):
+            return 0.1
+        # 本轮不探测IPv6：视为不可用，按源顺序排在可用线路之后，不写入缓存和健康记录
+        if self.ipv6_probe_enabled is False and self.is_ipv6(url):
             return float('inf')
+        health = self.health
+        if health is not None and not health.should_probe(url):
+            return health.score(url)
+        if self.probe_cache is not None:
+            entry = self.probe_cache.get_entry(url, require_throughput=self.deep_probe_enabled)
+            if entry is not None:
+                latency, _, throughput = entry
+                # 缓存命中不产生新样本，有历史记录时仍按历史得分排序
+                score = health.score(url) if health is not None else None
+                return self.link_score(latency, throughput) if score is None else score
+        return None
 
-    async def check_links_batch(self, urls):
-        """批量检查链接质量 - 优化版本"""
-        if not urls:
-            return []
-        
-        # 限制并发数量，避免过多请求
-        semaphore = asyncio.Semaphore(self.max_concurrent_checks)
-        
-        async def bounded_check(url):
-            async with semaphore:
-                return await self.check_link_quality(url)
-        
-        tasks = [bounded_check(url) for url in urls]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # 处理异常结果
-        processed_results = []
-        for result in results:
-            if isinstance(result, Exception):
-                processed_results.append(float('inf'))
-            else:
-                processed_results.append(result)
-                
-        return processed_results
+    def lookup_incremental(self, url):
+        """增量模式下的查找：先沿用上次运行的得分，再查缓存"""
+        quality = self.incremental_state.lookup(url)
+        if quality is not None:
+            return quality
+        return self.lookup_link(url)
+
+    async def probe_raw(self, url):
+        """发起网络探测，返回 (响应时间, 状态, 吞吐量)，普通探测的吞吐量为 None"""
+        if self.deep_probe_enabled:
+            if not self.session:
+                await self.setup_session()
+            result = await deep_probe(self.session, url, self.probe_timeout(url), self.deep_probe_config)
+            return result['latency'], result['status'], result['throughput']
+        response_time, status = await self.probe_link(url)
+        return response_time, status, None
+
+    async def probe_and_store(self, url):
+        """发起网络探测（或取分片探测的结果）并写入缓存和健康记录，返回 (本次得分, 状态)
+
+        返回本次探测的得分而不是历史得分，竞速模式按它判断探测是否还能胜出；
+        排序时再由 rank_score 换算成历史得分。
+        """
+        shard_result = None
+        if self.shard_results is not None:
+            shard_result = self.shard_results.get(normalize_url(url))
+        if shard_result is not None:
+            response_time, status, throughput = sharding.from_result(shard_result)
+        else:
+            response_time, status, throughput = await self.probe_raw(url)
+        self.record_probe(response_time, status)
+        if self.probe_cache is not None:
+            self.probe_cache.put(url, response_time, status, throughput)
+        score = self.link_score(response_time, throughput)
+        if self.health is not None:
+            self.health.record(url, score)
+        return score, status
+
+    def rank_score(self, url, score):
+        """网络探测结果的排序得分：有健康记录时使用历史得分"""
+        if self.health is None:
+            return score
+        history = self.health.score(url)
+        return score if history is None else history
 
-    async def process_channel_links(self, channel_links):
-        """处理频道链接并排序"""
+    def record_probe(self, latency, status):
+        """统计一次网络探测的结果"""
+        self.stats.incr("probes")
+        if latency != float('inf'):
+            self.stats.observe_latency(latency)
+        elif status == STATUS_TIMEOUT:
+            self.stats.incr("probe_timeouts")
+        else:
+            self.stats.incr("probe_failures")
+
+    def link_score(self, latency, throughput=None):
+        """排序得分（越小越好）
+
+        普通探测直接使用响应时间；深度探测时加上按参考码率下载1秒视频所需的时间，
+        吞吐量不足参考码率的源会被明显排后。
+        """
+        if throughput is None or latency == float('inf'):
+            return latency
+        if throughput <= 0:
+            return float('inf')
+        reference_bytes = self.deep_probe_config.get('reference_bitrate', 4000000) / 8
+        return latency + reference_bytes / throughput
+
+    def create_scheduler(self, race_quota=None, lookup_func=None):
+        """创建共享工作池的探测调度器"""
+        # 分片结果已经过各分片内的主机熔断，合并时不再重复熔断
+        host_guard = None if self.shard_results is not None else HostGuard.from_config(self.host_guard_config)
+        return ProbeScheduler(
+            self.probe_and_store,
+            self.max_concurrent_checks,
+            race_quota=race_quota,
+            lookup_func=lookup_func or self.lookup_link,
+            key_func=normalize_url,
+            host_guard=host_guard,
+            lane_func=self.probe_lane,
+            lane_limits=self.lane_limits(),
+            score_func=self.rank_score,
+        )
+
+    def pending_probe_urls(self, urls, lookup_func=None):
+        """去重后仍需网络探测的URL（缓存、免检和退避中的URL除外）
+
+        只用于分片前的规划，查找产生的命中/未命中等计数会被还原，
+        之后调度器正常查找时再计数。
+        """
+        lookup_func = lookup_func or self.lookup_link
+        counters = (
+            (self.probe_cache.hits, self.probe_cache.misses) if self.probe_cache is not None else None,
+            self.health.backed_off if self.health is not None else None,
+            self.incremental_state.skipped if self.incremental_state is not None else None,
+        )
+        pending, _ = dedupe_urls(urls)
+        pending = [url for url in pending if lookup_func(url) is None]
+        if counters[0] is not None:
+            self.probe_cache.hits, self.probe_cache.misses = counters[0]
+        if counters[1] is not None:
+            self.health.backed_off = counters[1]
+        if counters[2] is not None:
+            self.incremental_state.skipped = counters[2]
+        return pending
+
+    def probe_options(self):
+        """分片进程的探测参数（子进程重新导入 config，这里显式传递当前生效的值）"""
+        return {
+            "template_file": self.template_file,
+            "link_check_timeout": self.link_check_timeout,
+            "max_concurrent_checks": self.max_concurrent_checks,
+            "deep_probe_config": dict(self.deep_probe_config, enabled=self.deep_probe_enabled),
+            "host_guard_config": self.host_guard_config,
+            "ipv6_config": self.ipv6_config,
+        }
+
+    def probe_workload_urls(self, channel_links):
+        """与 process_channel_links 相同的过滤和去重后，所有待探测的URL"""
+        return [url for channel_dict in channel_links.values() for urls in channel_dict.values()
+                for url in dedupe_urls(self.url_filter.filter(urls))[0]]
+
+    async def process_channel_links(self, channel_links, max_urls=None):
+        """处理频道链接并排序（max_urls 为竞速模式每个频道需要的可用链接数，默认 max_urls_per_channel）"""
         sorted_channels = OrderedDict()
-        total_channels = sum(len(channels) for channels in channel_links.values())
-        processed = 0
+        workload = []
+        duplicate_count = 0
+        ipv6_count = 0
 
         for category, channel_dict in channel_links.items():
             sorted_channels[category] = OrderedDict()
             
             for channel_name, urls in channel_dict.items():
-                processed += 1
-                if processed % 10 == 0:
-                    logger.info(f"处理进度: {processed}/{total_channels}")
-                    
-                if urls:
-                    # 过滤黑名单URL
-                    filtered_urls = [url for url in urls if not self.is_url_blacklisted(url)]
-                    
-                    if filtered_urls:
-                        # 如果配置为保持源顺序，则不进行质量检查
-                        if self.preserve_source_order:
-                            sorted_channels[category][channel_name] = filtered_urls[:self.max_urls_per_channel]
-                        else:
-                            results = await self.check_links_batch(filtered_urls)
-                            
-                            # 配对URL和质量结果并排序
-                            url_qualities = list(zip(filtered_urls, results))
-                            sorted_urls = [
-                                url for url, quality in sorted(
-                                    url_qualities, 
-                                    key=lambda x: x[1] if x[1] != float('inf') else float('inf')
-                                )
-                            ]
-                            sorted_channels[category][channel_name] = sorted_urls[:self.max_urls_per_channel]
-                    else:
-                        sorted_channels[category][channel_name] = []
+                # 过滤黑名单URL，并去掉规范化后重复的URL（避免占用输出名额）
+                filtered_urls, removed = dedupe_urls(self.url_filter.filter(urls))
+                duplicate_count += removed
+                
+                ipv6_count += sum(1 for url in filtered_urls if self.is_ipv6(url))
+                
+                # 如果配置为保持源顺序，则不进行质量检查
+                # 保留完整列表，由输出按变体（全部 / 仅IPv4 / 仅IPv6）各取前 max_urls_per_channel 个
+                if self.preserve_source_order or not filtered_urls:
+                    sorted_channels[category][channel_name] = filtered_urls
                 else:
                     sorted_channels[category][channel_name] = []
-                    
-        logger.info("频道链接处理完成")
-        return sorted_channels
+                    workload.extend((category, channel_name, url) for url in filtered_urls)
 
-    def update_channel_urls_m3u(self, channels, template_channels):
-        """更新频道URL到M3U和TXT文件 - 优化版本，默认生成兼容格式"""
-        try:
-            current_date = datetime.now().strftime("%Y-%m-%d")
-            
-            # 更新公告日期
-            announcements = getattr(config, 'announcements', [])
-            for group in announcements:
-                for announcement in group.get('entries', []):
-                    if announcement.get('name') is None:
-                        announcement['name'] = current_date
-
-            # 创建输出目录
-            output_dir = getattr(config, 'output_config', {}).get('output_dir', 'output')
-            os.makedirs(output_dir, exist_ok=True)
-            
-            # 主要输出文件（兼容格式）
-            main_m3u_file = os.path.join(output_dir, "live.m3u")
-            main_txt_file = os.path.join(output_dir, "live.txt")
+        if duplicate_count:
+            logger.info(f"频道内重复URL: 去掉 {duplicate_count} 个")
+        self.stats.incr("duplicate_urls", duplicate_count)
+        self.stats.incr("probe_workload", len(workload))
+        self.stats.incr("ipv6_urls", ipv6_count)
+
+        if workload:
+            if ipv6_count and not self.check_ipv6():
+                self.stats.incr("ipv6_probes_skipped", sum(1 for _, _, url in workload if self.is_ipv6(url)))
+
+            # 增量模式：沿用上次运行中未变化URL的得分
+            lookup_func = None
+            if self.incremental_state is not None:
+                probe_links = OrderedDict()
+                for category, channel_name, url in workload:
+                    probe_links.setdefault(category, OrderedDict()).setdefault(channel_name, []).append(url)
+                self.incremental_state.plan(probe_links)
+                lookup_func = self.lookup_incremental
             
-            # 可选的处理格式文件
-            processed_m3u_file = os.path.join(output_dir, "live_processed.m3u")
-            processed_txt_file = os.path.join(output_dir, "live_processed.txt")
+            # 本地分片：需要网络探测的URL按主机分到多个进程，结果再交给调度器排序
+            local_shards = self.shard_processes > 1 and self.shard_results is None
+            if local_shards:
+                pending = self.pending_probe_urls([url for _, _, url in workload], lookup_func)
+                if pending:
+                    with self.stats.span("probe_shards"):
+                        self.shard_results = await sharding.probe_in_processes(
+                            pending, self.shard_processes, self.probe_options())
             
-            files_to_open = [(main_m3u_file, main_txt_file)]
-            if self.url_suffix_enabled:
-                files_to_open.append((processed_m3u_file, processed_txt_file))
+            # 所有频道的URL共用一个工作池统一探测
+            logger.info(f"开始探测 {len(workload)} 个链接，并发数: {self.max_concurrent_checks}，"
+                        f"排序模式: {self.ranking_mode}")
+            race_quota = (max_urls or self.max_urls_per_channel) if self.ranking_mode == 'race' else None
+            scheduler = self.create_scheduler(race_quota, lookup_func)
+            results = await scheduler.run(workload)
+            self.record_scheduler(scheduler)
+            if local_shards:
+                self.shard_results = None
             
-            file_handles = {}
-            for m3u_file, txt_file in files_to_open:
-                file_handles[m3u_file] = open(m3u_file, "w", encoding="utf-8")
-                file_handles[txt_file] = open(txt_file, "w", encoding="utf-8")
+            # 按频道重新分组并按响应时间排序
+            for (category, channel_name), url_qualities in results.items():
+                sorted_channels[category][channel_name] = [
+                    url for url, quality in sorted(url_qualities, key=lambda x: x[1])]
             
-            try:
-                # 写入M3U头
-                epg_urls = getattr(config, 'epg_urls', [])
-                m3u_header = f"""#EXTM3U x-tvg-url="{','.join(epg_urls)}"\n"""
-                
-                for m3u_file in file_handles:
-                    if m3u_file.endswith('.m3u'):
-                        file_handles[m3u_file].write(m3u_header)
+            if self.incremental_state is not None:
+                qualities = {url: quality for url_qualities in results.values()
+                             for url, quality in url_qualities if url not in scheduler.unresolved}
+                self.incremental_state.save(probe_links, qualities)
 
-                # 写入公告频道
-                for group in announcements:
-                    group_title = group.get('channel', '公告')
-                    
-                    for txt_file in file_handles:
-                        if txt_file.endswith('.txt'):
-                            file_handles[txt_file].write(f"{group_title},#genre#\n")
+        if self.probe_cache is not None and not self.preserve_source_order:
+            self.stats.incr("probe_cache_hits", self.probe_cache.hits)
+            self.stats.incr("probe_cache_misses", self.probe_cache.misses)
+            logger.info(f"探测缓存命中: {self.probe_cache.hits}，未命中: {self.probe_cache.misses}，"
+                        f"命中率: {self.probe_cache.hit_rate():.1%}")
+            self.probe_cache.save()
+        if self.health is not None and workload:
+            if self.health.backed_off:
+                logger.info(f"健康记录: {self.health.backed_off} 个连续失败的链接处于退避期，本次未探测")
+            self.health.save()
                     
-                    for announcement in group.get('entries', []):
-                        name = announcement.get('name', '')
-                        logo = announcement.get('logo', '')
-                        url = announcement.get('url', '')
-                        
-                        announcement_line = f"""#EXTINF:-1 tvg-id="1" tvg-name="{name}" tvg-logo="{logo}" group-title="{group_title}",{name}\n"""
-                        
-                        for m3u_file in file_handles:
-                            if m3u_file.endswith('.m3u'):
-                                file_handles[m3u_file].write(announcement_line)
-                                file_handles[m3u_file].write(f"{url}\n")
-                        
-                        for txt_file in file_handles:
-                            if txt_file.endswith('.txt'):
-                                file_handles[txt_file].write(f"{name},{url}\n")
+        logger.info("频道链接处理完成")
+        return sorted_channels
 
-                # 写入频道数据
-                written_channels = set()
-                
-                for category, channel_list in template_channels.items():
-                    for txt_file in file_handles:
-                        if txt_file.endswith('.txt'):
-                            file_handles[txt_file].write(f"{category},#genre#\n")
-                    
-                    if category in channels:
-                        for channel_name in channel_list:
-                            if channel_name in channels[category] and channel_name not in written_channels:
-                                urls = channels[category][channel_name]
-                                
-                                if urls:
-                                    logo_url = getattr(config, 'logo_base_url', 'https://gcore.jsdelivr.net/gh/yuanzl77/TVlogo@master/png/') + f"{channel_name}.png"
-                                    
-                                    # 主要输出：原始URL格式（兼容电视APP）
-                                    for index, url in enumerate(urls[:self.max_urls_per_channel]):
-                                        # 主要文件使用原始URL
-                                        file_handles[main_m3u_file].write(f'#EXTINF:-1 tvg-id="{index+1}" tvg-name="{channel_name}" tvg-logo="{logo_url}" group-title="{category}",{channel_name}\n')
-                                        file_handles[main_m3u_file].write(url + "\n")
-                                        file_handles[main_txt_file].write(f"{channel_name},{url}\n")
-                                        
-                                        # 处理格式文件（如果启用）
-                                        if self.url_suffix_enabled:
-                                            if self.suffix_style == 'simple':
-                                                url_suffix = f"$LR•线路{index+1}"
-                                            else:
-                                                url_suffix = f"$LR•IPV4『线路{index+1}』"
-                                            new_url = f"{url}{url_suffix}"
-                                            
-                                            file_handles[processed_m3u_file].write(f'#EXTINF:-1 tvg-id="{index+1}" tvg-name="{channel_name}" tvg-logo="{logo_url}" group-title="{category}",{channel_name}\n')
-                                            file_handles[processed_m3u_file].write(new_url + "\n")
-                                            file_handles[processed_txt_file].write(f"{channel_name},{new_url}\n")
-                                    
-                                    written_channels.add(channel_name)
-
-                # 记录生成的文件
-                generated_files = [main_m3u_file, main_txt_file]
-                if self.url_suffix_enabled:
-                    generated_files.extend([processed_m3u_file, processed_txt_file])
-                
-                logger.info(f"文件生成完成: {', '.join(generated_files)}")
-                logger.info(f"主文件: {main_m3u_file} (电视APP兼容格式)")
-                if self.url_suffix_enabled:
-                    logger.info(f"处理格式: {processed_m3u_file} (包含线路标识)")
-                
-            finally:
-                # 关闭所有文件句柄
-                for f in file_handles.values():
-                    f.close()
+    async def update_epg(self, template_channels):
+        """EPG 阶段（可与探测并发执行），失败只记录日志，不影响播放列表生成"""
+        if self.epg is None:
+            return
+        if not self.session:
+            await self.setup_session()
+        try:
+            with self.stats.span("epg"):
+                programmes = await self.epg.build(self.session, getattr(config, 'epg_urls', []),
+                                                  template_channels, self.timeout, self.stats,
+                                                  key_func=self.normalizer.key)
+            if programmes is not None:
+                self.stats.incr("epg_programmes", programmes)
+        except Exception as e:
+            logger.error(f"EPG 生成失败: {e}")
+
+    async def update_logos(self, template_channels):
+        """Logo 检查（可与探测并发执行），失败只记录日志，生成播放列表时使用已有的索引"""
+        if self.logos is None:
+            return
+        if not self.session:
+            await self.setup_session()
+        try:
+            with self.stats.span("logos"):
+                await self.logos.resolve(self.session,
+                                         [name for channel_list in template_channels.values() for name in channel_list],
+                                         key_func=self.normalizer.key, stats=self.stats)
+        except Exception as e:
+            logger.error(f"Logo 检查失败: {e}")
+
+    def epg_header_urls(self):
+        """M3U 头中引用的 EPG 地址"""
+        epg_urls = getattr(config, 'epg_urls', [])
+        if self.epg is None:
+            return epg_urls
+        return self.epg.header_urls(epg_urls)
+
+    def record_scheduler(self, scheduler):
+        """汇总调度器和主机熔断的统计"""
+        self.stats.incr("probes_cancelled", scheduler.cancelled)
+        self.stats.incr("probes_deduplicated", scheduler.deduplicated)
+        self.stats.incr("probes_skipped", scheduler.skipped)
+        if scheduler.host_guard is not None:
+            summary = scheduler.host_guard.summary()
+            self.stats.incr("hosts_tripped", summary["tripped_hosts"])
+            self.stats.incr("probes_short_circuited", summary["short_circuited"])
+        if self.incremental_state is not None:
+            self.stats.incr("probes_reused_incremental", self.incremental_state.skipped)
+        if self.health is not None:
+            self.stats.incr("probes_backed_off", self.health.backed_off)
+
+    def write_run_stats(self):
+        """写出运行报告（JSON，可选 Prometheus textfile）"""
+        if not self.run_stats_config.get('enabled', True):
+            return
+        try:
+            self.stats.write_json(self.run_stats_config.get('json_path', os.path.join('output', 'run_stats.json')))
+            prometheus_path = self.run_stats_config.get('prometheus_path')
+            if prometheus_path:
+                self.stats.write_prometheus(prometheus_path)
+        except OSError as e:
+            logger.warning(f"运行报告写入失败: {e}")
+
+    def output_settings(self, output_format=None):
+        """输出设置，output_format 为批量模式中单个模板对 config.output_format 的覆盖项"""
+        settings = {
+            "url_suffix_enabled": self.url_suffix_enabled,
+            "suffix_style": self.suffix_style,
+            "max_urls_per_channel": self.max_urls_per_channel,
+            "ip_variants": self.ip_variants,
+            "gzip": self.gzip_output,
+        }
+        settings.update(output_format or {})
+        return settings
+
+    def playlist_variants(self, settings=None):
+        """需要生成的输出变体"""
+        settings = settings or self.output_settings()
+        variants = [PlaylistVariant("live")]
+        if settings["url_suffix_enabled"]:
+            if settings["suffix_style"] == 'simple':
+                suffix = lambda index, url: f"$LR•线路{index+1}"
+            else:
+                suffix = lambda index, url: f"$LR•{'IPV6' if self.is_ipv6(url) else 'IPV4'}『线路{index+1}』"
+            variants.append(PlaylistVariant("live_processed", suffix=suffix))
+        if settings["ip_variants"]:
+            variants.append(PlaylistVariant("live_ipv4", accept=lambda url: not self.is_ipv6(url)))
+            variants.append(PlaylistVariant("live_ipv6", accept=self.is_ipv6))
+        return variants
+
+    def render_playlists(self, channels, template_channels, output_format=None):
+        """在内存中一次生成所有输出变体，返回 {文件名: UTF-8 内容}"""
+        settings = self.output_settings(output_format)
+        renderer = PlaylistRenderer(
+            self.playlist_variants(settings),
+            settings["max_urls_per_channel"],
+            self.logo_base_url,
+            epg_urls=self.epg_header_urls(),
+            announcements=getattr(config, 'announcements', []),
+            logo_func=self.logos.logo_for if self.logos is not None else None,
+        )
+        return renderer.render(channels, template_channels, datetime.now().strftime("%Y-%m-%d"))
+
+    def write_playlists(self, playlists, output_dir=None, output_format=None):
+        """把 render_playlists 的结果原子写入输出目录，返回写入的文件路径"""
+        output_dir = output_dir or getattr(config, 'output_config', {}).get('output_dir', 'output')
+        gzip_siblings = self.output_settings(output_format)["gzip"]
+        return write_playlist_files(output_dir, playlists, gzip_siblings=gzip_siblings)
+
+    def update_channel_urls_m3u(self, channels, template_channels, output_dir=None, output_format=None):
+        """更新频道URL到M3U和TXT文件 - 优化版本，默认生成兼容格式"""
+        try:
+            playlists = self.render_playlists(channels, template_channels, output_format)
+            generated_files = self.write_playlists(playlists, output_dir, output_format)
+            
+            # 记录生成的文件
+            output_dir = os.path.dirname(generated_files[0])
+            logger.info(f"文件生成完成: {', '.join(generated_files)}")
+            logger.info(f"主文件: {os.path.join(output_dir, 'live.m3u')} (电视APP兼容格式)")
+            if self.output_settings(output_format)["url_suffix_enabled"]:
+                logger.info(f"处理格式: {os.path.join(output_dir, 'live_processed.m3u')} (包含线路标识)")
+            return generated_files
             
         except Exception as e:
             logger.error(f"生成文件失败: {e}")
             raise
 
-async def main():
+async def run_pipeline(processor, stages):
+    """按顺序运行 fetch / match / probe / render 中连续的若干阶段
+
+    第一个阶段需要的输入从上一阶段的检查点读取；启用检查点时每个阶段完成后写出自己的结果。
+    只有 fetch 和 probe 需要网络，其余阶段不创建会话、不导入 aiohttp。
+    """
+    checkpoints = processor.checkpoints
+    template_channels = channels = sorted_channels = None
+    if stages[0] in ("fetch", "match"):
+        with processor.stats.span("parse_template"):
+            template_channels = processor.parse_template(processor.template_file)
+    
+    if "fetch" in stages or "probe" in stages:
+        await processor.setup_session()
+    try:
+        if "fetch" in stages and "match" in stages:
+            channels, template_channels = await processor.filter_source_urls(template_channels)
+        elif "fetch" in stages:
+            await processor.fetch_sources(getattr(config, 'source_urls', []),
+                                          processor.create_index(template_channels))
+        elif "match" in stages:
+            channels = processor.match_checkpoint(template_channels)
+        if "match" in stages and checkpoints is not None:
+            checkpoints.save("match", {"template_channels": template_channels, "channels": channels})
+        
+        if "probe" in stages:
+            if channels is None:
+                data = checkpoints.load("match")
+                template_channels, channels = data["template_channels"], data["channels"]
+            # EPG 和 Logo 检查与链接探测并发进行
+            side_tasks = asyncio.gather(processor.update_epg(template_channels),
+                                        processor.update_logos(template_channels))
+            with processor.stats.span("process_channel_links"):
+                sorted_channels = await processor.process_channel_links(channels)
+            await side_tasks
+            if checkpoints is not None:
+                checkpoints.save("probe", {"template_channels": template_channels, "channels": sorted_channels})
+    finally:
+        await processor.close_session()
+    
+    if "render" in stages:
+        if sorted_channels is None:
+            data = checkpoints.load("probe")
+            template_channels, sorted_channels = data["template_channels"], data["channels"]
+        with processor.stats.span("update_channel_urls_m3u"):
+            generated_files = processor.update_channel_urls_m3u(sorted_channels, template_channels)
+        if checkpoints is not None:
+            checkpoints.save("render", {"files": generated_files})
+    processor.write_run_stats()
+
+async def main(processes=None):
     """主函数"""
+    setup_logging()
     processor = IPTVProcessor("demo.txt")
+    processor.checkpoints = CheckpointStore.from_config(getattr(config, 'checkpoint_config', {}))
+    if processes:
+        processor.shard_processes = processes
     
     try:
         logger.info("开始IPTV处理...")
         logger.info(f"输出配置: 后缀启用={processor.url_suffix_enabled}, 最大URL数={processor.max_urls_per_channel}")
         
-        # 获取频道数据
-        channels, template_channels = processor.filter_source_urls()
-        
-        # 处理频道链接
-        async with processor:
-            sorted_channels = await processor.process_channel_links(channels)
-        
-        # 生成输出文件
-        processor.update_channel_urls_m3u(sorted_channels, template_channels)
+        await run_pipeline(processor, STAGES)
         
         logger.info("IPTV处理完成")
         logger.info("请使用 output/live.m3u 或 output/live.txt 在电视APP中播放")
@@ -515,5 +909,168 @@ async def main():
         logger.error(f"处理失败: {e}")
         raise
 
+async def run_stages(first, last=None, processes=None):
+    """分阶段运行：从 first 运行到 last（默认只运行 first），之前阶段的结果取自检查点"""
+    setup_logging()
+    processor = IPTVProcessor("demo.txt")
+    processor.checkpoints = CheckpointStore.from_config(getattr(config, 'checkpoint_config', {}), force=True)
+    if processes:
+        processor.shard_processes = processes
+    stages = STAGES[STAGES.index(first):STAGES.index(last or first) + 1]
+    logger.info(f"运行阶段: {' -> '.join(stages)}")
+    await run_pipeline(processor, stages)
+    logger.info("阶段运行完成")
+
+def merge_templates(template_list):
+    """合并多个模板：分类按首次出现顺序，每个频道名只保留第一次出现的位置"""
+    merged = OrderedDict()
+    seen = set()
+    for template_channels in template_list:
+        for category, channel_list in template_channels.items():
+            merged.setdefault(category, [])
+            for channel_name in channel_list:
+                if channel_name not in seen:
+                    seen.add(channel_name)
+                    merged[category].append(channel_name)
+    return merged
+
+def channels_for_template(sorted_channels, template_channels):
+    """从合并模板的排序结果中取出单个模板的频道（匹配只与频道名有关，与分类无关）"""
+    by_name = {}
+    for channel_dict in sorted_channels.values():
+        for channel_name, urls in channel_dict.items():
+            by_name.setdefault(channel_name, urls)
+    return OrderedDict(
+        (category, OrderedDict((name, by_name[name]) for name in channel_list if name in by_name))
+        for category, channel_list in template_channels.items()
+    )
+
+async def batch(processes=None):
+    """批量模式：多个模板共用一次源获取、匹配和探测，分别生成各自的输出"""
+    setup_logging()
+    templates = getattr(config, 'batch_config', {}).get('templates', [])
+    if not templates:
+        logger.error("batch_config 中没有配置模板")
+        return
+    processor = IPTVProcessor(templates[0]["template"])
+    if processes:
+        processor.shard_processes = processes
+    
+    with processor.stats.span("parse_template"):
+        parsed = [processor.parse_template(entry["template"]) for entry in templates]
+        merged = merge_templates(parsed)
+    logger.info(f"批量模式: {len(templates)} 个模板，合并后 {sum(len(names) for names in merged.values())} 个频道")
+    # 竞速模式按各模板中最多的输出链接数决出
+    max_urls = max(processor.output_settings(entry.get("output_format"))["max_urls_per_channel"]
+                   for entry in templates)
+    
+    async with processor:
+        channels, _ = await processor.filter_source_urls(merged)
+        side_tasks = asyncio.gather(processor.update_epg(merged), processor.update_logos(merged))
+        with processor.stats.span("process_channel_links"):
+            sorted_channels = await processor.process_channel_links(channels, max_urls)
+        await side_tasks
+    
+    with processor.stats.span("update_channel_urls_m3u"):
+        for entry, template_channels in zip(templates, parsed):
+            output_dir = entry.get("output_dir") or getattr(config, 'output_config', {}).get('output_dir', 'output')
+            logger.info(f"生成模板 {entry['template']} 的输出: {output_dir}")
+            processor.update_channel_urls_m3u(channels_for_template(sorted_channels, template_channels),
+                                              template_channels, output_dir, entry.get("output_format"))
+    processor.write_run_stats()
+    logger.info("批量处理完成")
+
+async def serve():
+    """常驻模式：后台定时刷新，通过HTTP提供内存中的播放列表"""
+    from server import PlaylistServer
+
+    setup_logging()
+    processor = IPTVProcessor("demo.txt")
+    server = PlaylistServer.from_config(processor, getattr(config, 'serve_config', {}))
+    async with processor:
+        await server.run()
+
+async def shard_plan(directory):
+    """多机分片第一步：获取源并匹配，保存待探测的URL和匹配结果"""
+    setup_logging()
+    processor = IPTVProcessor("demo.txt")
+    async with processor:
+        channels, template_channels = await processor.filter_source_urls()
+    urls = processor.pending_probe_urls(processor.probe_workload_urls(channels))
+    path = sharding.write_workload(directory, urls, channels, template_channels)
+    logger.info(f"分片工作集已写入: {path}，待探测URL {len(urls)} 个")
+
+async def shard_probe(directory, index, count):
+    """多机分片第二步：在本机探测第 index 个分片（共 count 个），写出分片结果"""
+    setup_logging()
+    workload = sharding.load_workload(directory)
+    urls = sharding.split_shards(workload["urls"], count)[index]
+    logger.info(f"分片 {index}/{count}: 探测 {len(urls)} 个URL")
+    processor = IPTVProcessor("demo.txt")
+    results = await sharding.probe_urls(urls, processor.probe_options())
+    path = sharding.write_shard_results(directory, index, count, results)
+    logger.info(f"分片结果已写入: {path}")
+
+async def shard_merge(directory):
+    """多机分片第三步：合并各分片结果，排序并生成输出文件"""
+    setup_logging()
+    workload = sharding.load_workload(directory)
+    results, loaded, count = sharding.load_shard_results(directory)
+    if count is None:
+        logger.warning("未找到分片结果，全部URL将在本机探测")
+    elif loaded < count:
+        logger.warning(f"只找到 {loaded}/{count} 个分片结果，缺失的URL将在本机探测")
+    processor = IPTVProcessor("demo.txt")
+    processor.shard_results = results
+    async with processor:
+        with processor.stats.span("process_channel_links"):
+            sorted_channels = await processor.process_channel_links(workload["channels"])
+    with processor.stats.span("update_channel_urls_m3u"):
+        processor.update_channel_urls_m3u(sorted_channels, workload["template_channels"])
+    processor.write_run_stats()
+    logger.info("分片结果合并完成")
+
+def parse_args(argv=None):
+    default_dir = getattr(config, 'sharding_config', {}).get('dir', os.path.join('output', 'shards'))
+    parser = argparse.ArgumentParser(description="IPTV 直播源检测与更新")
+    subparsers = parser.add_subparsers(dest="command")
+    run_parser = subparsers.add_parser("run", help="完整运行一次（默认）")
+    run_parser.add_argument("--processes", type=int, help="本地分片探测的进程数")
+    subparsers.add_parser("serve", help="常驻服务模式")
+    plan_parser = subparsers.add_parser("shard-plan", help="多机分片：生成待探测的工作集")
+    plan_parser.add_argument("--dir", default=default_dir)
+    probe_parser = subparsers.add_parser("shard-probe", help="多机分片：探测一个分片")
+    probe_parser.add_argument("--index", type=int, required=True)
+    probe_parser.add_argument("--count", type=int, required=True)
+    probe_parser.add_argument("--dir", default=default_dir)
+    merge_parser = subparsers.add_parser("shard-merge", help="多机分片：合并结果并生成输出")
+    merge_parser.add_argument("--dir", default=default_dir)
+    batch_parser = subparsers.add_parser("batch", help="批量模式：按 batch_config 生成多个模板的输出")
+    batch_parser.add_argument("--processes", type=int, help="本地分片探测的进程数")
+    stage_parser = subparsers.add_parser("stage", help="分阶段运行：从检查点继续，如 stage render、stage match render")
+    stage_parser.add_argument("first", choices=STAGES)
+    stage_parser.add_argument("last", nargs="?", choices=STAGES, help="运行到的最后一个阶段，默认与 first 相同")
+    stage_parser.add_argument("--processes", type=int, help="本地分片探测的进程数")
+    args = parser.parse_args(argv)
+    if args.command == "stage" and args.last and STAGES.index(args.last) < STAGES.index(args.first):
+        parser.error("last 阶段不能在 first 之前")
+    if args.command == "shard-probe" and not 0 <= args.index < args.count:
+        parser.error("--index 必须在 0 到 --count-1 之间")
+    return args
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    args = parse_args()
+    if args.command == "serve":
+        asyncio.run(serve())
+    elif args.command == "shard-plan":
+        asyncio.run(shard_plan(args.dir))
+    elif args.command == "shard-probe":
+        asyncio.run(shard_probe(args.dir, args.index, args.count))
+    elif args.command == "shard-merge":
+        asyncio.run(shard_merge(args.dir))
+    elif args.command == "batch":
+        asyncio.run(batch(args.processes))
+    elif args.command == "stage":
+        asyncio.run(run_stages(args.first, args.last, args.processes))
+    else:
+        asyncio.run(main(getattr(args, 'processes', None)))
\ No newline at end of file
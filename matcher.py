@@ -0,0 +1,387 @@
+import logging
+import re
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger("IPTV_Processor")
+
+# 频道名称清理规则（按顺序依次应用，与原逐对匹配逻辑保持一致）
+CLEAN_PATTERNS = [
+    re.compile(pattern) for pattern in (
+        r'★\s*', r'☆\s*', r'●\s*', r'○\s*', r'◆\s*', r'◇\s*',
+        r'\[\d+\]', r'【\d+】', r'\(.*?\)', r'\[.*?\]', r'（.*?）', r'【.*?】'
+    )
+]
+
+
+def clean_channel_name(name):
+    """清理频道名称"""
+    cleaned = name
+    for pattern in CLEAN_PATTERNS:
+        cleaned = pattern.sub('', cleaned)
+    return cleaned.strip()
+
+
+# 模糊匹配规则（按顺序应用）；匹配记录中的规则为双方名称用到的最后一条规则
+RULE_EXACT = "exact"
+RULE_CLEAN = "clean"
+RULE_WIDTH = "width"
+RULE_CASE = "case"
+RULE_SEPARATOR = "separator"
+RULE_QUALITY = "quality"
+RULE_CCTV = "cctv"
+RULE_ALIAS = "alias"
+RULE_ORDER = [RULE_EXACT, RULE_CLEAN, RULE_WIDTH, RULE_CASE, RULE_QUALITY, RULE_SEPARATOR, RULE_CCTV, RULE_ALIAS]
+
+SEPARATOR_PATTERN = re.compile(r'[\s\-_·•.|/:]+')
+# 清晰度后缀（连同前面的分隔符）；4K/8K 紧跟在字母或数字后，或经分隔符跟在 CCTV 后时不去掉
+# （CCTV4K、CCTV-4K 是单独的频道），这一判断在去掉分隔符之前进行，因此需要跳过分隔符
+QUALITY_PATTERN = re.compile(
+    r'(?:[\s\-_·•.|/:]*(?:超高清|高清|超清|标清|蓝光|FHD|UHD|HD|SD|HEVC|H265|H264|1080P|720P|50FPS)'
+    r'|(?<![0-9A-Z\s\-_·•.|/:])[48]K'
+    r'|(?<!CCTV)(?<![\s\-_·•.|/:])[\s\-_·•.|/:]+[48]K)$'
+)
+# CCTV 数字后的频道描述（只去掉已知描述，CCTV4欧洲 等仍是不同的频道），以及数字前的 0
+CCTV_PATTERN = re.compile(
+    r'^CCTV0*(\d+\+?)(?:综合|财经|综艺|中文国际|体育|体育赛事|电影|国防军事|电视剧|纪录|科教|戏曲|'
+    r'社会与法|新闻|少儿|音乐|农业农村|奥林匹克)?$'
+)
+
+
+class ChannelNormalizer:
+    """频道名称规范化：把名称变成匹配用的键
+
+    在 clean_channel_name 之后依次应用：全角转半角（NFKC）、转大写、去掉清晰度后缀
+    （高清/HD/4K 等）、去掉分隔符、统一 CCTV 名称，最后查别名表。
+    每个不同的名称只计算一次（见 ChannelIndex 的缓存），模板频道通过字典查找匹配，
+    不做逐对比较。fuzzy 为 False 时只做 clean_channel_name，与原匹配规则一致。
+    """
+
+    def __init__(self, fuzzy=True, aliases=None):
+        self.fuzzy = fuzzy
+        # {规范化后的别名: 规范化后的模板名}
+        self.aliases = {}
+        for canonical, names in (aliases or {}).items():
+            self.add_alias(canonical, names)
+
+    @classmethod
+    def from_config(cls, matching_config):
+        normalizer = cls(fuzzy=matching_config.get('fuzzy', True))
+        alias_file = matching_config.get('alias_file')
+        if alias_file:
+            normalizer.load_aliases(alias_file)
+        return normalizer
+
+    def add_alias(self, canonical, names):
+        target, _ = self._normalize(canonical)
+        for name in names:
+            key, _ = self._normalize(name)
+            if key and key != target:
+                self.aliases[key] = target
+
+    def load_aliases(self, path):
+        """读取别名文件：每行 "模板频道名,别名1,别名2,..."，# 开头为注释，文件不存在时忽略"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line or line.startswith("#"):
+                        continue
+                    names = [name.strip() for name in line.split(",") if name.strip()]
+                    if len(names) > 1:
+                        self.add_alias(names[0], names[1:])
+        except FileNotFoundError:
+            return
+        logger.info(f"频道别名已加载: {path}，共 {len(self.aliases)} 个")
+
+    def _normalize(self, name):
+        """不含别名的规范化，返回 (键, 最后一条改变了名称的规则)"""
+        key = clean_channel_name(name)
+        rule = RULE_CLEAN if key != name else RULE_EXACT
+        if not self.fuzzy:
+            return key, rule
+        for stage, func in (
+            (RULE_WIDTH, lambda value: unicodedata.normalize("NFKC", value)),
+            (RULE_CASE, str.upper),
+            (RULE_QUALITY, self._strip_quality),
+            (RULE_SEPARATOR, lambda value: SEPARATOR_PATTERN.sub('', value)),
+            (RULE_CCTV, lambda value: CCTV_PATTERN.sub(r'CCTV\1', value)),
+        ):
+            changed = func(key)
+            if changed != key and changed:
+                key = changed
+                rule = stage
+        return key, rule
+
+    @staticmethod
+    def _strip_quality(value):
+        while True:
+            stripped = QUALITY_PATTERN.sub('', value)
+            if stripped == value or not stripped:
+                return value
+            value = stripped
+
+    def normalize(self, name):
+        """返回 (匹配键, 规则)"""
+        key, rule = self._normalize(name)
+        target = self.aliases.get(key)
+        if target is not None:
+            return target, RULE_ALIAS
+        return key, rule
+
+    def key(self, name):
+        return self.normalize(name)[0]
+
+    def check_template(self, template_channels):
+        """检查模板频道的匹配键
+
+        与某个模板频道同名的别名不生效（否则两个频道会互相匹配到对方的链接）；
+        模糊规则把不同的模板频道变成同一个键时给出警告（它们会匹配到相同的URL）。
+        """
+        names = [name for channel_list in template_channels.values() for name in channel_list]
+        own_keys = {}
+        for name in names:
+            own_keys.setdefault(self._normalize(name)[0], name)
+        for alias_key in [alias_key for alias_key in self.aliases if alias_key in own_keys]:
+            target = self.aliases.pop(alias_key)
+            logger.warning(f"别名 {own_keys[alias_key]} 是单独的模板频道，不作为 {target} 的别名")
+        seen = {}
+        for name in names:
+            key = self.key(name)
+            other = seen.setdefault(key, name)
+            if other != name:
+                logger.warning(f"模板频道 {other} 和 {name} 规范化后相同（{key}），将匹配到相同的链接")
+
+
+def stronger_rule(first, second):
+    """两条规则中更靠后（更宽松）的一条"""
+    return first if RULE_ORDER.index(first) >= RULE_ORDER.index(second) else second
+
+
+class ChannelIndex:
+    """在线频道名称索引：清理后的名称 -> URL列表
+
+    每个在线频道名称只清理一次，模板频道通过字典查找完成匹配。
+    条目可以按任意到达顺序加入（多个源并发流式解析），查找结果按
+    "分类首次出现顺序 -> 源顺序 -> 源内顺序" 排列，与把各源按顺序合并成
+    {分类: [(频道名, URL), ...]} 后逐个遍历的结果一致。
+
+    指定 wanted（模板频道名的匹配键集合）时，不在其中的频道直接丢弃，
+    内存只与匹配到的条目数有关。名称通过 normalizer（ChannelNormalizer）变成匹配键，
+    默认只做 clean_channel_name；每个条目记录在线名称和命中的规则，供 match_details 审计。
+    """
+
+    def __init__(self, wanted=None, normalizer=None):
+        self.wanted = wanted
+        self.normalizer = normalizer or ChannelNormalizer(fuzzy=False)
+        self._index = {}
+        self._clean_cache = {}
+        self._category_ranks = {}
+        self._rank_cache = None
+        self._seq = 0
+        self.total_urls = 0
+
+    @classmethod
+    def from_channels(cls, all_channels, wanted=None, normalizer=None):
+        """从 {分类: [(频道名, URL), ...]} 构建索引"""
+        index = cls(wanted, normalizer)
+        for category, channel_list in all_channels.items():
+            index.add_category(category)
+            for channel_name, channel_url in channel_list:
+                index.add(channel_name, channel_url, category)
+        return index
+
+    def _normalized(self, name):
+        """(匹配键, 规则)，带缓存，重复的名称只做一次正则处理"""
+        result = self._clean_cache.get(name)
+        if result is None:
+            result = self.normalizer.normalize(name)
+            self._clean_cache[name] = result
+        return result
+
+    def normalize(self, name):
+        """频道名称的匹配键"""
+        return self._normalized(name)[0]
+
+    def add_category(self, category, source=0):
+        """登记分类在某个源中的首次出现位置"""
+        ranks = self._category_ranks.setdefault(category, {})
+        if source not in ranks:
+            ranks[source] = self._seq
+            self._rank_cache = None
+        self._seq += 1
+
+    def add(self, channel_name, channel_url, category=None, source=0):
+        """加入一个在线频道"""
+        self.total_urls += 1
+        key, rule = self._normalized(channel_name)
+        if self.wanted is not None and key not in self.wanted:
+            return
+        if source not in self._category_ranks.get(category, ()):
+            self.add_category(category, source)
+        entry = (source, self._seq, category, channel_url, channel_name, rule)
+        self._seq += 1
+        entries = self._index.get(key)
+        if entries is None:
+            self._index[key] = [entry]
+        else:
+            entries.append(entry)
+
+    def add_store(self, store, source=0):
+        """按原顺序加入 ChannelStore 中的全部分类和条目，结果与逐条 add 相同
+
+        每个不同的频道名只取一次匹配键，未被 wanted 选中的条目不解码 URL。
+        """
+        names = store.names
+        keys = [self._normalized(name) for name in names]
+        wanted = self.wanted
+        if wanted is None:
+            kept_names = None
+        else:
+            kept_names = {name_id for name_id, (key, _) in enumerate(keys) if key in wanted}
+        categories = store.categories
+        marks = list(zip(store.mark_positions, store.mark_categories))
+        mark_index = 0
+        url_ends = store.url_ends
+        buffer = store.url_buffer
+        for position, (category_id, name_id) in enumerate(zip(store.entry_categories, store.entry_names)):
+            while mark_index < len(marks) and marks[mark_index][0] <= position:
+                self.add_category(categories[marks[mark_index][1]], source)
+                mark_index += 1
+            self.total_urls += 1
+            if kept_names is not None and name_id not in kept_names:
+                continue
+            category = categories[category_id]
+            if source not in self._category_ranks.get(category, ()):
+                self.add_category(category, source)
+            key, rule = keys[name_id]
+            start = url_ends[position - 1] if position else 0
+            channel_url = buffer[start:url_ends[position]].decode("utf-8")
+            entry = (source, self._seq, category, channel_url, names[name_id], rule)
+            self._seq += 1
+            entries = self._index.get(key)
+            if entries is None:
+                self._index[key] = [entry]
+            else:
+                entries.append(entry)
+        for _, category_id in marks[mark_index:]:
+            self.add_category(categories[category_id], source)
+
+    def discard_source(self, source):
+        """移除某个源的全部条目（源获取中途失败后重试前调用）"""
+        for key, entries in list(self._index.items()):
+            kept = [entry for entry in entries if entry[0] != source]
+            if kept:
+                self._index[key] = kept
+            else:
+                del self._index[key]
+        for ranks in self._category_ranks.values():
+            ranks.pop(source, None)
+        self._rank_cache = None
+
+    def duplication_report(self, key_func):
+        """按源统计匹配条目中的重复URL
+
+        同一频道下规范化键相同、且已由更早的源（或同一源更早的条目）提供的URL
+        计为重复。返回 {源序号: (条目数, 重复数)}。
+        """
+        entries = sorted(
+            (entry[0], entry[1], name_key, entry[3])
+            for name_key, name_entries in self._index.items() for entry in name_entries
+        )
+        report = {}
+        seen = set()
+        for source, _, name_key, url in entries:
+            total, duplicates = report.get(source, (0, 0))
+            key = (name_key, key_func(url))
+            if key in seen:
+                duplicates += 1
+            else:
+                seen.add(key)
+            report[source] = (total + 1, duplicates)
+        return report
+
+    def source_sink(self, source):
+        """返回绑定到指定源序号的写入器，供解析器逐条写入"""
+        return SourceSink(self, source)
+
+    def _category_order(self):
+        if self._rank_cache is None:
+            self._rank_cache = {
+                category: min(ranks.items()) for category, ranks in self._category_ranks.items() if ranks
+            }
+        return self._rank_cache
+
+    def lookup(self, template_name):
+        """查找模板频道对应的URL列表"""
+        entries = self._index.get(self.normalize(template_name))
+        if not entries:
+            return []
+        order = self._category_order()
+        entries = sorted(entries, key=lambda entry: (order[entry[2]], entry[0], entry[1]))
+        return [entry[3] for entry in entries]
+
+    def match_details(self, template_name):
+        """模板频道匹配到的在线名称：[(在线名称, 规则, URL数), ...]，按首次出现顺序"""
+        template_key, template_rule = self._normalized(template_name)
+        details = OrderedDict()
+        for entry in sorted(self._index.get(template_key, ()), key=lambda entry: (entry[0], entry[1])):
+            online_name = entry[4]
+            if online_name == template_name:
+                rule = RULE_EXACT
+            else:
+                rule = stronger_rule(entry[5], template_rule)
+            count = details.get((online_name, rule), 0)
+            details[(online_name, rule)] = count + 1
+        return [(online_name, rule, count) for (online_name, rule), count in details.items()]
+
+    def __len__(self):
+        return len(self._index)
+
+
+class SourceSink:
+    """把解析出的条目写入索引，并带上所属源的序号"""
+
+    def __init__(self, index, source):
+        self.index = index
+        self.source = source
+
+    def add_category(self, category):
+        self.index.add_category(category, self.source)
+
+    def add(self, category, channel_name, channel_url):
+        self.index.add(channel_name, channel_url, category, self.source)
+
+    def add_store(self, store):
+        self.index.add_store(store, self.source)
+
+    def discard(self):
+        """丢弃该源已写入的条目"""
+        self.index.discard_source(self.source)
+
+
+def match_template(template_channels, index, audit=None):
+    """按模板匹配索引中的频道，返回 (匹配结果, 匹配URL数, 未匹配频道列表)
+
+    传入 audit 字典时写入 {模板频道名: index.match_details(模板频道名)}。
+    """
+    matched_channels = OrderedDict()
+    match_count = 0
+    missing = []
+
+    for category, channel_list in template_channels.items():
+        matched_channels[category] = OrderedDict()
+
+        for channel_name in channel_list:
+            urls = index.lookup(channel_name)
+            if urls:
+                # 模板中重复出现的频道会再次追加，保持与原逐对匹配一致
+                matched_channels[category].setdefault(channel_name, []).extend(urls)
+                match_count += len(urls)
+                if audit is not None and channel_name not in audit:
+                    audit[channel_name] = index.match_details(channel_name)
+            else:
+                missing.append(channel_name)
+                matched_channels[category][channel_name] = []
+
+    return matched_channels, match_count, missing
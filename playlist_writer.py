@@ -0,0 +1,154 @@
+import gzip
+import os
+from collections import OrderedDict
+
+# 第 i 条线路的 EXTINF 行开头（含上一行URL的换行），各频道共用
+_TVG_ID_PREFIXES = []
+
+
+class PlaylistVariant:
+    """一种输出变体（如主文件、带线路后缀、仅IPv4），M3U 和 TXT 各一个内存缓冲"""
+
+    def __init__(self, basename, accept=None, suffix=None):
+        self.basename = basename
+        # accept(url) 为 False 的URL不写入本变体；suffix(序号, url) 返回追加在URL后的线路标识
+        self.accept = accept
+        self.suffix = suffix
+        self.m3u = []
+        self.txt = []
+
+
+class PlaylistRenderer:
+    """单次遍历频道数据，同时生成所有输出变体
+
+    每个频道在每个变体中只追加一整块内容：块内各行由 join 一次拼成，不逐行格式化，
+    拼好后立即编码为 UTF-8；内容与主输出相同的变体直接复用同一块。
+    最后每个文件一次 b"".join，不在文件句柄上逐条 write，也不生成整文件大小的中间字符串。
+    """
+
+    def __init__(self, variants, max_urls_per_channel, logo_base_url, epg_urls=(), announcements=(), logo_func=None):
+        self.variants = variants
+        self.max_urls_per_channel = max_urls_per_channel
+        self.logo_base_url = logo_base_url
+        # logo_func(频道名) 返回 Logo 地址，None 表示不写 tvg-logo；未提供时拼接 logo_base_url
+        self.logo_func = logo_func
+        self.epg_urls = list(epg_urls)
+        self.announcements = announcements
+
+    @staticmethod
+    def _m3u_block(extinf_suffix, urls):
+        """一个频道的 M3U 文本：[tvg-id 前缀, EXTINF 其余部分, URL] 交错放入列表后一次 join"""
+        count = len(urls)
+        while len(_TVG_ID_PREFIXES) < count:
+            _TVG_ID_PREFIXES.append(f'\n#EXTINF:-1 tvg-id="{len(_TVG_ID_PREFIXES) + 1}')
+        parts = [None] * (3 * count)
+        parts[0::3] = _TVG_ID_PREFIXES[:count]
+        parts[1::3] = [extinf_suffix] * count
+        parts[2::3] = urls
+        # 第一个前缀带的换行去掉，末尾补上最后一个URL的换行
+        parts[0] = parts[0][1:]
+        parts.append("\n")
+        return "".join(parts)
+
+    def render(self, channels, template_channels, current_date):
+        """返回 OrderedDict{文件名: UTF-8 内容}"""
+        variants = self.variants
+        m3u_header = f"""#EXTM3U x-tvg-url="{','.join(self.epg_urls)}"\n""".encode("utf-8")
+        for variant in variants:
+            variant.m3u.append(m3u_header)
+
+        # 公告频道
+        for group in self.announcements:
+            group_title = group.get('channel', '公告')
+            genre_line = f"{group_title},#genre#\n".encode("utf-8")
+            for variant in variants:
+                variant.txt.append(genre_line)
+            for announcement in group.get('entries', []):
+                # 未设置名称的公告显示生成日期（不修改配置，常驻模式下每次刷新都是当天日期）
+                name = announcement.get('name')
+                if name is None:
+                    name = current_date
+                url = announcement.get('url', '')
+                m3u_entry = (f"""#EXTINF:-1 tvg-id="1" tvg-name="{name}" tvg-logo="{announcement.get('logo', '')}" """
+                             f"""group-title="{group_title}",{name}\n{url}\n""").encode("utf-8")
+                txt_entry = f"{name},{url}\n".encode("utf-8")
+                for variant in variants:
+                    variant.m3u.append(m3u_entry)
+                    variant.txt.append(txt_entry)
+
+        # 频道数据：每个频道的各行先拼成整块再追加，未过滤的变体直接复用主块
+        written_channels = set()
+        max_urls = self.max_urls_per_channel
+        logo_base_url = self.logo_base_url
+        logo_func = self.logo_func
+        for category, channel_list in template_channels.items():
+            genre_line = f"{category},#genre#\n".encode("utf-8")
+            for variant in variants:
+                variant.txt.append(genre_line)
+
+            category_channels = channels.get(category)
+            if not category_channels:
+                continue
+            for channel_name in channel_list:
+                if channel_name in written_channels:
+                    continue
+                all_urls = category_channels.get(channel_name)
+                if not all_urls:
+                    continue
+                urls = all_urls[:max_urls]
+                logo = f"{logo_base_url}{channel_name}.png" if logo_func is None else logo_func(channel_name)
+                logo_attr = f' tvg-logo="{logo}"' if logo else ""
+                extinf_suffix = f'" tvg-name="{channel_name}"{logo_attr} group-title="{category}",{channel_name}\n'
+                txt_separator = f"\n{channel_name},"
+                plain_m3u = plain_txt = None
+                for variant in variants:
+                    variant_urls = urls
+                    if variant.accept is not None:
+                        # 过滤变体从完整的排序列表中各取前 max_urls 个
+                        variant_urls = [url for url in all_urls if variant.accept(url)][:max_urls]
+                        if not variant_urls:
+                            continue
+                    if variant.suffix is not None:
+                        variant_urls = [url + variant.suffix(index, url) for index, url in enumerate(variant_urls)]
+                    elif variant_urls == urls:
+                        # 与主输出内容相同
+                        if plain_m3u is None:
+                            plain_m3u = self._m3u_block(extinf_suffix, urls).encode("utf-8")
+                            plain_txt = f"{channel_name},{txt_separator.join(urls)}\n".encode("utf-8")
+                        variant.m3u.append(plain_m3u)
+                        variant.txt.append(plain_txt)
+                        continue
+                    variant.m3u.append(self._m3u_block(extinf_suffix, variant_urls).encode("utf-8"))
+                    variant.txt.append(f"{channel_name},{txt_separator.join(variant_urls)}\n".encode("utf-8"))
+                written_channels.add(channel_name)
+
+        playlists = OrderedDict()
+        for variant in variants:
+            playlists[f"{variant.basename}.m3u"] = b"".join(variant.m3u)
+            playlists[f"{variant.basename}.txt"] = b"".join(variant.txt)
+            variant.m3u = []
+            variant.txt = []
+        return playlists
+
+
+def write_file_atomic(path, data):
+    """先写同目录的临时文件再 os.replace，读取方只会看到旧文件或完整的新文件"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_playlist_files(output_dir, playlists, gzip_siblings=False):
+    """原子写出所有播放列表，可选同时写出 .gz 压缩副本，返回写入的文件路径"""
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for name, data in playlists.items():
+        path = os.path.join(output_dir, name)
+        write_file_atomic(path, data)
+        written.append(path)
+        if gzip_siblings:
+            # mtime=0：内容不变时压缩文件也不变
+            write_file_atomic(f"{path}.gz", gzip.compress(data, compresslevel=6, mtime=0))
+            written.append(f"{path}.gz")
+    return written
@@ -0,0 +1,115 @@
+import json
+import logging
+import os
+import time
+
+from url_utils import normalize_url
+
+logger = logging.getLogger("IPTV_Processor")
+
+# 探测状态：正数为HTTP状态码
+STATUS_TIMEOUT = -1
+STATUS_ERROR = 0
+# 连接阶段失败（拒绝连接、DNS 解析失败、连接超时），计入主机熔断
+STATUS_CONNECT_ERROR = -2
+
+CACHE_VERSION = 1
+
+
+class ProbeCache:
+    """链接探测结果的磁盘缓存
+
+    以规范化URL为键，记录 [响应时间, 状态, 时间戳]，深度探测时追加吞吐量。
+    可用链接和失效链接分别使用不同的有效期，过期条目视为未命中并在保存时清理。
+    """
+
+    def __init__(self, path, good_ttl=86400, dead_ttl=10800):
+        self.path = path
+        self.good_ttl = good_ttl
+        self.dead_ttl = dead_ttl
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, cache_config):
+        """根据配置创建缓存，未启用时返回 None"""
+        if not cache_config.get('enabled', False):
+            return None
+        cache = cls(
+            cache_config.get('path', os.path.join('output', 'probe_cache.json')),
+            good_ttl=cache_config.get('good_ttl', 86400),
+            dead_ttl=cache_config.get('dead_ttl', 10800),
+        )
+        cache.load()
+        return cache
+
+    def load(self):
+        """从磁盘加载缓存，文件缺失或损坏时从空缓存开始"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                self.entries = data.get("entries", {})
+            logger.info(f"探测缓存已加载: {self.path}，条目数: {len(self.entries)}")
+        except FileNotFoundError:
+            self.entries = {}
+        except (ValueError, OSError) as e:
+            logger.warning(f"探测缓存读取失败，将重新探测: {e}")
+            self.entries = {}
+
+    def is_fresh(self, entry, now):
+        """判断缓存条目是否仍在有效期内"""
+        latency, timestamp = entry[0], entry[2]
+        ttl = self.dead_ttl if latency is None else self.good_ttl
+        return now - timestamp < ttl
+
+    def get(self, url, now=None):
+        """读取未过期的响应时间，未命中返回 None，失效链接返回 inf"""
+        entry = self.get_entry(url, now)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, url, now=None, require_throughput=False):
+        """读取未过期的 (响应时间, 状态, 吞吐量)，未命中返回 None
+
+        require_throughput 为 True 时，缺少吞吐量的可用记录（来自普通探测）视为未命中。
+        """
+        now = time.time() if now is None else now
+        entry = self.entries.get(normalize_url(url))
+        if entry is None or not self.is_fresh(entry, now) or (
+                require_throughput and entry[0] is not None and len(entry) < 4):
+            self.misses += 1
+            return None
+        self.hits += 1
+        latency = float('inf') if entry[0] is None else entry[0]
+        throughput = entry[3] if len(entry) > 3 else None
+        return latency, entry[1], throughput
+
+    def put(self, url, latency, status, throughput=None, now=None):
+        """写入一次探测结果"""
+        now = time.time() if now is None else now
+        stored_latency = None if latency == float('inf') else round(latency, 4)
+        entry = [stored_latency, status, int(now)]
+        if throughput is not None:
+            entry.append(int(throughput))
+        self.entries[normalize_url(url)] = entry
+
+    def save(self):
+        """清理过期条目后原子写回磁盘"""
+        now = time.time()
+        self.entries = {
+            key: entry for key, entry in self.entries.items() if self.is_fresh(entry, now)
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "entries": self.entries}, f,
+                      ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    def hit_rate(self):
+        """本次运行的缓存命中率"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
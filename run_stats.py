@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger("IPTV_Processor")
+
+# 探测延迟直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10)
+
+
+class RunStats:
+    """一次运行的统计：各阶段耗时、计数器、每个源的明细和探测延迟直方图"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.stages = OrderedDict()
+        self.counters = OrderedDict()
+        self.sources = OrderedDict()
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+
+    @contextmanager
+    def span(self, stage):
+        """记录一个阶段的耗时（同名阶段累加），可包住 await"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[stage] = self.stages.get(stage, 0.0) + time.perf_counter() - start
+
+    def incr(self, name, value=1):
+        """累加计数器"""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe_latency(self, seconds):
+        """记录一次成功探测的延迟"""
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.latency_buckets[i] += 1
+                break
+        else:
+            self.latency_buckets[-1] += 1
+        self.latency_sum += seconds
+        self.latency_count += 1
+
+    def record_source(self, url, **fields):
+        """记录单个源的获取明细"""
+        self.sources.setdefault(url, {}).update(fields)
+
+    def to_dict(self):
+        """生成报告内容"""
+        histogram = OrderedDict()
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.latency_buckets):
+            cumulative += count
+            histogram[str(bound)] = cumulative
+        histogram["+Inf"] = self.latency_count
+        return {
+            "started_at": int(self.started_at),
+            "duration": round(time.time() - self.started_at, 3),
+            "stages": {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            "counters": dict(self.counters),
+            "sources": self.sources,
+            "probe_latency": {
+                "buckets": histogram,
+                "sum": round(self.latency_sum, 4),
+                "count": self.latency_count,
+            },
+        }
+
+    def write_json(self, path):
+        """写出 JSON 运行报告"""
+        write_atomic(path, json.dumps(self.to_dict(), ensure_ascii=False, indent=2))
+        logger.info(f"运行报告已写入: {path}")
+
+    def write_prometheus(self, path):
+        """写出 Prometheus textfile 格式的指标（供 node_exporter textfile collector 读取）"""
+        report = self.to_dict()
+        lines = [
+            "# HELP iptv_run_duration_seconds Wall time of the last run.",
+            "# TYPE iptv_run_duration_seconds gauge",
+            f"iptv_run_duration_seconds {report['duration']}",
+            "# HELP iptv_run_timestamp_seconds Start time of the last run.",
+            "# TYPE iptv_run_timestamp_seconds gauge",
+            f"iptv_run_timestamp_seconds {report['started_at']}",
+            "# HELP iptv_stage_duration_seconds Wall time per pipeline stage.",
+            "# TYPE iptv_stage_duration_seconds gauge",
+        ]
+        for stage, seconds in report["stages"].items():
+            lines.append(f'iptv_stage_duration_seconds{{stage="{escape_label(stage)}"}} {seconds}')
+
+        lines += ["# HELP iptv_source_fetch_seconds Fetch time per source.",
+                  "# TYPE iptv_source_fetch_seconds gauge"]
+        for url, fields in report["sources"].items():
+            if "duration" in fields:
+                lines.append(f'iptv_source_fetch_seconds{{source="{escape_label(url)}"}} {fields["duration"]}')
+
+        # 计数每次运行从 0 开始，按 gauge 写出（counter 会让 rate() 把每次运行当作重置）
+        for name, value in report["counters"].items():
+            metric = f"iptv_{name}"
+            lines += [f"# HELP {metric} Count of {name} in the last run.", f"# TYPE {metric} gauge", f"{metric} {value}"]
+
+        latency = report["probe_latency"]
+        lines += ["# HELP iptv_probe_latency_seconds Latency of successful link probes.",
+                  "# TYPE iptv_probe_latency_seconds histogram"]
+        for bound, count in latency["buckets"].items():
+            lines.append(f'iptv_probe_latency_seconds_bucket{{le="{bound}"}} {count}')
+        lines += [f"iptv_probe_latency_seconds_sum {latency['sum']}",
+                  f"iptv_probe_latency_seconds_count {latency['count']}"]
+
+        write_atomic(path, "\n".join(lines) + "\n")
+        logger.info(f"Prometheus 指标已写入: {path}")
+
+
+def escape_label(value):
+    """转义 Prometheus 标签值"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def write_atomic(path, content):
+    """先写临时文件再替换，读取方不会看到写了一半的文件"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
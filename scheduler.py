@@ -0,0 +1,265 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+
+from probe_cache import STATUS_CONNECT_ERROR
+
+logger = logging.getLogger("IPTV_Processor")
+
+# 主机并发名额已满、需要稍后重试的任务
+DEFERRED = object()
+
+
+class ProbeScheduler:
+    """全局探测调度器
+
+    把所有频道的 (分类, 频道, URL) 放入同一个队列，由固定数量的工作协程
+    共同消费，并发上限对整个运行生效，而不是每个频道各自一个信号量。
+
+    probe_func(url) 发起网络探测并返回 (响应时间, 状态)；lookup_func(url)
+    可选，返回无需网络即可得到的响应时间（缓存、免检源），否则返回 None。
+    score_func(url, 响应时间) 可选，把网络探测的响应时间换算成排序得分（如历史健康得分），
+    竞速门限仍只比较本次探测的响应时间。
+    设置 host_guard 时，网络探测受按主机的熔断和并发上限约束，
+    主机名额已满的任务挂起到该主机的等待队列，工作协程继续处理其他主机；
+    该主机每释放一个名额，放回一个挂起的任务。
+    设置 key_func（如 normalize_url）时，规范化后相同的URL只探测一次，
+    结果分发给所有引用它的频道。
+    设置 lane_func(url) 和 lane_limits{通道: 并发上限} 时，返回同一通道的URL
+    （如 IPv6 线路）另有独立的并发上限，名额已满的任务同样挂起到该通道的等待队列。
+
+    设置 race_quota 时启用竞速模式，每个频道的排序规则为：
+    1. 收到 race_quota 个可用结果后，该频道进入"已决出"状态；
+    2. 以第 race_quota 快的响应时间为门限，仍在进行的探测一旦耗时超过门限
+       就不可能再进入前 race_quota 名，立即取消；
+    3. 已决出频道中尚未开始的探测直接跳过；
+    4. 门限和耗时都是本次探测的响应时间（不是 score_func 的得分），
+       被取消的探测确实比已收到的结果慢；
+    5. 被取消或跳过的URL视为失效（inf），按源顺序排在可用链接之后，
+       且不会写入探测缓存；这些URL记录在 unresolved 中。
+    """
+
+    def __init__(self, probe_func, concurrency=50, progress_interval=100, race_quota=None,
+                 lookup_func=None, host_guard=None, key_func=None, lane_func=None, lane_limits=None,
+                 score_func=None):
+        self.probe_func = probe_func
+        self.score_func = score_func
+        self.key_func = key_func
+        self.lane_func = lane_func
+        self.lane_limits = lane_limits or {}
+        self.lookup_func = lookup_func
+        self.host_guard = host_guard
+        self.concurrency = max(1, concurrency)
+        self.progress_interval = progress_interval
+        self.race_quota = race_quota
+        self.skipped = 0
+        self.cancelled = 0
+        self.unresolved = set()
+        self.deduplicated = 0
+
+    async def run(self, workload):
+        """执行探测任务
+
+        workload: [(分类, 频道名, URL), ...]
+        返回 OrderedDict{(分类, 频道名): [(URL, 响应时间), ...]}，组内保持原URL顺序
+        """
+        if not workload:
+            return OrderedDict()
+
+        loop = asyncio.get_running_loop()
+        results = [float('inf')] * len(workload)
+        groups = {}
+        queue = asyncio.Queue()
+        for job_index, (category, channel_name, url) in enumerate(workload):
+            key = (category, channel_name)
+            if key not in groups:
+                groups[key] = {"healthy": [], "running": {}, "decided": False}
+            queue.put_nowait((job_index, key, url))
+
+        total = len(workload)
+        done = 0
+        guard = self.host_guard
+        # 规范化URL -> 已完成的 (排序得分, 响应时间)，或正在进行的探测（Future）
+        shared = {}
+        # 已查找过且需要网络探测的任务，重新排队后不再重复查找（避免缓存未命中被重复计数）
+        looked_up = set()
+        # 各通道正在进行的探测数
+        lane_in_flight = {}
+        # 名额已满而挂起的任务：{("host"|"lane", 名称): deque[任务]}；deferred_by 记录任务被哪个名额阻塞
+        parked = {}
+        deferred_by = {}
+        # 被放回的任务 -> 放回它的名额；任务没有用上该名额（已决出、复用结果等）时转交下一个
+        woken = {}
+
+        def wake(blocker, count=1):
+            """名额释放后放回最多 count 个挂起的任务"""
+            jobs = parked.get(blocker)
+            while jobs and count > 0:
+                job = jobs.popleft()
+                woken[job[0]] = blocker
+                queue.put_nowait(job)
+                count -= 1
+
+        def release_host(host, *args, **kwargs):
+            guard.release(host, *args, **kwargs)
+            # 主机熔断后全部放回，由它们直接短路；否则按空出的名额数放回
+            wake(("host", host), total if guard.is_open(host) else max(1, guard.available(host)))
+
+        async def network_probe(job_index, state, url):
+            """发起网络探测，返回响应时间；主机名额已满返回 DEFERRED，被取消返回 None"""
+            lane = self.lane_func(url) if self.lane_func else None
+            if lane is not None and lane_in_flight.get(lane, 0) >= self.lane_limits.get(lane, self.concurrency):
+                deferred_by[job_index] = ("lane", lane)
+                return DEFERRED
+            host = None
+            if guard is not None:
+                host = guard.host_of(url)
+                if guard.is_open(host):
+                    guard.short_circuit(host)
+                    return float('inf')
+                if not guard.try_acquire(host):
+                    deferred_by[job_index] = ("host", host)
+                    return DEFERRED
+
+            if lane is not None:
+                lane_in_flight[lane] = lane_in_flight.get(lane, 0) + 1
+            woken.pop(job_index, None)
+
+            task = asyncio.ensure_future(self.probe_func(url))
+            state["running"][job_index] = (task, loop.time())
+            try:
+                await asyncio.wait([task])
+            finally:
+                state["running"].pop(job_index, None)
+                if lane is not None:
+                    lane_in_flight[lane] -= 1
+                    wake(("lane", lane))
+                if not task.done():
+                    task.cancel()
+                if host is not None and (task.cancelled() or not task.done()):
+                    release_host(host)
+
+            if task.cancelled():
+                self.cancelled += 1
+                self.unresolved.add(url)
+                return None
+            if task.exception() is not None:
+                logger.debug(f"链接检查异常 {url}: {task.exception()}")
+                if host is not None:
+                    release_host(host, failed=True)
+                return float('inf')
+
+            latency, status = task.result()
+            if host is not None:
+                release_host(host, latency if latency != float('inf') else None,
+                             failed=status <= 0, connect_failed=status == STATUS_CONNECT_ERROR)
+            return latency
+
+        async def probe(job_index, key, url):
+            """执行一个任务，主机名额已满时返回 False 以便稍后重试"""
+            state = groups[key]
+            if state["decided"]:
+                self.skipped += 1
+                self.unresolved.add(url)
+                return True
+
+            quality = None
+            if self.lookup_func and job_index not in looked_up:
+                quality = self.lookup_func(url)
+                looked_up.add(job_index)
+            latency = quality
+            if quality is None:
+                url_key = self.key_func(url) if self.key_func else url
+                shared_result = shared.get(url_key)
+                if shared_result is not None:
+                    # 同一规范化URL已在其他频道探测过（或正在探测），直接复用
+                    self.deduplicated += 1
+                    if isinstance(shared_result, asyncio.Future):
+                        shared_result = await asyncio.shield(shared_result)
+                        if shared_result is None:
+                            # 共享的探测被取消，重新排队自行探测
+                            return False
+                    quality, latency = shared_result
+                else:
+                    future = loop.create_future()
+                    shared[url_key] = future
+                    latency = await network_probe(job_index, state, url)
+                    if latency is DEFERRED or latency is None:
+                        del shared[url_key]
+                        future.set_result(None)
+                        return latency is None
+                    quality = self.score_func(url, latency) if self.score_func else latency
+                    shared[url_key] = (quality, latency)
+                    future.set_result((quality, latency))
+
+            results[job_index] = quality
+            if self.race_quota and latency != float('inf'):
+                state["healthy"].append(latency)
+                self._settle(state, loop)
+            return True
+
+        worker_count = min(self.concurrency, total)
+
+        async def worker():
+            nonlocal done
+            while True:
+                job = await queue.get()
+                if job is None:
+                    return
+                if not await probe(*job):
+                    blocker = deferred_by.pop(job[0], None)
+                    if blocker is None:
+                        # 共享的探测被取消，重新排队自行探测
+                        queue.put_nowait(job)
+                    else:
+                        # 名额已满：挂起到对应的等待队列，名额释放时再放回，不在队列中空转
+                        passed = woken.pop(job[0], blocker)
+                        if passed != blocker:
+                            wake(passed)
+                        parked.setdefault(blocker, deque()).append(job)
+                    continue
+                passed = woken.pop(job[0], None)
+                if passed is not None:
+                    wake(passed)
+                done += 1
+                if done % self.progress_interval == 0 or done == total:
+                    logger.info(f"探测进度: {done}/{total}")
+                if done == total:
+                    # 全部完成，通知所有工作协程退出
+                    for _ in range(worker_count):
+                        queue.put_nowait(None)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(worker_count)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+
+        if self.race_quota:
+            logger.info(f"竞速模式: 跳过 {self.skipped} 个、取消 {self.cancelled} 个无法胜出的探测")
+        if self.deduplicated:
+            logger.info(f"URL去重: {self.deduplicated} 个链接复用了其他频道的探测结果")
+        if guard is not None:
+            summary = guard.summary()
+            logger.info(f"主机熔断: 涉及主机 {summary['hosts']} 个，熔断 {summary['tripped_hosts']} 个，"
+                        f"短路跳过 {summary['short_circuited']} 个探测")
+
+        regrouped = OrderedDict()
+        for (category, channel_name, url), quality in zip(workload, results):
+            regrouped.setdefault((category, channel_name), []).append((url, quality))
+        return regrouped
+
+    def _settle(self, state, loop):
+        """可用结果达到配额后，取消已无法进入前几名的探测"""
+        if len(state["healthy"]) < self.race_quota:
+            return
+        state["decided"] = True
+        threshold = sorted(state["healthy"])[self.race_quota - 1]
+        now = loop.time()
+        for task, started in list(state["running"].values()):
+            remaining = threshold - (now - started)
+            if remaining <= 0:
+                task.cancel()
+            else:
+                loop.call_later(remaining, task.cancel)
@@ -0,0 +1,163 @@
+import asyncio
+import gzip
+import hashlib
+import logging
+import time
+from email.utils import formatdate
+
+from aiohttp import web
+
+logger = logging.getLogger("IPTV_Processor")
+
+# 按扩展名确定的响应类型
+CONTENT_TYPES = {
+    ".m3u": "audio/x-mpegurl; charset=utf-8",
+    ".txt": "text/plain; charset=utf-8",
+}
+
+
+class PlaylistBody:
+    """一个已生成的播放列表：原文、预压缩的 gzip 和对应的 ETag"""
+
+    def __init__(self, name, body, generated_at):
+        self.body = body
+        # mtime=0 让相同内容的压缩结果完全一致
+        self.gzip_body = gzip.compress(self.body, compresslevel=6, mtime=0)
+        digest = hashlib.sha1(self.body).hexdigest()[:20]
+        self.etag = f'"{digest}"'
+        self.gzip_etag = f'"{digest}-gz"'
+        self.content_type = CONTENT_TYPES.get(name[name.rfind("."):], "application/octet-stream")
+        self.last_modified = formatdate(generated_at, usegmt=True)
+
+
+class PlaylistServer:
+    """常驻服务：保持同一个 IPTVProcessor 和会话，后台定时刷新，从内存提供播放列表
+
+    每次刷新在后台完整生成新的播放列表后，一次性替换 self.playlists 引用；
+    请求处理只读取当前引用，不会看到生成了一半的内容，也不会被刷新阻塞。
+    """
+
+    def __init__(self, processor, host="0.0.0.0", port=8080, refresh_interval=21600, write_files=True):
+        self.processor = processor
+        self.host = host
+        self.port = port
+        self.refresh_interval = refresh_interval
+        self.write_files = write_files
+        self.playlists = {}
+        self.generated_at = None
+        self.last_error = None
+        self.refreshing = False
+        self.refresh_count = 0
+        self.last_stats = None
+
+    @classmethod
+    def from_config(cls, processor, serve_config):
+        return cls(
+            processor,
+            host=serve_config.get('host', '0.0.0.0'),
+            port=serve_config.get('port', 8080),
+            refresh_interval=serve_config.get('refresh_interval', 21600),
+            write_files=serve_config.get('write_files', True),
+        )
+
+    async def refresh(self):
+        """获取源、探测并生成播放列表，完成后原子替换"""
+        processor = self.processor
+        processor.begin_run()
+        self.refreshing = True
+        try:
+            channels, template_channels = await processor.filter_source_urls()
+            side_tasks = asyncio.gather(processor.update_epg(template_channels),
+                                        processor.update_logos(template_channels))
+            with processor.stats.span("process_channel_links"):
+                sorted_channels = await processor.process_channel_links(channels)
+            await side_tasks
+            with processor.stats.span("render_playlists"):
+                playlists = processor.render_playlists(sorted_channels, template_channels)
+                generated_at = time.time()
+                bodies = {name: PlaylistBody(name, body, generated_at) for name, body in playlists.items()}
+            # 单次赋值替换，正在处理的请求继续使用旧对象
+            self.playlists = bodies
+            self.generated_at = generated_at
+            self.last_error = None
+            self.refresh_count += 1
+            if self.write_files:
+                with processor.stats.span("update_channel_urls_m3u"):
+                    processor.write_playlists(playlists)
+            processor.write_run_stats()
+            self.last_stats = processor.stats.to_dict()
+            logger.info(f"播放列表已刷新: {', '.join(bodies)}")
+        finally:
+            self.refreshing = False
+
+    async def refresh_loop(self):
+        """按间隔刷新，单次失败不影响继续提供旧内容"""
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"刷新失败，继续提供上一次的播放列表: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    async def handle_playlist(self, request):
+        playlist = self.playlists.get(request.match_info["name"])
+        if playlist is None:
+            if not self.playlists:
+                # 首次刷新尚未完成
+                return web.Response(status=503, text="playlist not ready\n", headers={"Retry-After": "30"})
+            raise web.HTTPNotFound()
+
+        use_gzip = "gzip" in request.headers.get("Accept-Encoding", "").lower()
+        etag = playlist.gzip_etag if use_gzip else playlist.etag
+        headers = {
+            "ETag": etag,
+            "Last-Modified": playlist.last_modified,
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match and (if_none_match.strip() == "*"
+                              or etag in (tag.strip() for tag in if_none_match.split(","))):
+            return web.Response(status=304, headers=headers)
+
+        if use_gzip:
+            headers["Content-Encoding"] = "gzip"
+            body = playlist.gzip_body
+        else:
+            body = playlist.body
+        headers["Content-Type"] = playlist.content_type
+        return web.Response(body=body, headers=headers)
+
+    async def handle_status(self, request):
+        """刷新状态和上一次完成的刷新的运行统计"""
+        return web.json_response({
+            "ready": bool(self.playlists),
+            "refreshing": self.refreshing,
+            "refresh_count": self.refresh_count,
+            "generated_at": self.generated_at,
+            "last_error": self.last_error,
+            "playlists": sorted(self.playlists),
+            "stats": self.last_stats,
+        })
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get("/status", self.handle_status)
+        app.router.add_get("/{name}", self.handle_playlist)
+        return app
+
+    async def run(self):
+        """启动HTTP服务和后台刷新，直到被取消"""
+        runner = web.AppRunner(self.make_app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, self.host, self.port).start()
+        logger.info(f"常驻服务已启动: http://{self.host}:{self.port}/live.m3u，刷新间隔 {self.refresh_interval} 秒")
+        refresher = asyncio.ensure_future(self.refresh_loop())
+        try:
+            await refresher
+        finally:
+            refresher.cancel()
+            await runner.cleanup()
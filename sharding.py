@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from host_guard import HostGuard
+from probe_cache import STATUS_CONNECT_ERROR
+from url_utils import normalize_url
+
+logger = logging.getLogger("IPTV_Processor")
+
+SHARD_VERSION = 1
+WORKLOAD_FILE = "workload.json"
+
+
+def shard_of(url, count):
+    """按主机哈希分片：同一主机的URL总在同一分片，主机熔断和并发控制在分片内完整生效"""
+    return zlib.crc32(HostGuard.host_of(url).encode("utf-8")) % count
+
+
+def split_shards(urls, count):
+    """把URL列表分成 count 个分片，分片内保持原顺序"""
+    shards = [[] for _ in range(count)]
+    for url in urls:
+        shards[shard_of(url, count)].append(url)
+    return shards
+
+
+def shard_path(directory, index, count):
+    return os.path.join(directory, f"shard-{index}-of-{count}.json")
+
+
+def write_json_atomic(path, data):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def write_workload(directory, urls, channels, template_channels):
+    """保存待探测的URL和匹配结果，供各节点探测和最后合并使用"""
+    path = os.path.join(directory, WORKLOAD_FILE)
+    write_json_atomic(path, {
+        "version": SHARD_VERSION,
+        "created_at": int(time.time()),
+        "urls": urls,
+        "channels": channels,
+        "template_channels": template_channels,
+    })
+    return path
+
+
+def load_workload(directory):
+    with open(os.path.join(directory, WORKLOAD_FILE), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != SHARD_VERSION:
+        raise ValueError(f"分片工作集版本不匹配: {data.get('version')}")
+    return data
+
+
+def write_shard_results(directory, index, count, results):
+    """写出一个分片的探测结果 {规范化URL: [响应时间|None, 状态, 吞吐量|None]}"""
+    path = shard_path(directory, index, count)
+    write_json_atomic(path, {"version": SHARD_VERSION, "shard": index, "count": count,
+                             "results": results})
+    return path
+
+
+def load_shard_results(directory):
+    """读取目录下所有分片结果并合并，返回 (结果, 已读取的分片数, 分片总数)"""
+    merged = {}
+    loaded = set()
+    count = None
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith("shard-") and name.endswith(".json")):
+            continue
+        with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != SHARD_VERSION:
+            continue
+        if count is not None and data["count"] != count:
+            logger.warning(f"分片数不一致，忽略 {name}")
+            continue
+        count = data["count"]
+        loaded.add(data["shard"])
+        merged.update(data["results"])
+    return merged, len(loaded), count
+
+
+def to_result(latency, status, throughput):
+    """探测结果的存储形式（inf 存为 None）"""
+    return [None if latency == float('inf') else latency, status, throughput]
+
+
+def from_result(entry):
+    latency, status, throughput = entry
+    return (float('inf') if latency is None else latency), status, throughput
+
+
+async def probe_urls(urls, options):
+    """在当前事件循环中探测一组URL（不读写缓存和健康记录），返回 {规范化URL: 结果}"""
+    # 延迟导入：分片子进程只在这里需要 IPTVProcessor
+    from main import IPTVProcessor
+    from scheduler import ProbeScheduler
+
+    processor = IPTVProcessor(options.get("template_file", "demo.txt"))
+    processor.probe_cache = None
+    processor.health = None
+    processor.incremental_state = None
+    processor.link_check_timeout = options["link_check_timeout"]
+    processor.max_concurrent_checks = options["max_concurrent_checks"]
+    processor.deep_probe_config = options["deep_probe_config"]
+    processor.deep_probe_enabled = options["deep_probe_config"].get("enabled", False)
+    processor.host_guard_config = options["host_guard_config"]
+    processor.ipv6_config = options.get("ipv6_config", {})
+
+    results = {}
+
+    async def probe(url):
+        latency, status, throughput = await processor.probe_raw(url)
+        results[normalize_url(url)] = to_result(latency, status, throughput)
+        return latency, status
+
+    async with processor:
+        scheduler = ProbeScheduler(
+            probe,
+            processor.max_concurrent_checks,
+            key_func=normalize_url,
+            host_guard=HostGuard.from_config(processor.host_guard_config),
+            lane_func=processor.probe_lane,
+            lane_limits=processor.lane_limits(),
+        )
+        await scheduler.run([(None, None, url) for url in urls])
+    # 所在主机已熔断而被短路的URL没有探测结果，按失效写入，合并时不再重新探测
+    for url in urls:
+        results.setdefault(normalize_url(url), to_result(float('inf'), STATUS_CONNECT_ERROR, None))
+    return results
+
+
+def probe_shard(urls, options):
+    """进程池入口：在独立进程和事件循环中探测一个分片"""
+    return asyncio.run(probe_urls(urls, options))
+
+
+async def probe_in_processes(urls, processes, options):
+    """按主机哈希分片，每个分片在独立进程（各自的事件循环）中探测，返回合并后的结果"""
+    shards = [shard for shard in split_shards(urls, processes) if shard]
+    logger.info(f"分片探测: {len(urls)} 个URL，{len(shards)} 个进程，"
+                f"分片大小: {', '.join(str(len(shard)) for shard in shards)}")
+    loop = asyncio.get_running_loop()
+    # spawn：不在子进程中继承父进程的事件循环和连接
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=context) as pool:
+        parts = await asyncio.gather(*(
+            loop.run_in_executor(pool, probe_shard, shard, options) for shard in shards
+        ))
+    merged = {}
+    for part in parts:
+        merged.update(part)
+    return merged
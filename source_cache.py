@@ -0,0 +1,150 @@
+import hashlib
+import json
+import logging
+import os
+import struct
+import time
+
+from channel_store import ChannelStore
+
+logger = logging.getLogger("IPTV_Processor")
+
+INDEX_FILE = "index.json"
+
+
+class SourceCache:
+    """源文件的本地缓存：HTTP 校验信息 + 已解析的频道快照
+
+    index.json 记录每个源的 ETag、Last-Modified、格式和统计；
+    <hash>.chs 是序列化的 ChannelStore（分类、频道名去重，URL 连续存放），
+    回放时整块读入后按原顺序写入 sink，不再逐行解析 JSON。
+    """
+
+    def __init__(self, directory, offline=False):
+        self.directory = directory
+        self.offline = offline
+        self.index = {}
+        self._load_index()
+
+    @classmethod
+    def from_config(cls, cache_config):
+        """根据配置创建缓存，未启用时返回 None"""
+        if not cache_config.get('enabled', False):
+            return None
+        return cls(
+            cache_config.get('dir', os.path.join('output', 'source_cache')),
+            offline=cache_config.get('offline', False),
+        )
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE), "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+        except FileNotFoundError:
+            self.index = {}
+        except (ValueError, OSError) as e:
+            logger.warning(f"源缓存索引读取失败，将重新下载: {e}")
+            self.index = {}
+
+    def _save_index(self):
+        path = os.path.join(self.directory, INDEX_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+
+    def snapshot_path(self, url):
+        """源快照文件路径"""
+        digest = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, f"{digest}.chs")
+
+    def get_meta(self, url):
+        """读取源的缓存信息，快照文件缺失时返回 None"""
+        meta = self.index.get(url)
+        if meta is None or not os.path.exists(self.snapshot_path(url)):
+            return None
+        return meta
+
+    @staticmethod
+    def conditional_headers(meta):
+        """根据缓存信息生成条件请求头"""
+        headers = {}
+        if meta and meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta and meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def replay(self, url, sink):
+        """把快照中的分类和频道按原顺序写入 sink，返回频道数；快照不可用时返回 None"""
+        try:
+            with open(self.snapshot_path(url), "rb") as f:
+                store, _ = ChannelStore.from_bytes(f.read())
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            logger.warning(f"源快照读取失败 {url}: {e}")
+            return None
+        return store.replay(sink)
+
+    def writer(self, url, headers, sink):
+        """创建快照写入器，同时把条目转发给 sink"""
+        os.makedirs(self.directory, exist_ok=True)
+        return SnapshotWriter(self, url, headers, sink)
+
+    def save_store(self, url, headers, store, source_type, total_channels):
+        """直接保存已解析好的 ChannelStore（进程池解析的大源）"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.snapshot_path(url)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(store.to_bytes())
+        os.replace(tmp_path, path)
+        self.commit(url, snapshot_meta(headers, source_type, len(store.categories), total_channels))
+
+    def commit(self, url, meta):
+        """快照写入完成后更新索引"""
+        self.index[url] = meta
+        self._save_index()
+
+
+def snapshot_meta(headers, source_type, categories, total_channels):
+    """索引中记录的源信息"""
+    return {
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "source_type": source_type,
+        "categories": categories,
+        "channels": total_channels,
+        "fetched_at": int(time.time()),
+    }
+
+
+class SnapshotWriter:
+    """边解析边收集快照的 sink 包装，成功后 commit() 一次写出，失败时 abort()"""
+
+    def __init__(self, cache, url, headers, sink):
+        self.cache = cache
+        self.url = url
+        self.sink = sink
+        self.headers = headers
+        self.store = ChannelStore()
+
+    def add_category(self, category):
+        self.store.add_category(category)
+        self.sink.add_category(category)
+
+    def add(self, category, channel_name, channel_url):
+        self.store.add(category, channel_name, channel_url)
+        self.sink.add(category, channel_name, channel_url)
+
+    def discard(self):
+        self.store.discard()
+        self.sink.discard()
+
+    def commit(self, source_type, total_channels):
+        """写入完成，替换旧快照并记录校验信息"""
+        self.cache.save_store(self.url, self.headers, self.store, source_type, total_channels)
+        self.store = None
+
+    def abort(self):
+        """放弃本次写入"""
+        self.store = None
@@ -0,0 +1,117 @@
+import codecs
+import re
+
+# M3U 标准格式：有 group-title
+GROUP_TITLE_PATTERN = re.compile(r'group-title="([^"]*)"\s*,\s*(.+)')
+# 无 group-title 格式：直接提取频道名
+SIMPLE_EXTINF_PATTERN = re.compile(r'#EXTINF:.*?,(.+)')
+
+# 用于判断格式的前几行
+DETECT_LINES = 10
+DEFAULT_CATEGORY = "默认分类"
+
+
+class SourceParser:
+    """M3U/TXT 源的增量解析器
+
+    逐行喂入文本，解析出的分类和频道立即写入 sink
+    （需提供 add_category(分类) 和 add(分类, 频道名, URL)）。
+    前 DETECT_LINES 行用于判断格式，之后不再缓存任何内容。
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.source_type = None
+        self.categories = set()
+        self.total_channels = 0
+        self._pending = []
+        self._line_num = 0
+        self._current_category = DEFAULT_CATEGORY  # 为无分类的频道设置默认分类
+        self._channel_name = None
+
+    def feed(self, line):
+        """喂入一行（不含换行符）"""
+        if self.source_type is None:
+            self._pending.append(line)
+            if len(self._pending) >= DETECT_LINES:
+                self._detect()
+            return
+        self._parse(line)
+
+    def close(self):
+        """输入结束，处理格式判断前缓存的行"""
+        if self.source_type is None:
+            self._detect()
+
+    def _detect(self):
+        is_m3u = any("#EXTINF" in line for line in self._pending)
+        self.source_type = "m3u" if is_m3u else "txt"
+        pending, self._pending = self._pending, []
+        for line in pending:
+            self._parse(line)
+
+    def _add_category(self, category):
+        if category not in self.categories:
+            self.categories.add(category)
+            self.sink.add_category(category)
+
+    def _parse(self, line):
+        line_num = self._line_num
+        self._line_num += 1
+        line = line.strip()
+        if self.source_type == "m3u":
+            self._parse_m3u(line, line_num)
+        else:
+            self._parse_txt(line)
+
+    def _parse_m3u(self, line, line_num):
+        if line.startswith("#EXTINF"):
+            # 尝试多种格式的解析
+            match = GROUP_TITLE_PATTERN.search(line)
+            if match:
+                self._current_category = match.group(1).strip() or "未分类"
+                self._channel_name = match.group(2).strip()
+            else:
+                self._current_category = DEFAULT_CATEGORY
+                match_simple = SIMPLE_EXTINF_PATTERN.search(line)
+                if match_simple:
+                    self._channel_name = match_simple.group(1).strip()
+                else:
+                    # 备用解析方式
+                    self._channel_name = line.split(',')[-1].strip() if ',' in line else f"频道_{line_num}"
+            self._add_category(self._current_category)
+
+        elif line and not line.startswith("#") and self._channel_name:
+            if line.startswith(('http://', 'https://')):
+                self.total_channels += 1
+                self.sink.add(self._current_category, self._channel_name, line)
+                self._channel_name = None  # 重置频道名
+
+    def _parse_txt(self, line):
+        if not line:
+            return
+        if "#genre#" in line:
+            self._current_category = line.split(",")[0].strip()
+            self._add_category(self._current_category)
+        elif self._current_category and ',' in line:
+            channel_name, channel_url = line.split(',', 1)
+            channel_name = channel_name.strip()
+            channel_url = channel_url.strip()
+            if channel_url.startswith(('http://', 'https://')):
+                self._add_category(self._current_category)
+                self.total_channels += 1
+                self.sink.add(self._current_category, channel_name, channel_url)
+
+
+async def iter_lines(response, encoding="utf-8", chunk_size=65536):
+    """按块读取 aiohttp 响应并逐行产出文本，内存占用与单行长度相关"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    remainder = ""
+    async for chunk in response.content.iter_chunked(chunk_size):
+        text = remainder + decoder.decode(chunk)
+        lines = text.split("\n")
+        remainder = lines.pop()
+        for line in lines:
+            yield line
+    remainder += decoder.decode(b"", final=True)
+    yield remainder
@@ -0,0 +1,69 @@
+import re
+
+
+def trie_regex(patterns):
+    """把一组字面量模式编译成按公共前缀合并的正则表达式
+
+    例如 ["ab", "ac", "b"] -> "(?:a(?:b|c)|b)"。只用于判断是否包含任意模式，
+    某个模式是另一个模式的前缀时，较长的模式被较短的覆盖。
+    """
+    trie = {}
+    for pattern in patterns:
+        node = trie
+        for char in pattern:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def emit(node):
+        if "" in node:
+            # 到这里已经匹配完整模式，后续分支不影响结果
+            return ""
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items())]
+        if len(branches) == 1:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")"
+
+    return emit(trie)
+
+
+class PatternMatcher:
+    """一组子串模式的编译匹配器，语义与 any(pattern in url) 完全一致
+
+    所有模式按公共前缀合并成一个字典树正则（见 trie_regex），在 C 层一次扫描
+    完成查找，耗时基本不随模式数量增长。主机形式的模式（IP、域名）同样可能出现
+    在路径或参数中，因此不单独按主机查表，以保持子串语义。
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.regex = re.compile(trie_regex(self.patterns)) if self.patterns else None
+
+    def __bool__(self):
+        return self.regex is not None
+
+    def matches(self, url):
+        """URL 是否包含任意一个模式"""
+        if self.regex is None:
+            return False
+        return self.regex.search(url) is not None
+
+
+class UrlFilter:
+    """链接过滤阶段：黑名单过滤 + 免检判断，模式在创建时编译一次"""
+
+    def __init__(self, blacklist=(), skip_patterns=()):
+        self.blacklist = PatternMatcher(blacklist)
+        self.skip = PatternMatcher(skip_patterns)
+
+    def is_blacklisted(self, url):
+        return self.blacklist.matches(url)
+
+    def should_skip(self, url):
+        return self.skip.matches(url)
+
+    def filter(self, urls):
+        """去掉黑名单中的URL，保持原顺序"""
+        if not self.blacklist:
+            return list(urls)
+        matches = self.blacklist.matches
+        return [url for url in urls if not matches(url)]
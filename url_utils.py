@@ -0,0 +1,50 @@
+from urllib.parse import urlsplit, urlunsplit
+
+# 各协议默认端口
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url):
+    """规范化URL，用作缓存和去重的键
+
+    协议和主机名转小写，去掉默认端口和片段(#...)，空路径补为 "/"，
+    去掉路径末尾多余的 "/"，查询参数按原始文本排序。
+    无法解析的URL原样返回。
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname
+        port = parts.port
+    except ValueError:
+        return url
+    if not host:
+        return url
+
+    scheme = parts.scheme.lower()
+    if ":" in host:
+        host = f"[{host}]"
+    netloc = host
+    if port is not None and DEFAULT_PORTS.get(scheme) != port:
+        netloc = f"{host}:{port}"
+    if parts.username is not None:
+        userinfo = parts.username
+        if parts.password is not None:
+            userinfo += f":{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+
+    path = parts.path.rstrip("/") or "/"
+    query = "&".join(sorted(param for param in parts.query.split("&") if param))
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def dedupe_urls(urls, key_func=normalize_url):
+    """按规范化键去重，保留每个键第一次出现的URL，返回 (去重后的列表, 去掉的数量)"""
+    seen = set()
+    unique = []
+    for url in urls:
+        key = key_func(url)
+        if key not in seen:
+            seen.add(key)
+            unique.append(url)
+    return unique, len(urls) - len(unique)